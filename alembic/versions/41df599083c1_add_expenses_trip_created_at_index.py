@@ -0,0 +1,28 @@
+"""add expenses (trip_id, created_at, id) index
+
+Revision ID: 41df599083c1
+Revises: a029f135cb48
+Create Date: 2026-10-18 19:20:33.512987
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '41df599083c1'
+down_revision: Union[str, None] = 'a029f135cb48'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_expenses_trip_id_created_at_id', 'expenses', ['trip_id', 'created_at', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_expenses_trip_id_created_at_id', table_name='expenses')
@@ -0,0 +1,44 @@
+"""add expense_splits and trip_balances.split_share
+
+Revision ID: 4ddc5cb50223
+Revises: f7e380c8eafd
+Create Date: 2026-10-18 20:41:56.207731
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4ddc5cb50223'
+down_revision: Union[str, None] = 'f7e380c8eafd'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('expense_splits',
+    sa.Column('expense_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('trip_id', sa.Integer(), nullable=False),
+    sa.Column('amount', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['expense_id'], ['expenses.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['trip_id'], ['trips.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('expense_id', 'user_id')
+    )
+    op.create_index('ix_expense_splits_trip_id_user_id', 'expense_splits', ['trip_id', 'user_id'], unique=False)
+    # existing expenses are all split equally, so nothing is itemized yet
+    with op.batch_alter_table('trip_balances', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('split_share', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('trip_balances', schema=None) as batch_op:
+        batch_op.drop_column('split_share')
+    op.drop_index('ix_expense_splits_trip_id_user_id', table_name='expense_splits')
+    op.drop_table('expense_splits')
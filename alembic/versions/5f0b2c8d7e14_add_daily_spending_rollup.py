@@ -0,0 +1,48 @@
+"""add daily_spending rollup
+
+Revision ID: 5f0b2c8d7e14
+Revises: c3a7d91e5f20
+Create Date: 2026-10-18 23:48:41.530972
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5f0b2c8d7e14'
+down_revision: Union[str, None] = 'c3a7d91e5f20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Add the daily_spending table, filled from expenses."""
+    op.create_table('daily_spending',
+    sa.Column('trip_id', sa.Integer(), nullable=False),
+    sa.Column('payer_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('amount', sa.Integer(), nullable=False),
+    sa.Column('expense_count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['payer_id'], ['users.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['trip_id'], ['trips.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('trip_id', 'day', 'payer_id')
+    )
+    op.create_index('ix_daily_spending_payer_id_day', 'daily_spending', ['payer_id', 'day'], unique=False)
+
+    # same as app.services.analytics.backfill
+    op.execute("""
+        INSERT INTO daily_spending (trip_id, payer_id, day, amount, expense_count)
+        SELECT trip_id, payer_id, DATE(created_at), SUM(base_amount), COUNT(*)
+        FROM expenses
+        WHERE payer_id IS NOT NULL
+        GROUP BY trip_id, payer_id, DATE(created_at)
+    """)
+
+
+def downgrade() -> None:
+    """Drop the daily_spending table."""
+    op.drop_index('ix_daily_spending_payer_id_day', table_name='daily_spending')
+    op.drop_table('daily_spending')
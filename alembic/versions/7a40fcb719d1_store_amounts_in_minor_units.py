@@ -0,0 +1,66 @@
+"""store amounts in minor units
+
+Revision ID: 7a40fcb719d1
+Revises: d4176a56c80a
+Create Date: 2026-10-18 18:05:47.203114
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7a40fcb719d1'
+down_revision: Union[str, None] = 'd4176a56c80a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Convert expense amounts to integer cents and recompute the ledger in cents."""
+    op.execute("UPDATE expenses SET amount = CAST(ROUND(amount * 100) AS INTEGER)")
+    with op.batch_alter_table("expenses", schema=None) as batch_op:
+        batch_op.alter_column("amount", existing_type=sa.Float(), type_=sa.Integer(), existing_nullable=False)
+
+    with op.batch_alter_table("trip_balances", schema=None) as batch_op:
+        batch_op.alter_column("paid", existing_type=sa.Float(), type_=sa.Integer(), existing_nullable=False)
+        batch_op.alter_column("share", existing_type=sa.Float(), type_=sa.Integer(), existing_nullable=False)
+        batch_op.alter_column("net", existing_type=sa.Float(), type_=sa.Integer(), existing_nullable=False)
+
+    op.execute("""
+        UPDATE trip_balances SET paid = COALESCE((
+            SELECT SUM(e.amount) FROM expenses e
+            WHERE e.trip_id = trip_balances.trip_id AND e.payer_id = trip_balances.user_id
+        ), 0)
+    """)
+    # equal split, leftover cents go one each to the lowest user ids (same as ledger.split_equally)
+    op.execute("""
+        UPDATE trip_balances SET share = (
+            SELECT t.total / t.members + CASE WHEN t.position <= t.total % t.members THEN 1 ELSE 0 END
+            FROM (
+                SELECT b.user_id,
+                       SUM(b.paid) OVER (PARTITION BY b.trip_id) AS total,
+                       COUNT(*) OVER (PARTITION BY b.trip_id) AS members,
+                       ROW_NUMBER() OVER (PARTITION BY b.trip_id ORDER BY b.user_id) AS position
+                FROM trip_balances b
+                WHERE b.trip_id = trip_balances.trip_id
+            ) t
+            WHERE t.user_id = trip_balances.user_id
+        )
+    """)
+    op.execute("UPDATE trip_balances SET net = paid - share")
+
+
+def downgrade() -> None:
+    """Convert amounts back to floating point currency units."""
+    with op.batch_alter_table("trip_balances", schema=None) as batch_op:
+        batch_op.alter_column("paid", existing_type=sa.Integer(), type_=sa.Float(), existing_nullable=False)
+        batch_op.alter_column("share", existing_type=sa.Integer(), type_=sa.Float(), existing_nullable=False)
+        batch_op.alter_column("net", existing_type=sa.Integer(), type_=sa.Float(), existing_nullable=False)
+    op.execute("UPDATE trip_balances SET paid = paid / 100.0, share = share / 100.0, net = net / 100.0")
+
+    with op.batch_alter_table("expenses", schema=None) as batch_op:
+        batch_op.alter_column("amount", existing_type=sa.Integer(), type_=sa.Float(), existing_nullable=False)
+    op.execute("UPDATE expenses SET amount = amount / 100.0")
@@ -0,0 +1,58 @@
+"""add currencies and exchange rates
+
+Revision ID: 8b1e4f2a9c37
+Revises: d4d8dc966c4d
+Create Date: 2026-10-18 22:10:42.518306
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8b1e4f2a9c37'
+down_revision: Union[str, None] = 'd4d8dc966c4d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Add trip and expense currencies, base amounts and the exchange_rates table.
+
+    Existing trips and expenses are all in one currency, so they become USD and
+    base amounts start out equal to the amounts.
+    """
+    op.create_table('exchange_rates',
+    sa.Column('currency', sa.String(length=3), nullable=False),
+    sa.Column('date', sa.Date(), nullable=False),
+    sa.Column('rate', sa.Numeric(precision=18, scale=8), nullable=False),
+    sa.PrimaryKeyConstraint('currency', 'date')
+    )
+    with op.batch_alter_table('trips', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('currency', sa.String(length=3), server_default='USD', nullable=False))
+    with op.batch_alter_table('expenses', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('currency', sa.String(length=3), server_default='USD', nullable=False))
+        batch_op.add_column(sa.Column('base_amount', sa.Integer(), nullable=True))
+    with op.batch_alter_table('expense_splits', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('base_amount', sa.Integer(), nullable=True))
+
+    op.execute("UPDATE expenses SET base_amount = amount")
+    op.execute("UPDATE expense_splits SET base_amount = amount")
+    with op.batch_alter_table('expenses', schema=None) as batch_op:
+        batch_op.alter_column('base_amount', existing_type=sa.Integer(), nullable=False)
+    with op.batch_alter_table('expense_splits', schema=None) as batch_op:
+        batch_op.alter_column('base_amount', existing_type=sa.Integer(), nullable=False)
+
+
+def downgrade() -> None:
+    """Drop currencies, base amounts and exchange rates."""
+    with op.batch_alter_table('expense_splits', schema=None) as batch_op:
+        batch_op.drop_column('base_amount')
+    with op.batch_alter_table('expenses', schema=None) as batch_op:
+        batch_op.drop_column('base_amount')
+        batch_op.drop_column('currency')
+    with op.batch_alter_table('trips', schema=None) as batch_op:
+        batch_op.drop_column('currency')
+    op.drop_table('exchange_rates')
@@ -0,0 +1,50 @@
+"""fill in missing created_at
+
+Revision ID: 9e6c4b1a2d53
+Revises: 8b1e4f2a9c37
+Create Date: 2026-10-19 10:12:37.409861
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9e6c4b1a2d53'
+down_revision: Union[str, None] = '8b1e4f2a9c37'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Give trips and expenses without created_at one, then make the columns NOT NULL with a server default.
+
+    The initial tables had no server default, so every trip and expense written
+    before it was added has created_at NULL. Such a trip gets the migration
+    time, and such an expense its trip's created_at.
+    """
+    op.execute("UPDATE trips SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL")
+    op.execute("""
+        UPDATE expenses SET created_at = (SELECT t.created_at FROM trips t WHERE t.id = expenses.trip_id)
+        WHERE created_at IS NULL
+    """)
+    op.execute("""
+        UPDATE trips SET last_expense_at = (SELECT MAX(e.created_at) FROM expenses e WHERE e.trip_id = trips.id)
+        WHERE last_expense_at IS NULL
+    """)
+    for table in ("trips", "expenses"):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.alter_column(
+                "created_at", existing_type=sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()
+            )
+
+
+def downgrade() -> None:
+    """Make created_at nullable again, without a server default (the values stay)."""
+    for table in ("expenses", "trips"):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.alter_column(
+                "created_at", existing_type=sa.DateTime(timezone=True), nullable=True, server_default=None
+            )
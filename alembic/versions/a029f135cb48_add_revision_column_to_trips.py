@@ -0,0 +1,27 @@
+"""Add revision column to trips
+
+Revision ID: a029f135cb48
+Revises: 7a40fcb719d1
+Create Date: 2026-10-18 18:42:09.815530
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a029f135cb48'
+down_revision: Union[str, None] = '7a40fcb719d1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    with op.batch_alter_table("trips", schema=None) as batch_op:
+        batch_op.add_column(sa.Column("revision", sa.Integer(), nullable=False, server_default="0"))
+
+def downgrade():
+    with op.batch_alter_table("trips", schema=None) as batch_op:
+        batch_op.drop_column("revision")
@@ -0,0 +1,62 @@
+"""add expense search indexes
+
+Revision ID: c3a7d91e5f20
+Revises: 9e6c4b1a2d53
+Create Date: 2026-10-18 23:05:17.204611
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3a7d91e5f20'
+down_revision: Union[str, None] = '9e6c4b1a2d53'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# same as app.models.EXPENSES_FTS_DDL
+FTS_DDL = [
+    "CREATE VIRTUAL TABLE expenses_fts USING fts5("
+    "title, note, trip, content='', tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER expenses_fts_insert AFTER INSERT ON expenses BEGIN "
+    "INSERT INTO expenses_fts(rowid, title, note, trip) VALUES (new.id, new.title, new.note, 't' || new.trip_id); "
+    "END",
+    "CREATE TRIGGER expenses_fts_delete AFTER DELETE ON expenses BEGIN "
+    "INSERT INTO expenses_fts(expenses_fts, rowid, title, note, trip) "
+    "VALUES ('delete', old.id, old.title, old.note, 't' || old.trip_id); "
+    "END",
+    "CREATE TRIGGER expenses_fts_update AFTER UPDATE OF title, note, trip_id ON expenses BEGIN "
+    "INSERT INTO expenses_fts(expenses_fts, rowid, title, note, trip) "
+    "VALUES ('delete', old.id, old.title, old.note, 't' || old.trip_id); "
+    "INSERT INTO expenses_fts(rowid, title, note, trip) VALUES (new.id, new.title, new.note, 't' || new.trip_id); "
+    "END",
+]
+
+
+def upgrade() -> None:
+    """Add the expense search indexes, and on SQLite the FTS5 table over titles and notes, filled from expenses."""
+    op.create_index(
+        'ix_expenses_trip_id_payer_id_created_at_id', 'expenses', ['trip_id', 'payer_id', 'created_at', 'id'],
+        unique=False
+    )
+    op.create_index('ix_expenses_trip_id_base_amount', 'expenses', ['trip_id', 'base_amount'], unique=False)
+    if op.get_bind().dialect.name == 'sqlite':
+        for statement in FTS_DDL:
+            op.execute(statement)
+        op.execute(
+            "INSERT INTO expenses_fts(rowid, title, note, trip) SELECT id, title, note, 't' || trip_id FROM expenses"
+        )
+
+
+def downgrade() -> None:
+    """Drop the expense search indexes and the FTS5 table."""
+    if op.get_bind().dialect.name == 'sqlite':
+        for trigger in ('expenses_fts_insert', 'expenses_fts_delete', 'expenses_fts_update'):
+            op.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        op.execute("DROP TABLE IF EXISTS expenses_fts")
+    op.drop_index('ix_expenses_trip_id_base_amount', table_name='expenses')
+    op.drop_index('ix_expenses_trip_id_payer_id_created_at_id', table_name='expenses')
@@ -0,0 +1,53 @@
+"""add trip_balances table
+
+Revision ID: d4176a56c80a
+Revises: 1d510252c84a
+Create Date: 2026-10-18 17:30:12.418203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd4176a56c80a'
+down_revision: Union[str, None] = '1d510252c84a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('trip_balances',
+    sa.Column('trip_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('paid', sa.Float(), nullable=False),
+    sa.Column('share', sa.Float(), nullable=False),
+    sa.Column('net', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['trip_id'], ['trips.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('trip_id', 'user_id')
+    )
+
+    # fill the ledger from existing members and expenses
+    op.execute("""
+        INSERT INTO trip_balances (trip_id, user_id, paid, share, net)
+        SELECT tm.trip_id, tm.user_id,
+               COALESCE((SELECT SUM(e.amount) FROM expenses e
+                         WHERE e.trip_id = tm.trip_id AND e.payer_id = tm.user_id), 0),
+               0, 0
+        FROM trip_members tm
+    """)
+    op.execute("""
+        UPDATE trip_balances SET share = (
+            SELECT SUM(b.paid) / COUNT(*) FROM trip_balances b WHERE b.trip_id = trip_balances.trip_id
+        )
+    """)
+    op.execute("UPDATE trip_balances SET net = paid - share")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('trip_balances')
@@ -0,0 +1,45 @@
+"""add trip expense totals and membership indexes
+
+Revision ID: d4d8dc966c4d
+Revises: 4ddc5cb50223
+Create Date: 2026-10-18 21:24:08.935127
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd4d8dc966c4d'
+down_revision: Union[str, None] = '4ddc5cb50223'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Add total_amount, expense_count and last_expense_at to trips and fill them from expenses."""
+    with op.batch_alter_table('trips', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('total_amount', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('expense_count', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('last_expense_at', sa.DateTime(timezone=True), nullable=True))
+        batch_op.create_index('ix_trips_creator_id', ['creator_id'], unique=False)
+    op.create_index('ix_trip_members_user_id_trip_id', 'trip_members', ['user_id', 'trip_id'], unique=False)
+
+    op.execute("""
+        UPDATE trips SET
+            total_amount = COALESCE((SELECT SUM(e.amount) FROM expenses e WHERE e.trip_id = trips.id), 0),
+            expense_count = (SELECT COUNT(*) FROM expenses e WHERE e.trip_id = trips.id),
+            last_expense_at = (SELECT MAX(e.created_at) FROM expenses e WHERE e.trip_id = trips.id)
+    """)
+
+
+def downgrade() -> None:
+    """Drop the trip expense totals."""
+    op.drop_index('ix_trip_members_user_id_trip_id', table_name='trip_members')
+    with op.batch_alter_table('trips', schema=None) as batch_op:
+        batch_op.drop_index('ix_trips_creator_id')
+        batch_op.drop_column('last_expense_at')
+        batch_op.drop_column('expense_count')
+        batch_op.drop_column('total_amount')
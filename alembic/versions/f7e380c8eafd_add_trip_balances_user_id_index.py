@@ -0,0 +1,28 @@
+"""add trip_balances (user_id, trip_id) index
+
+Revision ID: f7e380c8eafd
+Revises: 41df599083c1
+Create Date: 2026-10-18 20:02:11.418305
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f7e380c8eafd'
+down_revision: Union[str, None] = '41df599083c1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_trip_balances_user_id_trip_id', 'trip_balances', ['user_id', 'trip_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_trip_balances_user_id_trip_id', table_name='trip_balances')
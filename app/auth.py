@@ -1,31 +1,41 @@
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from typing import Optional
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
-from app.database import SessionLocal
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached
+from app.database import AsyncSessionLocal, get_db, get_read_db
 from app.models import User
-from app.crud import get_user_by_email
+from app.crud import get_user_by_email, get_trip_membership
 from app.config import settings
+from app.services.cache import LRUCache
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/users/login")
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# token -> detached copy of the user it belongs to
+user_cache = LRUCache("auth", maxsize=settings.auth_cache_size, ttl=settings.auth_cache_ttl_seconds)
 
-# DB dependecy
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+def _cacheable_copy(user: User) -> User:
+    """Detached copy of the user that is never attached to a session itself."""
+    copy = User(id=user.id, name=user.name, email=user.email, hashed_password=user.hashed_password)
+    make_transient_to_detached(copy)
+    return copy
+
+def invalidate_user(user_id: int):
+    """Forget cached tokens of a user, call this whenever the user row changes."""
+    user_cache.discard_where(lambda user: user.id == user_id)
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> User :
+async def _authenticate(token: str, db: AsyncSession) -> User:
     credential_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials")
+
+    cached = user_cache.get(token)
+    if cached is not None:
+        # attach a copy to this session without going to the database
+        return await db.merge(cached, load=False)
+
     try:
         payload = decode_token(token)
         email = payload.get("sub")
@@ -34,14 +44,71 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     except JWTError:
         raise credential_exception
     
-    user = get_user_by_email(db, email=email)
-    if user is None:
+    # tokens issued before the uid claim existed are looked up by email
+    user_id = payload.get("uid")
+    if user_id is not None:
+        user = await db.get(User, user_id)
+    else:
+        user = await get_user_by_email(db, email=email)
+    if user is None or user.email != email:
         raise credential_exception
+
+    # never keep a token in the cache past its own expiry
+    seconds_left = payload["exp"] - datetime.now(timezone.utc).timestamp()
+    if seconds_left > 0:
+        user_cache.set(token, _cacheable_copy(user), ttl=min(seconds_left, settings.auth_cache_ttl_seconds))
     return user
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)) -> User :
+    return await _authenticate(token, db)
+
+async def get_current_user_read(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_read_db)) -> User:
+    """get_current_user for read-only routes, the user is looked up on the read replica."""
+    return await _authenticate(token, db)
         
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+async def _check_trip_member(db: AsyncSession, trip_id: int, user: User) -> User:
+    membership = await get_trip_membership(db, trip_id, user.id)
+    if membership is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Trip not found")
+    if not membership.is_member:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="You are not member of this trip")
+    return user
+
+async def require_trip_member(
+    trip_id: int,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+) -> User:
+    """Dependency for trip routes: 404 if the trip doesn't exist, 403 if the user isn't a member."""
+    return await _check_trip_member(db, trip_id, current_user)
+
+async def require_trip_member_read(
+    trip_id: int,
+    db: AsyncSession = Depends(get_read_db),
+    current_user: User = Depends(get_current_user_read)
+) -> User:
+    """require_trip_member for read-only routes, on the same read session as the route, so one connection."""
+    return await _check_trip_member(db, trip_id, current_user)
+
+async def authenticate_trip_member(token: Optional[str], trip_id: int) -> Optional[User]:
+    """require_trip_member for WebSockets: the user, or None if the token is bad or the user isn't a member.
+
+    Uses its own short session, nothing stays open for the lifetime of the socket.
+    """
+    if not token:
+        return None
+    async with AsyncSessionLocal() as db:
+        try:
+            user = await _authenticate(token, db)
+        except HTTPException:
+            return None
+        membership = await get_trip_membership(db, trip_id, user.id)
+    return user if membership is not None and membership.is_member else None
+
+def token_expiry(token: str) -> float:
+    """Expiry of an already validated token, as a UNIX timestamp."""
+    return decode_token(token)["exp"]
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -0,0 +1,37 @@
+"""Conditional GETs for trip reads.
+
+Every change to a trip bumps trips.revision (app.services.ledger.touch_trip),
+so the revision, the path and the query string identify a response exactly.
+Routes look the revision up with a single primary key read, and when the
+client's If-None-Match already names that response they answer 304 without
+loading any expenses or balances.
+"""
+import hashlib
+from typing import Optional
+
+from fastapi import Request, Response, status
+
+from app.config import settings
+
+
+def trip_etag(request: Request, trip_id: int, revision: int) -> str:
+    """Strong ETag of a trip read: its revision plus a hash of the path and query string."""
+    variant = hashlib.blake2b(f"{request.url.path}?{request.url.query}".encode(), digest_size=6).hexdigest()
+    return f'"trip-{trip_id}-{revision}-{variant}"'
+
+
+def cache_headers(etag: str) -> dict:
+    # the bodies depend on who may read the trip, so shared caches key on the credentials too
+    return {"ETag": etag, "Cache-Control": settings.trip_cache_control, "Vary": "Authorization"}
+
+
+def not_modified(request: Request, etag: str) -> Optional[Response]:
+    """A 304 when If-None-Match names etag (or is "*"), else None."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return None
+    # If-None-Match uses the weak comparison, a W/ prefix doesn't matter
+    tags = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    if etag in tags or "*" in tags:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=cache_headers(etag))
+    return None
@@ -1,4 +1,5 @@
 # config.py
+from typing import Optional
 from pydantic_settings import BaseSettings
 from dotenv import load_dotenv
 
@@ -8,6 +9,56 @@ class Settings(BaseSettings):
     secret_key: str
     algorithm: str
     database_url: str
+    # async driver URL for the API; derived from database_url when not set
+    async_database_url: Optional[str] = None
+    # bcrypt work factor; stored hashes with other rounds are rehashed on the next login
+    bcrypt_rounds: int = 12
+    # processes used for password hashing (default: one per CPU)
+    password_hash_workers: Optional[int] = None
+    # hashing calls allowed to wait for a free worker before returning 429
+    password_hash_queue_limit: int = 64
+    # authenticated users cached by token, so most requests skip the user lookup
+    auth_cache_size: int = 10000
+    auth_cache_ttl_seconds: int = 300
+    # number of computed settlements kept in memory
+    settlement_cache_size: int = 1024
+    # connection pool, for both engines; pre_ping and recycle only apply to server databases
+    db_pool_size: int = 20
+    db_max_overflow: int = 20
+    db_pool_timeout_seconds: int = 30
+    db_pool_pre_ping: bool = True
+    db_pool_recycle_seconds: int = 1800
+    # read replica for GET routes, same URL format as database_url; unset sends everything to the primary
+    replica_database_url: Optional[str] = None
+    # after a client's own write its reads stay on the primary this long, so it sees the change
+    replica_sticky_seconds: float = 5
+    # SQLite pragmas set on every new connection
+    sqlite_journal_mode: str = "WAL"
+    sqlite_synchronous: str = "NORMAL"
+    sqlite_busy_timeout_ms: int = 5000
+    sqlite_mmap_size: int = 256 * 1024 * 1024
+    # negative means KiB, so -65536 is a 64 MiB page cache per connection
+    sqlite_cache_size: int = -65536
+    # dev only: requests with an X-Profile header get a cProfile report instead of their response
+    profiling_enabled: bool = False
+    profile_top_functions: int = 40
+    # rows accepted by one POST /trips/{trip_id}/expenses/bulk request
+    bulk_import_max_rows: int = 50000
+    # currency of new trips, and of expenses that don't name one
+    default_currency: str = "USD"
+    # exchange_rates hold units of each currency per one unit of this one (ECB snapshots are EUR based)
+    exchange_rate_reference: str = "EUR"
+    # (currency, day) -> rate lookups kept in memory; the ttl picks up newly loaded snapshots
+    exchange_rate_cache_size: int = 100000
+    exchange_rate_cache_ttl_seconds: int = 3600
+    # trip change feeds: events a subscriber may fall behind before it gets "resync" instead
+    event_queue_size: int = 100
+    # idle feeds get a keepalive this often, and clients are told to reconnect after event_retry_ms
+    event_keepalive_seconds: float = 15
+    event_retry_ms: int = 3000
+    # Cache-Control of ETagged trip reads (summary, settlement, expense list); the default makes
+    # clients revalidate every time, "private, max-age=5" lets them reuse a response for 5s first
+    trip_cache_control: str = "private, no-cache"
 
     class Config:
         env_file = ".env"
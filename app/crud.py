@@ -1,39 +1,174 @@
-from sqlalchemy.orm import Session
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import and_, delete, exists, insert, literal, or_, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 from app import models, schemas
-from passlib.context import CryptContext
+from app.config import settings
+from app.pagination import decode_cursor, encode_cursor
+from app.services import ledger
+from app.passwords import hash_password
 
-pwd_context = CryptContext(schemes=['bcrypt'], deprecated="auto")
+async def get_user_by_email(db: AsyncSession, email:str):
+    result = await db.execute(select(models.User).filter(models.User.email == email))
+    return result.scalars().first()
 
-def get_user_by_email(db: Session, email:str):
-    return db.query(models.User).filter(models.User.email == email).first()
-
-def create_user(db:Session, user: schemas.UserCreate):
-    hashed_password = pwd_context.hash(user.password)
+async def create_user(db: AsyncSession, user: schemas.UserCreate):
+    hashed_password = await hash_password(user.password)
     db_user = models.User(
         name=user.name, email=user.email, hashed_password=hashed_password
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     return db_user
 
-def create_trip(db: Session, trip: schemas.TripCreate, user_id: int):
-    db_trip = models.Trip(name=trip.name, creator_id=user_id)
+async def create_trip(db: AsyncSession, trip: schemas.TripCreate, user_id: int):
+    db_trip = models.Trip(name=trip.name, creator_id=user_id, currency=trip.currency or settings.default_currency)
     db.add(db_trip)
-    db.commit()
-    db.refresh(db_trip)
+    await db.commit()
+    await db.refresh(db_trip)
     return db_trip
 
-def add_member_to_trip(db: Session, trip_id: int, user_id: int):
-    trip = db.query(models.Trip).filter(models.Trip.id == trip_id).first()
-    user = db.query(models.User).filter(models.User.id == user_id).first()
+# newest activity first; trips without expenses go last
+TRIP_ORDER = {
+    schemas.TripSort.activity: (models.Trip.last_expense_at.desc().nulls_last(), models.Trip.id.desc()),
+    schemas.TripSort.created: (models.Trip.created_at.desc(), models.Trip.id.desc()),
+    schemas.TripSort.name: (models.Trip.name, models.Trip.id),
+}
+# the columns each order sorts on, a page cursor holds them for the last trip of the page
+TRIP_SORT_KEYS = {
+    schemas.TripSort.activity: ("last_expense_at", "id"),
+    schemas.TripSort.created: ("created_at", "id"),
+    schemas.TripSort.name: ("name", "id"),
+}
+# everything TripListItem shows apart from members
+TRIP_LIST_COLUMNS = (
+    models.Trip.id, models.Trip.name, models.Trip.creator_id, models.Trip.currency, models.Trip.created_at,
+    models.Trip.total_amount, models.Trip.expense_count, models.Trip.last_expense_at,
+)
+TRIP_LIST_FIELDS = [column.key for column in TRIP_LIST_COLUMNS]
+
+def _trips_after(sort: schemas.TripSort, cursor: str):
+    """Filter for the trips that come after the cursor in the given order."""
+    if sort == schemas.TripSort.name:
+        first, trip_id = decode_cursor(cursor, str, int)
+        return tuple_(models.Trip.name, models.Trip.id) > tuple_(literal(first), literal(trip_id))
+    first, trip_id = decode_cursor(cursor, datetime, int)
+    column = models.Trip.created_at if sort == schemas.TripSort.created else models.Trip.last_expense_at
+    if first is None:
+        # already among the trips without expenses, which come last
+        return and_(column.is_(None), models.Trip.id < trip_id)
+    return or_(
+        tuple_(column, models.Trip.id) < tuple_(literal(first, column.type), literal(trip_id)),
+        column.is_(None)
+    )
+
+async def list_user_trips(
+    db: AsyncSession,
+    user_id: int,
+    sort: schemas.TripSort = schemas.TripSort.activity,
+    cursor: str = None,
+    limit: int = 100,
+    embed_members: bool = False
+):
+    """A page of the trips a user created or joined, and the cursor of the next page (None on the last one).
+
+    Totals come from the trip rows, expenses are never read. Without embed_members
+    the rows are plain columns; with it members are loaded for the whole page in one
+    extra query (selectinload), never per trip.
+    """
+    trip_ids = select(models.trip_members.c.trip_id).filter(
+        models.trip_members.c.user_id == user_id
+    ).union(select(models.Trip.id).filter(models.Trip.creator_id == user_id))
+    if embed_members:
+        query = select(models.Trip).options(selectinload(models.Trip.members))
+    else:
+        query = select(*TRIP_LIST_COLUMNS)
+    query = query.filter(models.Trip.id.in_(trip_ids)).order_by(*TRIP_ORDER[sort])
+    if cursor:
+        query = query.filter(_trips_after(sort, cursor))
+
+    result = await db.execute(query.limit(limit + 1))
+    trips = result.scalars().all() if embed_members else result.all()
+    # one extra row tells us whether there is a next page
+    if len(trips) <= limit:
+        return trips, None
+    trips = trips[:limit]
+    return trips, encode_cursor(*(getattr(trips[-1], name) for name in TRIP_SORT_KEYS[sort]))
+
+async def get_trip_membership(db: AsyncSession, trip_id: int, user_id: int):
+    """One indexed lookup: None if the trip doesn't exist, else a row with creator_id and is_member."""
+    is_member = exists().where(
+        models.trip_members.c.trip_id == models.Trip.id,
+        models.trip_members.c.user_id == user_id
+    )
+    result = await db.execute(
+        select(models.Trip.creator_id, is_member.label("is_member")).filter(models.Trip.id == trip_id)
+    )
+    return result.first()
+
+async def get_trip_revision(db: AsyncSession, trip_id: int):
+    """The trip's revision by primary key, None if the trip doesn't exist."""
+    result = await db.execute(select(models.Trip.revision).filter(models.Trip.id == trip_id))
+    return result.scalar()
+
+async def is_trip_member(db: AsyncSession, trip_id: int, user_id: int) -> bool:
+    result = await db.execute(select(exists().where(
+        models.trip_members.c.trip_id == trip_id,
+        models.trip_members.c.user_id == user_id
+    )))
+    return result.scalar()
+
+async def get_trip_member_ids(db: AsyncSession, trip_id: int, user_ids: list[int]) -> set[int]:
+    """Which of the given users are members of the trip."""
+    result = await db.execute(select(models.trip_members.c.user_id).filter(
+        models.trip_members.c.trip_id == trip_id,
+        models.trip_members.c.user_id.in_(user_ids)
+    ))
+    return set(result.scalars().all())
+
+async def insert_trip_member(db: AsyncSession, trip_id: int, user_id: int):
+    # write the association row directly instead of loading trip.members to append to it
+    await db.execute(insert(models.trip_members).values(trip_id=trip_id, user_id=user_id))
+    await db.run_sync(ledger.add_member, trip_id, user_id)
+
+async def delete_trip_member(db: AsyncSession, trip_id: int, user_id: int):
+    await db.execute(delete(models.trip_members).filter(
+        models.trip_members.c.trip_id == trip_id,
+        models.trip_members.c.user_id == user_id
+    ))
+    await db.run_sync(ledger.remove_member, trip_id, user_id)
+
+async def add_member_to_trip(db: AsyncSession, trip_id: int, user_id: int) -> Optional[bool]:
+    """None if the trip or user doesn't exist, else whether the user was added (False: already a member)."""
+    trip = await db.get(models.Trip, trip_id)
+    user = await db.get(models.User, user_id)
     
     if not trip or not user:
         return None
     
-    trip.members.append(user)
-    db.commit()
-    db.refresh(trip)
-    return trip
+    if await is_trip_member(db, trip_id, user_id):
+        return False
+    await insert_trip_member(db, trip_id, user_id)
+    await db.commit()
+    return True
 
+async def get_expense_splits(db: AsyncSession, expense_id: int) -> dict[int, int]:
+    """{user_id: cents} of an itemized expense, empty when it is shared equally."""
+    result = await db.execute(select(models.ExpenseSplit.user_id, models.ExpenseSplit.amount).filter(
+        models.ExpenseSplit.expense_id == expense_id
+    ))
+    return dict(result.all())
 
+async def replace_expense_splits(
+    db: AsyncSession, expense: models.Expense, splits: dict[int, int], base_splits: dict[int, int]
+):
+    """Store a split, in the expense currency (splits) and in the trip currency (base_splits)."""
+    await db.execute(delete(models.ExpenseSplit).filter(models.ExpenseSplit.expense_id == expense.id))
+    if splits:
+        await db.execute(insert(models.ExpenseSplit), [
+            {"expense_id": expense.id, "user_id": uid, "trip_id": expense.trip_id,
+             "amount": amount, "base_amount": base_splits[uid]}
+            for uid, amount in splits.items()
+        ])
@@ -1,23 +1,122 @@
+from fastapi import Request
 from sqlalchemy import create_engine, event
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
 from app.config import settings
+from app.services.cache import LRUCache
+
+
+def to_async_url(url: str) -> str:
+    """Swap the sync driver in a database URL for its asyncio counterpart."""
+    if url.startswith("sqlite://"):
+        return "sqlite+aiosqlite://" + url[len("sqlite://"):]
+    if url.startswith("postgresql://") or url.startswith("postgres://"):
+        return "postgresql+asyncpg://" + url.split("://", 1)[1]
+    return url
+
+
+def is_sqlite(url: str) -> bool:
+    return url.startswith("sqlite")
+
+
+def engine_options(url: str) -> dict:
+    """create_engine keyword arguments for a database URL, from Settings."""
+    if is_sqlite(url):
+        options = {"connect_args": {"check_same_thread": False}}
+        # in-memory databases live in a single connection, there is no pool to size
+        if ":memory:" in url or url.endswith("://"):
+            return options
+    else:
+        # server connections can be dropped behind our back (restarts, idle timeouts)
+        options = {"pool_pre_ping": settings.db_pool_pre_ping, "pool_recycle": settings.db_pool_recycle_seconds}
+    options.update(
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_timeout=settings.db_pool_timeout_seconds,
+    )
+    return options
 
-engine = create_engine(settings.database_url, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(bind=engine, autoflush=False)
-Base = declarative_base()
 
-# Dependency to get DB
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-        
-@event.listens_for(engine, "connect")
 def set_sqlite_pragma(dbapi_connection, connection_record):
+    # WAL lets readers carry on while one connection writes, and busy_timeout makes a
+    # second writer wait for the lock instead of failing with "database is locked"
     cursor = dbapi_connection.cursor()
     cursor.execute("PRAGMA foreign_keys=ON;")
+    cursor.execute(f"PRAGMA journal_mode={settings.sqlite_journal_mode};")
+    cursor.execute(f"PRAGMA synchronous={settings.sqlite_synchronous};")
+    cursor.execute(f"PRAGMA busy_timeout={int(settings.sqlite_busy_timeout_ms)};")
+    cursor.execute(f"PRAGMA mmap_size={int(settings.sqlite_mmap_size)};")
+    cursor.execute(f"PRAGMA cache_size={int(settings.sqlite_cache_size)};")
     cursor.close()
-    
\ No newline at end of file
+
+
+def make_engine(url: str, is_async: bool = False):
+    """Create a sync or async engine with the pool and SQLite tuning from Settings."""
+    if is_async:
+        new_engine = create_async_engine(url, **engine_options(url))
+        sync_engine = new_engine.sync_engine
+    else:
+        new_engine = sync_engine = create_engine(url, **engine_options(url))
+    if is_sqlite(url):
+        event.listen(sync_engine, "connect", set_sqlite_pragma)
+    return new_engine
+
+
+def dialect_insert(db: Session, table):
+    """INSERT for the session's database, with on_conflict_do_nothing / on_conflict_do_update (SQLite, PostgreSQL)."""
+    if db.get_bind().dialect.name == "postgresql":
+        return postgresql.insert(table)
+    return sqlite.insert(table)
+
+
+# sync engine, used by alembic, create_all and command line tools
+engine = make_engine(settings.database_url)
+SessionLocal = sessionmaker(bind=engine, autoflush=False)
+Base = declarative_base()
+
+# async engine, used by the API so requests don't hold a worker thread while waiting on the DB
+async_engine = make_engine(settings.async_database_url or to_async_url(settings.database_url), is_async=True)
+# expire_on_commit=False so returned objects can still be serialized after commit
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+# optional read replica, only used by read-only routes through get_read_db
+replica_engine = None
+ReplicaSessionLocal = None
+if settings.replica_database_url:
+    replica_engine = make_engine(to_async_url(settings.replica_database_url), is_async=True)
+    ReplicaSessionLocal = async_sessionmaker(bind=replica_engine, autoflush=False, expire_on_commit=False)
+
+# clients (by Authorization header) that committed a write within replica_sticky_seconds
+recent_writers = LRUCache("replica_sticky", maxsize=100_000, ttl=settings.replica_sticky_seconds)
+
+
+@event.listens_for(Session, "after_commit")
+def _remember_commit(session):
+    session.info["committed"] = True
+
+
+def read_sessionmaker(request: Request) -> async_sessionmaker:
+    """The replica, unless there is none or this client wrote recently (read-your-writes)."""
+    if ReplicaSessionLocal is None:
+        return AsyncSessionLocal
+    client = request.headers.get("authorization")
+    if client and recent_writers.get(client):
+        return AsyncSessionLocal
+    return ReplicaSessionLocal
+
+
+# Dependency to get DB, shared by every router
+async def get_db(request: Request):
+    async with AsyncSessionLocal() as db:
+        yield db
+        # runs before the response is sent, so the client's next read already sticks to the primary
+        client = request.headers.get("authorization")
+        if ReplicaSessionLocal is not None and client and db.sync_session.info.get("committed"):
+            recent_writers.set(client, True)
+
+# Dependency for read-only routes
+async def get_read_db(request: Request):
+    async with read_sessionmaker(request)() as db:
+        yield db
@@ -1,13 +1,26 @@
 from fastapi import FastAPI
-from app.routers import users, trips, expenses
-from app.database import engine, Base
+from app.routers import users, trips, expenses, stats
+from app.database import async_engine, engine, replica_engine, Base
+from app.metrics import MetricsMiddleware, instrument_engine
+from app.passwords import shutdown_pool
+from app.responses import ORJSONResponse
 
 # create db tables
 Base.metadata.create_all(bind=engine)
 
-app = FastAPI()
+# orjson for every response; hot read endpoints also skip pydantic, see app.responses
+app = FastAPI(default_response_class=ORJSONResponse)
+app.add_event_handler("shutdown", shutdown_pool)
+
+# latency, query count and SQL time per route, served at /metrics
+for instrumented in (engine, async_engine, replica_engine):
+    if instrumented is not None:
+        instrument_engine(instrumented)
+app.add_middleware(MetricsMiddleware)
 
 # Register routes
 app.include_router(users.router)
 app.include_router(trips.router)
-app.include_router(expenses.router)
\ No newline at end of file
+app.include_router(expenses.router)
+app.include_router(stats.router)
+app.include_router(stats.metrics_router)
@@ -0,0 +1,212 @@
+"""Per-route latency and SQL instrumentation, exported in Prometheus text format.
+
+MetricsMiddleware times every request and, through cursor events on the
+engines, counts the queries it ran and the time spent in them. GET /metrics
+renders the totals. With profiling_enabled set, a request carrying an
+X-Profile header gets a cProfile breakdown back instead of its normal body.
+"""
+import contextvars
+import cProfile
+import io
+import pstats
+import threading
+import time
+from collections import defaultdict
+
+from sqlalchemy import event
+
+from app.config import settings
+from app.services.cache import caches
+from app.services.events import bus
+
+# seconds; Prometheus client defaults
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# query count and SQL time of the request being handled in this task
+_request_stats = contextvars.ContextVar("request_stats", default=None)
+
+
+class RequestStats:
+    __slots__ = ("queries", "db_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets: tuple):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        # labels -> [count per bucket..., +Inf count], sum
+        self.counts = defaultdict(lambda: [0] * (len(buckets) + 1))
+        self.sums = defaultdict(float)
+
+    def observe(self, labels: tuple, value: float):
+        counts = self.counts[labels]
+        for position, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[position] += 1
+        counts[-1] += 1
+        self.sums[labels] += value
+
+    def render(self, label_names: tuple):
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} histogram"
+        for labels, counts in sorted(self.counts.items()):
+            base = _labels(label_names, labels)
+            for bound, count in zip(self.buckets, counts):
+                yield f'{self.name}_bucket{{{base},le="{bound}"}} {count}'
+            yield f'{self.name}_bucket{{{base},le="+Inf"}} {counts[-1]}'
+            yield f"{self.name}_sum{{{base}}} {self.sums[labels]}"
+            yield f"{self.name}_count{{{base}}} {counts[-1]}"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: tuple, values: tuple) -> str:
+    return ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+
+
+_lock = threading.Lock()
+ROUTE_LABELS = ("method", "route")
+request_latency = Histogram("http_request_duration_seconds", "Request latency by route.", LATENCY_BUCKETS)
+request_queries = Histogram("http_request_db_queries", "SQL statements run per request.", QUERY_COUNT_BUCKETS)
+request_db_time = Histogram("http_request_db_seconds", "Time spent in SQL per request.", LATENCY_BUCKETS)
+# (method, route, status) -> requests
+request_totals = defaultdict(int)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += elapsed
+
+
+def _handle_error(exception_context):
+    # the statement failed, so after_cursor_execute won't pop its start time
+    connection = exception_context.connection
+    if connection is not None and connection.info.get("query_start"):
+        connection.info["query_start"].pop()
+
+
+def instrument_engine(engine):
+    """Count queries and SQL time of a sync or async engine towards the current request."""
+    engine = getattr(engine, "sync_engine", engine)
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+
+def record(method: str, route: str, status: int, seconds: float, stats: RequestStats):
+    labels = (method, route)
+    with _lock:
+        request_latency.observe(labels, seconds)
+        request_queries.observe(labels, stats.queries)
+        request_db_time.observe(labels, stats.db_seconds)
+        request_totals[(method, route, status)] += 1
+
+
+def render() -> str:
+    """All metrics in Prometheus text exposition format."""
+    lines = ["# HELP http_requests_total Requests by route and status.", "# TYPE http_requests_total counter"]
+    with _lock:
+        for labels, count in sorted(request_totals.items()):
+            lines.append(f"http_requests_total{{{_labels(ROUTE_LABELS + ('status',), labels)}}} {count}")
+        for histogram in (request_latency, request_queries, request_db_time):
+            lines.extend(histogram.render(ROUTE_LABELS))
+
+    cache_stats = {name: cache.stats() for name, cache in caches.items()}
+    for metric, key, kind in (("cache_hits_total", "hits", "counter"), ("cache_misses_total", "misses", "counter"),
+                              ("cache_entries", "size", "gauge")):
+        lines.append(f"# TYPE {metric} {kind}")
+        lines.extend(f'{metric}{{cache="{name}"}} {stats[key]}' for name, stats in sorted(cache_stats.items()))
+    lines.append("# HELP trip_event_subscribers Open SSE and WebSocket trip feeds.")
+    lines.append("# TYPE trip_event_subscribers gauge")
+    lines.append(f"trip_event_subscribers {bus.subscriber_count()}")
+    return "\n".join(lines) + "\n"
+
+
+def _route_label(scope) -> str:
+    # the route template, not the raw path, so /trips/1 and /trips/2 share one series
+    route = scope.get("route")
+    return getattr(route, "path", "unmatched")
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency, status, query count and SQL time per route."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            if settings.profiling_enabled and _wants_profile(scope):
+                await self._profile(scope, receive, send, stats)
+                status_code = 200
+            else:
+                await self.app(scope, receive, send_with_status)
+        finally:
+            record(scope["method"], _route_label(scope), status_code, time.perf_counter() - start, stats)
+            _request_stats.reset(token)
+
+    async def _profile(self, scope, receive, send, stats: RequestStats):
+        """Run the request under cProfile and answer with the profile instead of the response body."""
+        original_status = 500
+
+        async def capture(message):
+            nonlocal original_status
+            if message["type"] == "http.response.start":
+                original_status = message["status"]
+
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        # the profiler sees every coroutine on the event loop while it runs, use it on a quiet dev server
+        profiler.enable()
+        try:
+            await self.app(scope, receive, capture)
+        finally:
+            profiler.disable()
+        elapsed = time.perf_counter() - start
+
+        output = io.StringIO()
+        output.write(
+            f"{scope['method']} {scope['path']} -> {original_status} in {elapsed * 1000:.1f}ms, "
+            f"{stats.queries} queries, {stats.db_seconds * 1000:.1f}ms in SQL\n\n"
+        )
+        pstats.Stats(profiler, stream=output).sort_stats("cumulative").print_stats(settings.profile_top_functions)
+        body = output.getvalue().encode()
+        await send({"type": "http.response.start", "status": 200, "headers": [
+            (b"content-type", b"text/plain; charset=utf-8"),
+            (b"content-length", str(len(body)).encode()),
+            (b"x-profile-status", str(original_status).encode()),
+        ]})
+        await send({"type": "http.response.body", "body": body})
+
+
+def _wants_profile(scope) -> bool:
+    return any(name == b"x-profile" and value not in (b"", b"0") for name, value in scope["headers"])
@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Table, DateTime, Float
+from sqlalchemy import DDL, Column, Date, Integer, Numeric, String, ForeignKey, Table, DateTime, Index, PrimaryKeyConstraint, event
+from sqlalchemy.dialects import sqlite
 from .database import Base
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -8,7 +9,16 @@ trip_members = Table(
     "trip_members",
     Base.metadata,
     Column("trip_id",Integer, ForeignKey("trips.id", ondelete="CASCADE"), primary_key=True),
-    Column("user_id", Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    Column("user_id", Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True),
+    # the primary key starts with trip_id; this one finds a user's trips
+    Index("ix_trip_members_user_id_trip_id", "user_id", "trip_id")
+)
+
+
+# SQLite stores datetimes as text. CURRENT_TIMESTAMP writes them without microseconds,
+# so bound values must use the same format or range comparisons on the text break.
+SQLiteSeconds = sqlite.DATETIME(
+    storage_format="%(year)04d-%(month)02d-%(day)02d %(hour)02d:%(minute)02d:%(second)02d"
 )
 
 
@@ -28,13 +38,25 @@ class Trip(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, nullable=False)
-    creator_id = Column(Integer, ForeignKey("users.id"))
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    creator_id = Column(Integer, ForeignKey("users.id"), index=True)
+    # ISO 4217 code; balances, totals and settlements of the trip are in this currency
+    currency = Column(String(3), nullable=False, server_default="USD")
+    created_at = Column(
+        DateTime(timezone=True).with_variant(SQLiteSeconds, "sqlite"), nullable=False, server_default=func.now()
+    )
     updated_at = Column(DateTime(timezone=True), onupdate=func.now(), server_default=func.now())
     settled_at = Column(DateTime(timezone=True), nullable=True)
+    # bumped on every expense or member change, used to key cached results
+    revision = Column(Integer, nullable=False, default=0, server_default="0")
+    # running totals of the trip's expenses (in the trip currency), kept by the ledger so lists and summaries skip `expenses`
+    total_amount = Column(Integer, nullable=False, default=0, server_default="0")
+    expense_count = Column(Integer, nullable=False, default=0, server_default="0")
+    # when an expense was last added, changed or removed
+    last_expense_at = Column(DateTime(timezone=True).with_variant(SQLiteSeconds, "sqlite"), nullable=True)
 
     creator = relationship("User", back_populates="trips")
-    members = relationship("User", secondary=trip_members, back_populates="joined_trips")
+    # passive_deletes: the trip_members rows go with the trip through ON DELETE CASCADE
+    members = relationship("User", secondary=trip_members, back_populates="joined_trips", passive_deletes=True)
 
 class Expense(Base):
     __tablename__ = "expenses"
@@ -43,11 +65,126 @@ class Expense(Base):
     # here we used ondelete="CASCADE". It means if trip deleted, its expenses also deleted.
     trip_id = Column(Integer, ForeignKey("trips.id", ondelete="CASCADE"), nullable=False)
     title = Column(String, nullable=False)
-    amount = Column(Float, nullable=False)
+    # amount in minor units (cents) of `currency` so balances add up exactly
+    amount = Column(Integer, nullable=False)
+    currency = Column(String(3), nullable=False, server_default="USD")
+    # amount converted to the trip currency when the expense was written; the ledger adds these up
+    base_amount = Column(Integer, nullable=False)
     # ondelete="SET NULL". It means if user is deleted, there expenses stays but payer_id becomes NULL.
     payer_id = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"))
     note = Column(String, nullable=True)
 
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(
+        DateTime(timezone=True).with_variant(SQLiteSeconds, "sqlite"), nullable=False, server_default=func.now()
+    )
+
+    __table_args__ = (
+        # keyset pagination of a trip's expenses walks this index in order
+        Index("ix_expenses_trip_id_created_at_id", "trip_id", "created_at", "id"),
+        # expense search: one payer's expenses newest first, and amount ranges
+        Index("ix_expenses_trip_id_payer_id_created_at_id", "trip_id", "payer_id", "created_at", "id"),
+        Index("ix_expenses_trip_id_base_amount", "trip_id", "base_amount"),
+    )
+
+# SQLite full-text index of expense titles and notes (see app.services.search). It is
+# contentless, the triggers hand it every change along with a "t<trip_id>" token so a
+# search is narrowed to one trip inside the index. The same DDL is in the migration; a
+# batch_alter_table on expenses recreates the table and drops the triggers, re-create them after it.
+EXPENSES_FTS_DDL = [
+    "CREATE VIRTUAL TABLE expenses_fts USING fts5("
+    "title, note, trip, content='', tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER expenses_fts_insert AFTER INSERT ON expenses BEGIN "
+    "INSERT INTO expenses_fts(rowid, title, note, trip) VALUES (new.id, new.title, new.note, 't' || new.trip_id); "
+    "END",
+    "CREATE TRIGGER expenses_fts_delete AFTER DELETE ON expenses BEGIN "
+    "INSERT INTO expenses_fts(expenses_fts, rowid, title, note, trip) "
+    "VALUES ('delete', old.id, old.title, old.note, 't' || old.trip_id); "
+    "END",
+    "CREATE TRIGGER expenses_fts_update AFTER UPDATE OF title, note, trip_id ON expenses BEGIN "
+    "INSERT INTO expenses_fts(expenses_fts, rowid, title, note, trip) "
+    "VALUES ('delete', old.id, old.title, old.note, 't' || old.trip_id); "
+    "INSERT INTO expenses_fts(rowid, title, note, trip) VALUES (new.id, new.title, new.note, 't' || new.trip_id); "
+    "END",
+]
+for statement in EXPENSES_FTS_DDL:
+    event.listen(Expense.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+event.listen(Expense.__table__, "after_drop", DDL("DROP TABLE IF EXISTS expenses_fts").execute_if(dialect="sqlite"))
+
+class ExpenseSplit(Base):
+    """How much of an itemized expense each member owes.
+
+    Expenses without rows here are shared equally by all members of the trip.
+    """
+    __tablename__ = "expense_splits"
+
+    expense_id = Column(Integer, ForeignKey("expenses.id", ondelete="CASCADE"), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    # copied from the expense so a trip's splits can be summed without a join
+    trip_id = Column(Integer, ForeignKey("trips.id", ondelete="CASCADE"), nullable=False)
+    # minor units (cents); the amounts of one expense add up to the expense amount
+    amount = Column(Integer, nullable=False)
+    # the same split in the trip currency, adding up to the expense's base_amount
+    base_amount = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        Index("ix_expense_splits_trip_id_user_id", "trip_id", "user_id"),
+    )
+
+class ExchangeRate(Base):
+    """Date-stamped exchange rates, loaded from CSV snapshots ("python -m app.services.currency load").
 
+    rate is units of `currency` per one unit of settings.exchange_rate_reference.
+    """
+    __tablename__ = "exchange_rates"
+
+    currency = Column(String(3), primary_key=True)
+    date = Column(Date, primary_key=True)
+    rate = Column(Numeric(18, 8), nullable=False)
+
+class TripBalance(Base):
+    """Running per-member totals of a trip, kept in sync with expenses and members.
+
+    Settlement and summary read these rows instead of scanning every expense.
+    Rebuild or verify it with "python -m app.services.ledger rebuild|verify".
+    """
+    __tablename__ = "trip_balances"
+
+    trip_id = Column(Integer, ForeignKey("trips.id", ondelete="CASCADE"), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    # all amounts in minor units (cents)
+    paid = Column(Integer, nullable=False, default=0)
+    # owed from itemized expenses; share is this plus an equal part of all other expenses
+    split_share = Column(Integer, nullable=False, default=0, server_default="0")
+    share = Column(Integer, nullable=False, default=0)
+    net = Column(Integer, nullable=False, default=0)
+
+    user = relationship("User")
+
+    __table_args__ = (
+        # a user's balances across all their trips (GET /users/me/balances)
+        Index("ix_trip_balances_user_id_trip_id", "user_id", "trip_id"),
+    )
+
+class DailySpending(Base):
+    """What each member paid in a trip per UTC day, kept in sync with expenses by the ledger.
+
+    Spending over time (app.services.analytics) adds these rows up instead of
+    grouping every expense. Rebuild or verify it with
+    "python -m app.services.analytics backfill|verify".
+    """
+    __tablename__ = "daily_spending"
+
+    trip_id = Column(Integer, ForeignKey("trips.id", ondelete="CASCADE"), nullable=False)
+    payer_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    # the UTC day of the expenses' created_at
+    day = Column(Date, nullable=False)
+    # sum of the expenses' base_amount, in the trip currency
+    amount = Column(Integer, nullable=False, default=0)
+    expense_count = Column(Integer, nullable=False, default=0)
 
+    __table_args__ = (
+        # day before payer_id: a trip's date range is one scan of the key
+        PrimaryKeyConstraint("trip_id", "day", "payer_id"),
+        # a user's spending across all their trips (GET /users/me/spending)
+        Index("ix_daily_spending_payer_id_day", "payer_id", "day"),
+    )
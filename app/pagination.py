@@ -0,0 +1,57 @@
+"""Opaque keyset cursors.
+
+A cursor is the sort key of the last row a client has seen, so the next page is
+a plain indexed range scan ("WHERE (a, b) > (:a, :b)") instead of an OFFSET
+that has to skip over every earlier row.
+"""
+import base64
+import json
+from datetime import datetime
+from urllib.parse import urlencode
+
+from fastapi import HTTPException, status
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+def encode_cursor(*values) -> str:
+    raw = json.dumps([v.isoformat() if isinstance(v, datetime) else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, *types) -> list:
+    """Decode a cursor made by encode_cursor, one value per type (datetime, int or str).
+
+    Values are typed by their position, never by their look: a name that reads
+    like a timestamp stays a string. Any value may be None. A cursor that
+    doesn't fit the types is a 400.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list) or len(values) != len(types):
+            raise ValueError(cursor)
+        return [_decode_value(value, type_) for value, type_ in zip(values, types)]
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+
+def _decode_value(value, type_):
+    if value is None:
+        return None
+    if type_ is datetime:
+        if not isinstance(value, str):
+            raise ValueError(value)
+        return datetime.fromisoformat(value)
+    if not isinstance(value, type_) or isinstance(value, bool):
+        raise ValueError(value)
+    return value
+
+
+def next_page_headers(next_cursor, **params) -> dict:
+    """X-Next-Cursor and Link headers for the page after this one, none on the last page."""
+    if next_cursor is None:
+        return {}
+    query = urlencode({"cursor": next_cursor, **{name: value for name, value in params.items() if value is not None}})
+    return {"X-Next-Cursor": next_cursor, "Link": f'<?{query}>; rel="next"'}
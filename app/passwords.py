@@ -0,0 +1,89 @@
+"""Password hashing off the event loop.
+
+bcrypt costs a few hundred milliseconds of CPU per call, so hashing and
+verification run in a bounded process pool (real parallelism, no GIL). When
+too many calls are already waiting, new ones get a 429 instead of queueing up
+behind a login storm.
+"""
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+from app.config import settings
+
+_contexts = {}
+_pool: Optional[ProcessPoolExecutor] = None
+_in_flight = 0
+
+
+def get_context(rounds: int) -> CryptContext:
+    """One CryptContext per work factor. Hashes made with other rounds are flagged for rehash."""
+    if rounds not in _contexts:
+        _contexts[rounds] = CryptContext(
+            schemes=["bcrypt"],
+            deprecated="auto",
+            bcrypt__default_rounds=rounds,
+            bcrypt__min_rounds=rounds,
+            bcrypt__max_rounds=rounds,
+        )
+    return _contexts[rounds]
+
+
+# these two run inside the worker processes
+def _hash(password: str, rounds: int) -> str:
+    return get_context(rounds).hash(password)
+
+
+def _verify_and_update(password: str, hashed_password: str, rounds: int):
+    return get_context(rounds).verify_and_update(password, hashed_password)
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn, not fork: the parent has an event loop and DB driver threads running
+        _pool = ProcessPoolExecutor(
+            max_workers=settings.password_hash_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _pool
+
+
+def _queue_limit() -> int:
+    return (settings.password_hash_workers or os.cpu_count() or 1) + settings.password_hash_queue_limit
+
+
+async def _run(fn, *args):
+    global _in_flight
+    if _in_flight >= _queue_limit():
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many login requests, please retry shortly",
+            headers={"Retry-After": "1"},
+        )
+    _in_flight += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_get_pool(), fn, *args)
+    finally:
+        _in_flight -= 1
+
+
+async def hash_password(password: str) -> str:
+    return await _run(_hash, password, settings.bcrypt_rounds)
+
+
+async def verify_password(password: str, hashed_password: str):
+    """Return (is_valid, new_hash). new_hash is set when the stored hash uses other rounds."""
+    return await _run(_verify_and_update, password, hashed_password, settings.bcrypt_rounds)
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(cancel_futures=True)
+        _pool = None
@@ -0,0 +1,26 @@
+"""orjson responses.
+
+ORJSONResponse is the app's default response class. The hot read endpoints
+skip pydantic altogether: they select plain columns (or build plain dicts) and
+return rows_response / ORJSONResponse directly, so no ORM object or response
+model is built per row. Their response_model is still declared for the docs.
+"""
+import orjson
+from fastapi.responses import JSONResponse
+
+# pydantic writes UTC datetimes with a "Z" suffix, keep the output the same
+OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+
+
+def dumps(content) -> bytes:
+    return orjson.dumps(content, option=OPTIONS)
+
+
+class ORJSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+def rows_response(rows, fields: list[str], headers: dict = None) -> ORJSONResponse:
+    """A JSON array with one object per row; the row's first columns are `fields`, in order."""
+    return ORJSONResponse([dict(zip(fields, row)) for row in rows], headers=headers)
@@ -1,24 +1,71 @@
-from fastapi import APIRouter, Depends, status, HTTPException
-from sqlalchemy import func
-from sqlalchemy.orm import Session
-from app import models, schemas
-from app.auth import get_current_user
-from app.database import get_db
-import csv
-from io import StringIO
+from datetime import datetime
+from typing import Optional
+from fastapi import APIRouter, Depends, Query, Request, status, HTTPException
+from sqlalchemy import literal, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from app import models, schemas, crud
+from app.auth import get_current_user, get_current_user_read
+from app.conditional import cache_headers, not_modified, trip_etag
+from app.database import get_db, get_read_db, read_sessionmaker
+from app.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, decode_cursor, encode_cursor, next_page_headers
+from app.responses import dumps, rows_response
+from app.services import events, export, ledger
+from app.services import currency as currency_service
+from app.services import splits as split_service
 from fastapi.responses import StreamingResponse
 
 router = APIRouter(prefix="/expenses", tags=["expenses"])
 
-@router.post("/", response_model=schemas.ExpenseResponse, status_code=status.HTTP_201_CREATED)
-def create_expense(expense: schemas.ExpenseCreate, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def _expense_detail(expense: models.Expense, splits: Optional[dict[int, int]]):
+    return schemas.ExpenseDetailResponse(
+        id=expense.id,
+        trip_id=expense.trip_id,
+        title=expense.title,
+        amount=expense.amount,
+        currency=expense.currency,
+        base_amount=expense.base_amount,
+        payer_id=expense.payer_id,
+        created_at=expense.created_at,
+        note=expense.note,
+        splits=[schemas.ExpenseSplitResponse(user_id=uid, amount=amount) for uid, amount in sorted((splits or {}).items())]
+    )
+
+def _check_split_members(splits: Optional[dict[int, int]], member_ids: set[int]):
+    outsiders = set(splits or {}) - member_ids
+    if outsiders:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Split users are not members of the trip: {', '.join(map(str, sorted(outsiders)))}"
+        )
+
+def _negated(splits: dict[int, int]):
+    return {uid: -amount for uid, amount in splits.items()}
+
+def _base_splits(base_amount: int, splits: Optional[dict[int, int]]):
+    # the split in the trip currency keeps the proportions of the split as entered
+    return split_service.rescale(base_amount, splits) if splits else splits
+
+async def _locked_expense(db: AsyncSession, expense_id: int) -> Optional[models.Expense]:
+    """The expense as it is once its trip's ledger is locked, so what is taken back out is current."""
+    expense = await db.get(models.Expense, expense_id)
+    if expense is None:
+        return None
+    await db.run_sync(ledger.lock_trip, expense.trip_id)
+    return await db.get(models.Expense, expense_id, populate_existing=True)
+
+@router.post("/", response_model=schemas.ExpenseDetailResponse, status_code=status.HTTP_201_CREATED)
+async def create_expense(expense: schemas.ExpenseCreate, db: AsyncSession = Depends(get_db), current_user: models.User = Depends(get_current_user)):
     # Fetch the trip
-    trip = db.query(models.Trip).filter(models.Trip.id == expense.trip_id).first()
+    trip = await db.get(models.Trip, expense.trip_id)
     if not trip:
         raise HTTPException(status_code=404, detail="Trip not found")
     
-    # check if current user is part of the trip
-    member_ids = [member.id for member in trip.members]
+    splits = split_service.resolve_split(expense.amount, expense.split_type, expense.splits)
+
+    # check if current user is part of the trip, without loading every member
+    member_ids = await crud.get_trip_member_ids(
+        db, expense.trip_id, [current_user.id, expense.payer_id, *(splits or {})]
+    )
     if current_user.id not in member_ids:
         raise HTTPException(status_code=403, detail="You are not member of this trip")
     
@@ -26,32 +73,120 @@ def create_expense(expense: schemas.ExpenseCreate, db: Session = Depends(get_db)
     if expense.payer_id not in member_ids:
         raise HTTPException(status_code=400, detail="Payer is not member of the trip")
 
+    _check_split_members(splits, member_ids)
+
+    # converted to the trip currency once, at today's rate; the ledger only sees base amounts
+    currency = expense.currency or trip.currency
+    created_at = currency_service.now()
+    [base_amount] = await db.run_sync(
+        currency_service.convert_batch, [(expense.amount, currency, created_at.date())], trip.currency
+    )
+    base_splits = _base_splits(base_amount, splits)
+
     new_expense = models.Expense(
         title=expense.title,
         amount=expense.amount,
+        currency=currency,
+        base_amount=base_amount,
         trip_id=expense.trip_id,
-        payer_id=expense.payer_id
+        payer_id=expense.payer_id,
+        created_at=created_at
     )
     db.add(new_expense)
-    db.commit()
-    db.refresh(new_expense)
-    return new_expense
+    if splits:
+        await db.flush()
+        await crud.replace_expense_splits(db, new_expense, splits, base_splits)
+    await db.run_sync(
+        ledger.record_expense, expense.trip_id, expense.payer_id, base_amount, base_splits, 1, created_at.date()
+    )
+    await db.commit()
+    await db.refresh(new_expense)
+    detail = _expense_detail(new_expense, splits)
+    await events.publish_change(db, expense.trip_id, "expense.created", expense=detail.model_dump())
+    return detail
+
+EXPENSE_FIELDS = list(schemas.ExpenseResponse.model_fields)
+
+def _expense_query(trip_id: int, fields: list[str], cursor: Optional[str]):
+    """Columns of a trip's expenses in (created_at, id) order, starting after the cursor."""
+    # created_at and id are always selected, the next cursor is built from them
+    columns = [getattr(models.Expense, name) for name in dict.fromkeys(fields + ["created_at", "id"])]
+    query = (
+        select(*columns)
+        .filter(models.Expense.trip_id == trip_id)
+        .order_by(models.Expense.created_at, models.Expense.id)
+    )
+    if cursor:
+        created_at, expense_id = decode_cursor(cursor, datetime, int)
+        query = query.filter(tuple_(models.Expense.created_at, models.Expense.id) > tuple_(
+            literal(created_at, models.Expense.created_at.type), literal(expense_id)
+        ))
+    return query
+
+async def _stream_ndjson(query, fields: list[str], sessionmaker):
+    # the request's session is closed before the body is sent, so streaming uses its own
+    async with sessionmaker() as session:
+        result = await session.stream(query.execution_options(yield_per=500))
+        async for partition in result.partitions():
+            yield b"".join(dumps(dict(zip(fields, row))) + b"\n" for row in partition)
 
 @router.get("/trip/{trip_id}", response_model=list[schemas.ExpenseResponse])
-def get_expenses_for_a_trip(trip_id: int, db: Session = Depends(get_db)):
-    expenses = db.query(models.Expense).filter(models.Expense.trip_id == trip_id).all()
-    if not expenses:
+async def get_expenses_for_a_trip(
+    trip_id: int,
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    fields: Optional[str] = Query(None, description="comma separated subset of expense fields"),
+    format: schemas.ListFormat = schemas.ListFormat.json,
+    db: AsyncSession = Depends(get_read_db)
+):
+    selected = EXPENSE_FIELDS
+    if fields:
+        # the requested fields are selected first, in order, so rows can be zipped with them
+        selected = list(dict.fromkeys(name.strip() for name in fields.split(",") if name.strip()))
+        unknown = set(selected) - set(EXPENSE_FIELDS)
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    query = _expense_query(trip_id, selected, cursor)
+
+    # ndjson streams every row after the cursor (or up to limit) straight from a DB cursor
+    if format == schemas.ListFormat.ndjson:
+        if limit:
+            query = query.limit(limit)
+        return StreamingResponse(_stream_ndjson(query, selected, read_sessionmaker(request)), media_type="application/x-ndjson")
+
+    # pages of an unchanged trip get a 304 before any expense is read
+    revision = await crud.get_trip_revision(db, trip_id)
+    etag = trip_etag(request, trip_id, revision) if revision is not None else None
+    unchanged = not_modified(request, etag) if etag else None
+    if unchanged:
+        return unchanged
+
+    page_size = limit or DEFAULT_PAGE_SIZE
+    rows = (await db.execute(query.limit(page_size + 1))).all()
+    if not rows and not cursor:
         raise HTTPException(status_code=404, detail="No expenses found for this trip")
-    return expenses
+
+    # one extra row tells us whether there is a next page
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+    headers = next_page_headers(next_cursor, limit=page_size)
+    if etag:
+        headers.update(cache_headers(etag))
+
+    # rows go straight to orjson, no ExpenseResponse is built per row
+    return rows_response(rows, selected, headers)
 
 @router.patch("/{expense_id}/note", response_model=schemas.ExpenseResponse)
-def update_expense_note(
+async def update_expense_note(
     expense_id: int,
     request: schemas.UpdateExpenseNote,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
 ):
-    expense = db.query(models.Expense).filter(models.Expense.id == expense_id).first()
+    expense = await db.get(models.Expense, expense_id)
     if not expense:
         raise HTTPException(status_code=404, detail="Expense not found")
     
@@ -60,24 +195,27 @@ def update_expense_note(
         raise HTTPException(status_code=403, detail="You are not authorized to update this expense")
     
     expense.note = request.note
-    db.commit()
-    db.refresh(expense)
-    return expense
+    await db.run_sync(ledger.touch_trip, expense.trip_id)
+    await db.commit()
+    await db.refresh(expense)
+    response = schemas.ExpenseResponse.model_validate(expense)
+    await events.publish_change(db, expense.trip_id, "expense.updated", expense=response.model_dump())
+    return response
 
 @router.delete("/{expense_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_expense(
+async def delete_expense(
     trip_id: int,
     expense_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
 ):
     # prevent deletion if multiple members are involved
-    trip = db.query(models.Trip).filter(models.Trip.id == trip_id).first()
+    trip = await db.get(models.Trip, trip_id)
     if trip.settled_at is not None:
         raise HTTPException(status_code=400, detail="Cannot delete expense after settlement. Please reset or recalculate settlement first."
     )
     
-    expense =db.query(models.Expense).filter(models.Expense.id == expense_id).first()
+    expense = await _locked_expense(db, expense_id)
     
     if not expense:
         raise HTTPException(status_code=404, detail="Expense not found")
@@ -86,18 +224,27 @@ def delete_expense(
     if expense.payer_id != current_user.id:
         raise HTTPException(status_code=403, detail="You are not authorized to delete this expense")
     
-    db.delete(expense)
-    db.commit()
+    # the split rows go with the expense through ON DELETE CASCADE
+    splits = await crud.get_expense_splits(db, expense.id)
+    base_splits = _base_splits(expense.base_amount, splits)
+    await db.run_sync(
+        ledger.record_expense, expense.trip_id, expense.payer_id, -expense.base_amount, _negated(base_splits), -1,
+        expense.created_at.date()
+    )
+    expense_trip_id = expense.trip_id
+    await db.delete(expense)
+    await db.commit()
+    await events.publish_change(db, expense_trip_id, "expense.deleted", expense_id=expense_id)
     return 
 
-@router.put("/{expense_id}", response_model=schemas.ExpenseResponse)
-def update_expense(
+@router.put("/{expense_id}", response_model=schemas.ExpenseDetailResponse)
+async def update_expense(
     expense_id: int,
     expense_update: schemas.ExpenseUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
 ):
-    expense = db.query(models.Expense).filter(models.Expense.id == expense_id).first()
+    expense = await _locked_expense(db, expense_id)
     if not expense:
         raise HTTPException(status_code=404, detail="Expense not found")
     
@@ -107,50 +254,89 @@ def update_expense(
     
     # Optional : Add trip access check if needed
     
-    for key, value in expense_update.dict(exclude_unset=True).items():
+    # a null title, amount or payer keeps the current one; a null note clears it
+    changes = {
+        key: value for key, value in expense_update.model_dump(exclude_unset=True).items()
+        if value is not None or key == "note"
+    }
+    split_type = changes.pop("split_type", None)
+    split_entries = changes.pop("splits", None)
+    new_currency = changes.pop("currency", None) or expense.currency
+    if changes.get("payer_id") is not None and changes["payer_id"] != expense.payer_id:
+        if not await crud.is_trip_member(db, expense.trip_id, changes["payer_id"]):
+            raise HTTPException(status_code=400, detail="Payer is not member of the trip")
+    
+    old_splits = await crud.get_expense_splits(db, expense.id)
+    new_amount = changes.get("amount") if changes.get("amount") is not None else expense.amount
+    if split_type is not None or split_entries is not None:
+        new_splits = split_service.resolve_split(
+            new_amount, split_type or schemas.SplitType.equal, expense_update.splits
+        )
+        member_ids = await crud.get_trip_member_ids(db, expense.trip_id, list(new_splits or {}))
+        _check_split_members(new_splits, member_ids)
+    elif old_splits and new_amount != expense.amount:
+        new_splits = split_service.rescale(new_amount, old_splits)
+    else:
+        new_splits = old_splits
+
+    # a new amount or currency is converted at the rate of the day the expense was made
+    new_base_amount = expense.base_amount
+    if new_amount != expense.amount or new_currency != expense.currency:
+        trip = await db.get(models.Trip, expense.trip_id)
+        [new_base_amount] = await db.run_sync(
+            currency_service.convert_batch, [(new_amount, new_currency, expense.created_at.date())], trip.currency
+        )
+    old_base_splits = _base_splits(expense.base_amount, old_splits)
+    new_base_splits = _base_splits(new_base_amount, new_splits)
+    
+    # take the old values out of the ledger and put the new ones in, on the day the expense was made
+    day = expense.created_at.date()
+    await db.run_sync(
+        ledger.record_expense, expense.trip_id, expense.payer_id, -expense.base_amount, _negated(old_base_splits), -1,
+        day
+    )
+    for key, value in changes.items():
         setattr(expense, key, value)
+    expense.currency = new_currency
+    expense.base_amount = new_base_amount
+    if new_splits != old_splits or new_base_splits != old_base_splits:
+        await crud.replace_expense_splits(db, expense, new_splits, new_base_splits)
+    await db.run_sync(
+        ledger.record_expense, expense.trip_id, expense.payer_id, new_base_amount, new_base_splits, 1, day
+    )
         
-    db.commit()
-    db.refresh(expense)
-    return expense
+    await db.commit()
+    await db.refresh(expense)
+    detail = _expense_detail(expense, new_splits)
+    await events.publish_change(db, expense.trip_id, "expense.updated", expense=detail.model_dump())
+    return detail
 
 # export expense in csv format
 @router.get("/trips/{trip_id}/expenses/breakdown/export")
-def export_expense_breakdown_csv(
+async def export_expense_breakdown_csv(
     trip_id: int,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    request: Request,
+    mode: schemas.ExportMode = schemas.ExportMode.breakdown,
+    db: AsyncSession = Depends(get_read_db),
+    current_user: models.User = Depends(get_current_user_read)
 ):
-    trip = db.query(models.Trip).filter(models.Trip.id == trip_id).first()
-    if not trip:
+    membership = await crud.get_trip_membership(db, trip_id, current_user.id)
+    if not membership:
         raise HTTPException(status_code=404, detail="Trip not found")
     
-    if current_user not in trip.members and current_user.id != trip.creator_id:
+    if not membership.is_member and current_user.id != membership.creator_id:
         raise HTTPException(status_code=403, detail="You are not authorized to view this trip's expenses")
     
-    results = (
-        db.query(
-            models.User.name.label("user_name"),
-            func.count(models.Expense.id).label("number_of_expenses"),
-            func.sum(models.Expense.amount).label("total_amount"),
-        )
-        .join(models.Expense, models.User.id == models.Expense.payer_id) 
-        .filter(models.Expense.trip_id == trip_id)
-        .group_by(models.User.id)
-        .all()
-    )
-    output = StringIO()
-    writer = csv.writer(output)
-    writer.writerow(['User Name', 'No. of Expenses', 'Total Amount Spent'])
-    
-    for row in results:
-        writer.writerow([row.user_name, row.number_of_expenses, float(row.total_amount or 0)])
+    if mode == schemas.ExportMode.ledger:
+        body = export.iter_csv(export.ledger_query(trip_id), export.LEDGER_HEADER, read_sessionmaker(request))
+        filename = f"trip_{trip_id}_expenses_ledger.csv"
+    else:
+        body = export.iter_csv(export.breakdown_query(trip_id), export.BREAKDOWN_HEADER, read_sessionmaker(request))
+        filename = f"trip_{trip_id}_expenses_breakdown.csv"
     
-    output.seek(0)
+    headers = {"Content-Disposition": f"attachment; filename={filename}", "Vary": "Accept-Encoding"}
+    if export.accepts_gzip(request.headers.get("accept-encoding", "")):
+        body = export.gzip_chunks(body)
+        headers["Content-Encoding"] = "gzip"
     
-    filename = f"trip_{trip_id}_expenses_breakdown.csv"
-    return StreamingResponse(
-        output,
-        media_type="text/csv",
-        headers={"Content-Disposition": f"attachment; filename={filename}"}
-    )
\ No newline at end of file
+    return StreamingResponse(body, media_type="text/csv", headers=headers)
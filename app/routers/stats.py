@@ -0,0 +1,17 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from app import metrics
+from app.services.cache import caches
+
+router = APIRouter(prefix="/stats", tags=["stats"])
+
+@router.get("/cache")
+async def cache_stats():
+    return {name: cache.stats() for name, cache in caches.items()}
+
+# Prometheus scrapes /metrics at the top level, outside the /stats prefix
+metrics_router = APIRouter(tags=["stats"])
+
+@metrics_router.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
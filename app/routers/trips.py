@@ -1,160 +1,363 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status, Response
-from sqlalchemy.orm import Session
+from collections import defaultdict
+from typing import List, Optional
+from datetime import date, datetime
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status, Response, WebSocket
+from fastapi.responses import StreamingResponse
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from app import schemas, crud
-from app.auth import get_current_user
-from app.database import SessionLocal
+from app.auth import (
+    authenticate_trip_member, get_current_user, get_current_user_read, oauth2_scheme, require_trip_member,
+    require_trip_member_read, token_expiry
+)
+from app.conditional import cache_headers, not_modified, trip_etag
+from app.config import settings
+from app.database import get_db, get_read_db
+from app.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, encode_cursor, next_page_headers
+from app.responses import ORJSONResponse, rows_response
 from app.services.settlement import calculate_settlement
+from app.services.settlement_engine import SettlementStrategy
+from app.services import analytics, bulk_import, events, ledger, search
+from app.services import currency as currency_service
 from app import models
 
 router = APIRouter(prefix="/trips", tags=["trips"])
 
-# Dependency to get DB
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 @router.post("/", response_model=schemas.TripResponse)
-def create_trip(trip: schemas.TripCreate, db: Session = Depends(get_db), current_user=Depends(get_current_user)):
-    return crud.create_trip(db=db, trip=trip, user_id=current_user.id)
+async def create_trip(trip: schemas.TripCreate, db: AsyncSession = Depends(get_db), current_user=Depends(get_current_user)):
+    return await crud.create_trip(db=db, trip=trip, user_id=current_user.id)
+
+@router.get("/", response_model=List[schemas.TripListItem], response_model_exclude_unset=True)
+async def list_trips(
+    response: Response,
+    sort: schemas.TripSort = schemas.TripSort.activity,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    with_members: bool = False,
+    db: AsyncSession = Depends(get_read_db),
+    current_user: models.User = Depends(get_current_user_read)
+):
+    trips, next_cursor = await crud.list_user_trips(db, current_user.id, sort, cursor, limit, with_members)
+    headers = next_page_headers(next_cursor, sort=sort.value, limit=limit, with_members="true" if with_members else None)
+    if not with_members:
+        return rows_response(trips, crud.TRIP_LIST_FIELDS, headers)
+    response.headers.update(headers)
+    return trips
 
 @router.post("/{trip_id}/add-member/{user_id}")
-def add_member(trip_id: int, user_id: int, db: Session = Depends(get_db), current_user= Depends(get_current_user)):
-    trip  = crud.add_member_to_trip(db, trip_id, user_id)
-    if not trip:
+async def add_member(trip_id: int, user_id: int, db: AsyncSession = Depends(get_db), current_user= Depends(get_current_user)):
+    added = await crud.add_member_to_trip(db, trip_id, user_id)
+    if added is None:
         raise HTTPException(status_code=404, detail="Trip or User not found")
+    # adding an existing member changes nothing, so subscribers aren't told about it
+    if added:
+        user = await db.get(models.User, user_id)
+        await events.publish_change(db, trip_id, "member.added", user={"id": user.id, "name": user.name})
     return {"message": "User added to trip successfully"}
 
 @router.get("/{trip_id}/settlement", response_model=List[schemas.Settlement])
-def get_settlement(trip_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
-     # Optional: Verify the current_user is part of the trip
-    trip = db.query(models.Trip).filter(models.Trip.id == trip_id).first()
-    if not trip:
-        raise HTTPException(status_code=404, detail="Trip not found")
+async def get_settlement(
+    trip_id: int,
+    request: Request,
+    strategy: SettlementStrategy = SettlementStrategy.greedy,
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(require_trip_member)
+):
+    etag = trip_etag(request, trip_id, await crud.get_trip_revision(db, trip_id))
+    unchanged = not_modified(request, etag)
+    if unchanged:
+        return unchanged
+    # plain dicts (usually from the cache), nothing to validate
+    settlements = await db.run_sync(lambda session: calculate_settlement(trip_id, session, strategy))
+    return ORJSONResponse(settlements, headers=cache_headers(etag))
+
+@router.post("/{trip_id}/settle", response_model=List[schemas.Settlement])
+async def settle_trip(
+    trip_id: int,
+    strategy: SettlementStrategy = SettlementStrategy.greedy,
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(require_trip_member)
+):
+    trip = await db.get(models.Trip, trip_id)
 
-    user_ids = [member.id for member in trip.members]
-    if current_user.id not in user_ids:
-        raise HTTPException(status_code=403, detail="Not authorized to view this trip")
-    return calculate_settlement(trip_id, db)
+    # mark the trip as settled, expenses can't be deleted after this
+    trip.settled_at = datetime.now()
+    await db.run_sync(ledger.touch_trip, trip_id)
+    await db.commit()
+    await events.publish_change(db, trip_id, "trip.settled")
+    return await db.run_sync(lambda session: calculate_settlement(trip_id, session, strategy))
 
 @router.post("/{trip_id}/invite", response_model=schemas.UserResponse)
-def invite_trip_member_by_email(
+async def invite_trip_member_by_email(
     trip_id: int,
     request: schemas.AddMemberByEmailRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
 ):
-    trip = db.query(models.Trip).filter(models.Trip.id == trip_id).first()
+    trip = await db.get(models.Trip, trip_id)
     if not trip:
         raise HTTPException(status_code=404, detail="Trip not found")
     
     if trip.creator_id != current_user.id:
         raise HTTPException(status_code=403, detail="Only Trip creator can add members")
     
-    user_to_add = db.query(models.User).filter(models.User.email == request.email).first()
+    user_to_add = await crud.get_user_by_email(db, request.email)
     if not user_to_add:
         raise HTTPException(status_code=404, detail="No user found with this email")
-    if user_to_add in trip.members:
+    if await crud.is_trip_member(db, trip.id, user_to_add.id):
         raise HTTPException(status_code=400, detail="User already in trip")
-    trip.members.append(user_to_add)
-    db.commit()
-    db.refresh(trip)
+    await crud.insert_trip_member(db, trip.id, user_to_add.id)
+    await db.commit()
+    await events.publish_change(db, trip_id, "member.added", user={"id": user_to_add.id, "name": user_to_add.name})
     return user_to_add
 
 @router.delete("/trips/members", response_model=schemas.UserResponse)
-def remove_trip_member(
+async def remove_trip_member(
     trip_id: int,
     request: schemas.RemoveMemeberByEmailRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(get_current_user)):
-    trip = db.query(models.Trip).filter(models.Trip.id == trip_id).first()
+    trip = await db.get(models.Trip, trip_id)
     if not trip:
         raise HTTPException(status_code=404, detail="Trip not found")
     if trip.creator_id != current_user.id:
         raise HTTPException(status_code=403, detail="Only Trip creator can remove members")
-    user_to_remove = db.query(models.User).filter(models.User.email == request.email).first()
+    user_to_remove = await crud.get_user_by_email(db, request.email)
     if not user_to_remove:
         raise HTTPException(status_code=404, detail="No user found with this email")
-    if user_to_remove not in trip.members:
+    if not await crud.is_trip_member(db, trip.id, user_to_remove.id):
         raise HTTPException(status_code=400, detail="User not in trip")
     
-    # check for existing expenses by this user in this trip
-    has_expenses = db.query(models.Expense).filter(
+    # check for existing expenses by this user in this trip, paid or itemized to them
+    result = await db.execute(select(models.Expense.id).filter(
         models.Expense.trip_id == trip.id,
         models.Expense.payer_id == user_to_remove.id
-    ).first()
+    ).union_all(select(models.ExpenseSplit.expense_id).filter(
+        models.ExpenseSplit.trip_id == trip.id,
+        models.ExpenseSplit.user_id == user_to_remove.id
+    )).limit(1))
+    has_expenses = result.first()
     if has_expenses:
         raise HTTPException(status_code=400, detail="User has expenses in this trip, cannot remove")
-    trip.members.remove(user_to_remove)
-    db.commit()
-    db.refresh(trip)
+    await crud.delete_trip_member(db, trip.id, user_to_remove.id)
+    await db.commit()
+    # the removed member's own feeds end instead of carrying on with the trip's changes
+    events.close_member(trip_id, user_to_remove.id)
+    await events.publish_change(db, trip_id, "member.removed", user_id=user_to_remove.id)
     return user_to_remove
 
 @router.delete("/{trip_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_trip(
+async def delete_trip(
     trip_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
 ):
-    trip = db.query(models.Trip).filter(models.Trip.id == trip_id).first()
+    trip = await db.get(models.Trip, trip_id)
     if not trip:
         raise HTTPException(status_code=404, detail="Trip not found")
     
     if trip.creator_id != current_user.id:
         raise HTTPException(status_code=403, detail="Only Trip creator can delete the trip")
     
-    db.delete(trip)
-    db.commit()
+    await db.delete(trip)
+    await db.commit()
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 
 @router.get("/{trip_id}/summary", response_model=schemas.TripSummaryResponse)
-def trip_summary(
+async def trip_summary(
     trip_id: int,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    request: Request,
+    db: AsyncSession = Depends(get_read_db),
+    current_user: models.User = Depends(get_current_user_read)
 ):
-    trip  = db.query(models.Trip).filter(models.Trip.id == trip_id).first()
+    trip  = await db.get(models.Trip, trip_id)
     if not trip:
         raise HTTPException(status_code=404, detail="Trip not found")
     
-    # Get all expenses
-    expenses = db.query(models.Expense).filter(models.Expense.trip_id == trip_id).all()
-    total_expense = sum(exp.amount for exp in expenses)
-    
-    if not expenses:
+    # the trip row carries its expense count and total, so the expenses table isn't read at all
+    if not trip.expense_count:
         raise HTTPException(status_code=404, detail="No expenses found for this trip")
+
+    # the trip row also has the revision: a client that is up to date gets a 304 right away
+    etag = trip_etag(request, trip_id, trip.revision)
+    unchanged = not_modified(request, etag)
+    if unchanged:
+        return unchanged
     
-    # Get trip members
-    members = trip.members
-    
-    # calculate paid per user
-    paid_by_user = {member.id: 0.0 for member in members}
-    for exp in expenses:
-        if exp.payer_id in paid_by_user:
-            paid_by_user[exp.payer_id] += exp.amount
-    
-    # Equal share
-    share_per_user = total_expense / len(members) if members else 0
+    # paid, share and balance per member come from the ledger instead of summing every expense
+    rows = await db.run_sync(ledger.get_trip_balances, trip_id)
+    total_expense = trip.total_amount
     
-    summary = []
-    for member in members:
-        paid = round(paid_by_user[member.id],2)
-        share = round(share_per_user, 2)
-        balance = round(paid - share, 2)
-        summary.append(schemas.TripUserSummary(
-            user=member.name,
-            paid=paid,
-            share=share,
-            balance=balance
+    # built as plain dicts in the shape of TripSummaryResponse and sent with orjson
+    summary = [{"user": row.name, "paid": row.paid, "share": row.share, "balance": row.net} for row in rows]
+    return ORJSONResponse({
+        "trip_id": trip.id,
+        "trip_name": trip.name,
+        "currency": trip.currency,
+        "total_expenses": total_expense,
+        "summary": summary
+    }, headers=cache_headers(etag))
+
+@router.get("/{trip_id}/spending", response_model=schemas.TripSpendingResponse, response_model_exclude_none=True)
+async def trip_spending(
+    trip_id: int,
+    request: Request,
+    granularity: schemas.Granularity = schemas.Granularity.day,
+    date_from: Optional[date] = Query(None, description="first UTC day, inclusive"),
+    date_to: Optional[date] = Query(None, description="last UTC day, inclusive"),
+    by_payer: bool = False,
+    db: AsyncSession = Depends(get_read_db),
+    current_user: models.User = Depends(require_trip_member_read)
+):
+    trip = (await db.execute(
+        select(models.Trip.revision, models.Trip.currency).filter(models.Trip.id == trip_id)
+    )).one()
+    etag = trip_etag(request, trip_id, trip.revision)
+    unchanged = not_modified(request, etag)
+    if unchanged:
+        return unchanged
+
+    # one rollup row per member and day, added up per period; expenses aren't read
+    rows = await db.run_sync(analytics.get_trip_spending, trip_id, date_from, date_to)
+    points = analytics.bucket(
+        ((row.day, row.payer_id, row.amount, row.expense_count) for row in rows),
+        granularity, "payer_id" if by_payer else None
+    )
+    return ORJSONResponse({
+        "trip_id": trip_id, "currency": trip.currency, "granularity": granularity.value, "points": points
+    }, headers=cache_headers(etag))
+
+
+SEARCH_FIELDS = list(schemas.ExpenseResponse.model_fields)
+
+@router.get("/{trip_id}/expenses/search", response_model=List[schemas.ExpenseResponse])
+async def search_expenses(
+    trip_id: int,
+    q: Optional[str] = Query(None, max_length=200, description="words that must all start a word of the title or note"),
+    payer_id: Optional[int] = None,
+    min_amount: Optional[int] = Query(None, description="minor units of the trip currency"),
+    max_amount: Optional[int] = Query(None, description="minor units of the trip currency"),
+    date_from: Optional[date] = Query(None, description="first UTC day, inclusive"),
+    date_to: Optional[date] = Query(None, description="last UTC day, inclusive"),
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_read_db),
+    current_user: models.User = Depends(require_trip_member_read)
+):
+    filters = {
+        "q": q, "payer_id": payer_id, "min_amount": min_amount, "max_amount": max_amount,
+        "date_from": date_from, "date_to": date_to,
+    }
+    query = search.search_query(
+        trip_id, SEARCH_FIELDS, cursor, **filters, fulltext=db.bind.dialect.name == "sqlite"
+    )
+    # one extra row tells us whether there is a next page
+    rows = (await db.execute(query.limit(limit + 1))).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+    headers = next_page_headers(next_cursor, limit=limit, **{
+        name: value.isoformat() if isinstance(value, date) else value for name, value in filters.items()
+    })
+    return rows_response(rows, SEARCH_FIELDS, headers)
+
+
+@router.post("/{trip_id}/expenses/bulk", response_model=schemas.BulkImportResponse, status_code=status.HTTP_201_CREATED)
+async def bulk_import_expenses(
+    trip_id: int,
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(require_trip_member)
+):
+    # a JSON array, NDJSON or CSV as the raw body, or as a multipart upload in the "file" field
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        upload = (await request.form()).get("file")
+        if upload is None or isinstance(upload, str):
+            raise HTTPException(status_code=400, detail="Upload the expenses in a 'file' field")
+        kind = bulk_import.media_type(upload.content_type or "", upload.filename or "")
+        body = await upload.read()
+    else:
+        kind = bulk_import.media_type(content_type)
+        body = await request.body()
+
+    rows, errors = bulk_import.parse_rows(body, kind)
+    if len(rows) + len(errors) > settings.bulk_import_max_rows:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most {settings.bulk_import_max_rows} rows per request"
+        )
+
+    # membership is checked once for every payer in the batch, and the rates once for every currency
+    member_ids = await crud.get_trip_member_ids(db, trip_id, list({row.payer_id for _, row in rows}))
+    trip_currency = (await db.execute(select(models.Trip.currency).filter(models.Trip.id == trip_id))).scalar_one()
+    created_at = currency_service.now()
+    day = created_at.date()
+    unconvertible = await db.run_sync(
+        currency_service.missing_rates, {row.currency or trip_currency for _, row in rows}, day, trip_currency
+    )
+    values = []
+    for number, row in rows:
+        currency = row.currency or trip_currency
+        if row.payer_id not in member_ids:
+            errors.append(schemas.BulkRowError(row=number, error="Payer is not member of the trip"))
+            continue
+        if currency in unconvertible:
+            errors.append(schemas.BulkRowError(row=number, error=unconvertible[currency]))
+            continue
+        values.append({
+            "trip_id": trip_id, "title": row.title, "amount": row.amount, "currency": currency,
+            "payer_id": row.payer_id, "note": row.note
+        })
+
+    # the whole batch is converted to the trip currency in one pass, at today's rates
+    base_amounts = await db.run_sync(
+        currency_service.convert_batch, [(value["amount"], value["currency"], day) for value in values], trip_currency
+    )
+    paid_by_payer, count_by_payer = defaultdict(int), defaultdict(int)
+    for value, base_amount in zip(values, base_amounts):
+        value["base_amount"] = base_amount
+        value["created_at"] = created_at
+        paid_by_payer[value["payer_id"]] += base_amount
+        count_by_payer[value["payer_id"]] += 1
+
+    # one executemany and one ledger update, committed together
+    if values:
+        await db.execute(insert(models.Expense.__table__), values)
+        await db.run_sync(lambda session: ledger.record_expenses(
+            session, trip_id, paid_by_payer, count=len(values), day=day, count_by_payer=count_by_payer
         ))
-    
-    return schemas.TripSummaryResponse(
-        trip_id=trip.id,
-        trip_name=trip.name,
-        total_expenses=round(total_expense, 2),
-        summary=summary
+        await db.commit()
+        await events.publish_change(db, trip_id, "expenses.imported", inserted=len(values))
+
+    errors.sort(key=lambda error: error.row)
+    return schemas.BulkImportResponse(inserted=len(values), errors=errors)
+
+
+@router.get("/{trip_id}/events")
+async def trip_events(
+    trip_id: int,
+    token: str = Depends(oauth2_scheme),
+    current_user: models.User = Depends(require_trip_member)
+):
+    # the database session is closed before streaming starts, an idle feed holds no connection
+    return StreamingResponse(
+        events.sse_stream(trip_id, current_user.id, token_expiry(token)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
+
+
+@router.websocket("/{trip_id}/ws")
+async def trip_events_websocket(websocket: WebSocket, trip_id: int, token: Optional[str] = None):
+    # browsers can't set headers on a WebSocket, so the token may also come as ?token=
+    scheme, _, credentials = websocket.headers.get("authorization", "").partition(" ")
+    token = token or (credentials if scheme.lower() == "bearer" else None)
+    user = await authenticate_trip_member(token, trip_id)
+    if user is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    await websocket.accept()
+    await events.websocket_feed(websocket, trip_id, user.id, token_expiry(token))
@@ -1,37 +1,107 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from datetime import date
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.ext.asyncio import AsyncSession
 from app import schemas, crud, models
-from app.database import SessionLocal
+from app.database import get_db, get_read_db
 from fastapi.security import OAuth2PasswordRequestForm
-from app.auth import verify_password, create_access_token, get_current_user
+from app.auth import create_access_token, get_current_user_read, invalidate_user
+from app.passwords import verify_password
+from app.responses import ORJSONResponse
+from app.routers.trips import list_trips
 from app.schemas import Token
+from app.config import settings
+from app.services import currency as currency_service
+from app.services import analytics, ledger
+from app.services.settlement import counterparty_balances
 
 router = APIRouter(prefix="/users", tags=["users"])
 
-# Dependency to get db session
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 @router.post("/signup", response_model=schemas.UserResponse)
-def signup(user: schemas.UserCreate, db:Session = Depends(get_db)):
-    db_user = crud.get_user_by_email(db, user.email)
+async def signup(user: schemas.UserCreate, db:AsyncSession = Depends(get_db)):
+    db_user = await crud.get_user_by_email(db, user.email)
     if db_user:
         raise HTTPException(status_code=400, detail="User already exist")
-    return crud.create_user(db=db, user=user)
+    return await crud.create_user(db=db, user=user)
 
 
 @router.post("/login", response_model=Token)
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = crud.get_user_by_email(db, email=form_data.username)
-    if not user or not verify_password(form_data.password, user.hashed_password):
-        return HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credential")
-    access_token = create_access_token(data={"sub": user.email})
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
+    user = await crud.get_user_by_email(db, email=form_data.username)
+    if not user:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credential")
+    valid, new_hash = await verify_password(form_data.password, user.hashed_password)
+    if not valid:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credential")
+    # the work factor changed since this hash was made, store it with the current rounds
+    if new_hash:
+        user.hashed_password = new_hash
+        await db.commit()
+        invalidate_user(user.id)
+    access_token = create_access_token(data={"sub": user.email, "uid": user.id})
     return {"access_token": access_token, "token_type": "bearer"}
 
 @router.get("/me", response_model=schemas.UserResponse)
-def read_users_me(current_user: models.User = Depends(get_current_user)):
+async def read_users_me(current_user: models.User = Depends(get_current_user_read)):
     return current_user
+
+# the same handler as GET /trips/, so the two lists can't drift apart
+router.get("/me/trips", response_model=List[schemas.TripListItem], response_model_exclude_unset=True)(list_trips)
+
+@router.get("/me/balances", response_model=schemas.UserBalancesResponse)
+async def read_my_balances(
+    by_counterparty: bool = False,
+    db: AsyncSession = Depends(get_read_db),
+    current_user: models.User = Depends(get_current_user_read)
+):
+    # per-trip balances come from the ledger in one query, in each trip's currency;
+    # the overall net converts them all in one pass, leaving out trips without a rate
+    rows = await db.run_sync(ledger.get_user_balances, current_user.id)
+    day = currency_service.today()
+    nets = await db.run_sync(
+        currency_service.convert_batch, [(row.net, row.currency, day) for row in rows], settings.default_currency,
+        False
+    )
+    response = schemas.UserBalancesResponse(
+        currency=settings.default_currency,
+        net=sum(net for net in nets if net is not None),
+        unconverted_trip_ids=[row.trip_id for row, net in zip(rows, nets) if net is None],
+        trips=[schemas.UserTripBalance(
+            trip_id=row.trip_id, trip_name=row.trip_name, currency=row.currency,
+            paid=row.paid, share=row.share, net=row.net
+        ) for row in rows]
+    )
+    if by_counterparty:
+        rows = await db.run_sync(lambda session: counterparty_balances(current_user.id, session))
+        response.counterparties = [schemas.CounterpartyBalance(**row) for row in rows]
+    return response
+
+@router.get("/me/spending", response_model=schemas.UserSpendingResponse, response_model_exclude_none=True)
+async def read_my_spending(
+    granularity: schemas.Granularity = schemas.Granularity.month,
+    date_from: Optional[date] = Query(None, description="first UTC day, inclusive"),
+    date_to: Optional[date] = Query(None, description="last UTC day, inclusive"),
+    by_trip: bool = False,
+    db: AsyncSession = Depends(get_read_db),
+    current_user: models.User = Depends(get_current_user_read)
+):
+    # what the user paid per trip and day, from the rollup; each day is converted
+    # at its own rate in one pass, then the days are added up per period.
+    # Days without a rate are left out and their trips reported.
+    rows = await db.run_sync(analytics.get_user_spending, current_user.id, date_from, date_to)
+    amounts = await db.run_sync(
+        currency_service.convert_batch,
+        [(row.amount, row.currency, row.day) for row in rows],
+        settings.default_currency,
+        False
+    )
+    converted = [(row, amount) for row, amount in zip(rows, amounts) if amount is not None]
+    points = analytics.bucket(
+        ((row.day, row.trip_id, amount, row.expense_count) for row, amount in converted),
+        granularity, "trip_id" if by_trip else None
+    )
+    unconverted = sorted({row.trip_id for row, amount in zip(rows, amounts) if amount is None})
+    return ORJSONResponse({
+        "currency": settings.default_currency, "granularity": granularity.value, "points": points,
+        "unconverted_trip_ids": unconverted
+    })
@@ -1,6 +1,11 @@
-from typing import Optional, List
-from pydantic import BaseModel, EmailStr, Field
-from datetime import datetime
+from enum import Enum
+from typing import Annotated, Optional, List
+from pydantic import BaseModel, ConfigDict, EmailStr, Field
+from datetime import date, datetime
+from decimal import Decimal
+
+# ISO 4217 code such as USD or EUR
+CurrencyCode = Annotated[str, Field(pattern=r"^[A-Z]{3}$")]
 
 class UserBase(BaseModel):
     name: str
@@ -12,8 +17,7 @@ class UserCreate(UserBase):
 class UserResponse(UserBase):
     id: int
 
-    class Config:
-        orm_mode=True
+    model_config = ConfigDict(from_attributes=True)
 
 class Token(BaseModel):
     access_token: str
@@ -23,51 +27,91 @@ class TripBase(BaseModel):
     name:str
 
 class TripCreate(TripBase):
-    pass
+    # defaults to the DEFAULT_CURRENCY setting
+    currency: Optional[CurrencyCode] = None
 
 class TripResponse(TripBase):
     id: int
     creator_id: int
+    currency: str
+
+    model_config = ConfigDict(from_attributes=True)
 
-    class Config:
-        orm_mode=True
+class TripSort(str, Enum):
+    activity = "activity"
+    created = "created"
+    name = "name"
 
 class UserSimple(BaseModel):
     id: int
     name: str
     email: EmailStr
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
+
+class TripListItem(TripResponse):
+    created_at: Optional[datetime] = None
+    total_amount: int
+    expense_count: int
+    last_expense_at: Optional[datetime] = None
+    # only sent with ?with_members=true
+    members: Optional[list[UserSimple]] = None
 
 class TripDetail(TripResponse):
     members: list[UserSimple] = []
 
+class SplitType(str, Enum):
+    equal = "equal"
+    exact = "exact"
+    percent = "percent"
+    shares = "shares"
+
+class SplitEntry(BaseModel):
+    user_id: int
+    # cents for exact, a percentage for percent, a weight for shares; not used for equal
+    value: Optional[Decimal] = None
+
+# all money amounts are integers in minor units (cents), e.g. 1050 is 10.50
 class ExpenseCreate(BaseModel):
     trip_id: int
     title: str
-    amount: float
+    amount: int
+    # defaults to the trip currency
+    currency: Optional[CurrencyCode] = None
     payer_id: int
+    # without splits the expense is shared equally by all trip members
+    split_type: SplitType = SplitType.equal
+    splits: Optional[List[SplitEntry]] = None
 
 class ExpenseResponse(BaseModel):
     id: int
     trip_id: int
     title: str
-    amount: float
+    amount: int
+    currency: str
+    # amount in the trip currency, at the rate of the expense's day
+    base_amount: int
     payer_id: int
     created_at: datetime
     note: Optional[str] = None
 
-    class Config:
-        orm_mode: True
+    model_config = ConfigDict(from_attributes=True)
+
+class ExpenseSplitResponse(BaseModel):
+    user_id: int
+    # in the expense currency
+    amount: int
+
+class ExpenseDetailResponse(ExpenseResponse):
+    # empty when the expense is shared equally by all trip members
+    splits: List[ExpenseSplitResponse] = []
 
 class Settlement(BaseModel):
     from_user: str = Field(..., alias="from")
     to_user: str = Field(..., alias="to")
-    amount: float
+    amount: int
 
-    class Config:
-        allow_population_by_field_name = True
+    model_config = ConfigDict(populate_by_name=True)
 
 class AddMemberByEmailRequest(BaseModel):
     email: str
@@ -80,21 +124,103 @@ class UpdateExpenseNote(BaseModel):
     
 class TripUserSummary(BaseModel):
     user: str
-    paid: float
-    share: float
-    balance: float
+    paid: int
+    share: int
+    balance: int
 
 class TripSummaryResponse(BaseModel):
     trip_id: int
     trip_name: str
-    total_expenses: float
+    # every amount of the summary is in the trip currency
+    currency: str
+    total_expenses: int
     summary: List[TripUserSummary]
     
+class UserTripBalance(BaseModel):
+    trip_id: int
+    trip_name: str
+    # paid, share and net are in the trip currency
+    currency: str
+    paid: int
+    share: int
+    net: int
+
+class CounterpartyBalance(BaseModel):
+    # positive: this user owes you, negative: you owe them
+    user_id: int
+    name: str
+    net: int
+
+class UserBalancesResponse(BaseModel):
+    # net and counterparties are converted to this currency (DEFAULT_CURRENCY) at the latest rates
+    currency: str
+    net: int
+    trips: List[UserTripBalance]
+    # trips in a currency without a rate today, left out of net
+    unconverted_trip_ids: List[int] = []
+    counterparties: Optional[List[CounterpartyBalance]] = None
+    
 class ExpenseUpdate(BaseModel):
-    title: Optional[str]
-    amount: Optional[float]
-    payer_id: Optional[int]
+    # only the fields sent are changed
+    title: Optional[str] = None
+    amount: Optional[int] = None
+    payer_id: Optional[int] = None
     note: Optional[str] = None
+    currency: Optional[CurrencyCode] = None
+    # replace the split; when only the amount changes an itemized split keeps its proportions
+    split_type: Optional[SplitType] = None
+    splits: Optional[List[SplitEntry]] = None
     
 
+class BulkExpenseRow(BaseModel):
+    title: str
+    amount: int
+    payer_id: int
+    # defaults to the trip currency
+    currency: Optional[CurrencyCode] = None
+    note: Optional[str] = None
 
+class BulkRowError(BaseModel):
+    row: int
+    error: str
+
+class BulkImportResponse(BaseModel):
+    inserted: int
+    errors: List[BulkRowError]
+
+class ListFormat(str, Enum):
+    json = "json"
+    ndjson = "ndjson"
+
+class ExportMode(str, Enum):
+    breakdown = "breakdown"
+    ledger = "ledger"
+
+class Granularity(str, Enum):
+    day = "day"
+    week = "week"
+    month = "month"
+
+class SpendingPoint(BaseModel):
+    # first day of the period: the day itself, the Monday of the week or the 1st of the month
+    period: date
+    # only with by_payer / by_trip
+    payer_id: Optional[int] = None
+    trip_id: Optional[int] = None
+    amount: int
+    expense_count: int
+
+class TripSpendingResponse(BaseModel):
+    trip_id: int
+    # amounts are in the trip currency
+    currency: str
+    granularity: Granularity
+    points: List[SpendingPoint]
+
+class UserSpendingResponse(BaseModel):
+    # what the user paid, converted to this currency (DEFAULT_CURRENCY) at the rate of each day
+    currency: str
+    granularity: Granularity
+    points: List[SpendingPoint]
+    # trips with days in a currency without a rate, left out of the points
+    unconverted_trip_ids: List[int] = []
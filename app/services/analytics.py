@@ -0,0 +1,196 @@
+"""Spending over time, from the daily_spending rollup.
+
+The ledger keeps one row per (trip, payer, UTC day) with the day's total and
+number of expenses, updated in the same transaction as the expense. A series
+reads those rows, at most one per member and day, and adds them up into
+days, ISO weeks (starting Monday) or calendar months in Python; the expenses
+table is never scanned. Amounts are in the trip currency, like the ledger's.
+
+    python -m app.services.analytics backfill
+    python -m app.services.analytics verify --trip-id 1
+"""
+import argparse
+from datetime import date, timedelta
+from typing import Optional
+
+from sqlalchemy import Date, delete, func, insert, select
+from sqlalchemy.orm import Session
+
+from app import models, schemas
+from app.database import dialect_insert
+
+
+def record_spending(
+    db: Session, trip_id: int, day: date, paid_by_payer: dict[int, int], count_by_payer: dict[int, int]
+):
+    """Add paid amounts and expense counts (negative to take expenses out) to the payers' rows for day.
+
+    One upsert adds to the rows, so concurrent writers of a day never race to
+    create the same row.
+    """
+    payer_ids = paid_by_payer.keys() | count_by_payer.keys()
+    if not payer_ids:
+        return
+    rollup = models.DailySpending.__table__
+    statement = dialect_insert(db, rollup)
+    statement = statement.on_conflict_do_update(
+        index_elements=[rollup.c.trip_id, rollup.c.day, rollup.c.payer_id],
+        set_={
+            "amount": rollup.c.amount + statement.excluded.amount,
+            "expense_count": rollup.c.expense_count + statement.excluded.expense_count,
+        },
+    )
+    db.execute(statement, [
+        {"trip_id": trip_id, "payer_id": payer_id, "day": day,
+         "amount": paid_by_payer.get(payer_id, 0), "expense_count": count_by_payer.get(payer_id, 0)}
+        for payer_id in sorted(payer_ids)
+    ])
+    if any(count < 0 for count in count_by_payer.values()):
+        # a day without expenses has no row, the same as backfill leaves it
+        db.execute(delete(rollup).where(
+            rollup.c.trip_id == trip_id, rollup.c.day == day,
+            rollup.c.payer_id.in_(payer_ids), rollup.c.expense_count == 0,
+        ))
+
+
+def _grouped(trip_id: Optional[int] = None):
+    """(trip_id, payer_id, day, amount, expense_count) per payer and day, grouped from `expenses`."""
+    expense = models.Expense
+    day = func.date(expense.created_at, type_=Date)
+    query = (
+        select(expense.trip_id, expense.payer_id, day, func.sum(expense.base_amount), func.count())
+        .filter(expense.payer_id.is_not(None))
+        .group_by(expense.trip_id, expense.payer_id, day)
+    )
+    if trip_id is not None:
+        query = query.filter(expense.trip_id == trip_id)
+    return query
+
+
+def backfill(db: Session, trip_id: Optional[int] = None):
+    """Refill daily_spending from `expenses` with one INSERT ... SELECT, for one trip or all of them."""
+    rollup = models.DailySpending
+    clear = delete(rollup)
+    if trip_id is not None:
+        clear = clear.filter(rollup.trip_id == trip_id)
+    db.execute(clear)
+    db.execute(insert(rollup).from_select(
+        ["trip_id", "payer_id", "day", "amount", "expense_count"], _grouped(trip_id)
+    ))
+
+
+def verify(db: Session, trip_id: Optional[int] = None):
+    """Compare daily_spending with `expenses` and return a list of mismatches."""
+    expected = {
+        (row[0], row[1], row[2]): (row[3], row[4]) for row in db.execute(_grouped(trip_id))
+    }
+    rollup = models.DailySpending
+    query = select(rollup.trip_id, rollup.payer_id, rollup.day, rollup.amount, rollup.expense_count)
+    if trip_id is not None:
+        query = query.filter(rollup.trip_id == trip_id)
+    stored = {(row[0], row[1], row[2]): (row[3], row[4]) for row in db.execute(query)}
+    return [
+        {"trip_id": key[0], "payer_id": key[1], "day": key[2], "expected": expected.get(key), "stored": stored.get(key)}
+        for key in sorted(expected.keys() | stored.keys())
+        if expected.get(key) != stored.get(key)
+    ]
+
+
+def _in_range(query, date_from: Optional[date], date_to: Optional[date]):
+    if date_from is not None:
+        query = query.filter(models.DailySpending.day >= date_from)
+    if date_to is not None:
+        query = query.filter(models.DailySpending.day <= date_to)
+    return query
+
+
+def get_trip_spending(db: Session, trip_id: int, date_from: Optional[date] = None, date_to: Optional[date] = None):
+    """(day, payer_id, amount, expense_count) rows of a trip between two inclusive days, in day order."""
+    rollup = models.DailySpending
+    query = (
+        select(rollup.day, rollup.payer_id, rollup.amount, rollup.expense_count)
+        .filter(rollup.trip_id == trip_id)
+        .order_by(rollup.day, rollup.payer_id)
+    )
+    return db.execute(_in_range(query, date_from, date_to)).all()
+
+
+def get_user_spending(db: Session, user_id: int, date_from: Optional[date] = None, date_to: Optional[date] = None):
+    """(day, trip_id, currency, amount, expense_count) rows of what a user paid in all their trips, in day order.
+
+    Amounts are in each trip's currency.
+    """
+    rollup = models.DailySpending
+    query = (
+        select(rollup.day, rollup.trip_id, models.Trip.currency, rollup.amount, rollup.expense_count)
+        .join(models.Trip, models.Trip.id == rollup.trip_id)
+        .filter(rollup.payer_id == user_id)
+        .order_by(rollup.day, rollup.trip_id)
+    )
+    return db.execute(_in_range(query, date_from, date_to)).all()
+
+
+def period_start(day: date, granularity: schemas.Granularity) -> date:
+    """First day of the day, ISO week or month that day falls in."""
+    if granularity == schemas.Granularity.week:
+        return day - timedelta(days=day.weekday())
+    if granularity == schemas.Granularity.month:
+        return day.replace(day=1)
+    return day
+
+
+def bucket(items, granularity: schemas.Granularity, group_by: Optional[str] = None) -> list[dict]:
+    """Add up (day, group, amount, expense_count) items into periods, oldest first.
+
+    With group_by there is one point per period and group, the group under that
+    key; without it the groups of a period are added together.
+    """
+    totals = {}
+    for day, group, amount, count in items:
+        key = (period_start(day, granularity), group if group_by else None)
+        total = totals.get(key)
+        if total is None:
+            totals[key] = [amount, count]
+        else:
+            total[0] += amount
+            total[1] += count
+    points = []
+    for (period, group), (amount, count) in sorted(totals.items(), key=lambda item: (item[0][0], item[0][1] or 0)):
+        point = {"period": period, group_by: group} if group_by else {"period": period}
+        point["amount"] = amount
+        point["expense_count"] = count
+        points.append(point)
+    return points
+
+
+def main():
+    from app.database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Backfill or verify the daily spending rollup")
+    parser.add_argument("command", choices=["backfill", "verify"])
+    parser.add_argument("--trip-id", type=int, help="only this trip (default: all trips)")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        if args.command == "backfill":
+            backfill(db, args.trip_id)
+            db.commit()
+            query = select(func.count()).select_from(models.DailySpending)
+            if args.trip_id is not None:
+                query = query.filter(models.DailySpending.trip_id == args.trip_id)
+            print(f"Backfilled {db.execute(query).scalar()} daily row(s)")
+            return 0
+
+        problems = verify(db, args.trip_id)
+        for problem in problems:
+            print(f"trip {problem['trip_id']} payer {problem['payer_id']} {problem['day']}: "
+                  f"expected {problem['expected']}, stored {problem['stored']}")
+        print(f"{len(problems)} mismatch(es)")
+        return 1 if problems else 0
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
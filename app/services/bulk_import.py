@@ -0,0 +1,84 @@
+"""Parsing and validation for bulk expense imports.
+
+Rows arrive as a JSON array, NDJSON (one object per line) or CSV with a header
+row (title,amount,payer_id[,currency][,note]; the columns in any order, an
+empty currency meaning the trip's). Every row is validated on its own so a
+bad line is reported back with its position instead of failing the batch.
+"""
+import csv
+import json
+from io import StringIO
+
+from fastapi import HTTPException, status
+from pydantic import ValidationError
+
+from app import schemas
+
+JSON_TYPES = {"application/json"}
+NDJSON_TYPES = {"application/x-ndjson", "application/ndjson", "application/jsonl"}
+CSV_TYPES = {"text/csv", "application/csv"}
+
+
+def media_type(content_type: str, filename: str = "") -> str:
+    """Map a Content-Type (or an upload's file extension) to json, ndjson or csv."""
+    content_type = content_type.split(";")[0].strip().lower()
+    if content_type in JSON_TYPES or filename.endswith(".json"):
+        return "json"
+    if content_type in NDJSON_TYPES or filename.endswith((".ndjson", ".jsonl")):
+        return "ndjson"
+    if content_type in CSV_TYPES or filename.endswith(".csv"):
+        return "csv"
+    raise HTTPException(
+        status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+        detail="Send a JSON array, NDJSON or CSV",
+    )
+
+
+def _error_message(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in item['loc']) or 'row'}: {item['msg']}" for item in error.errors()
+    )
+
+
+def _raw_rows(body: str, kind: str):
+    """Yield (row number, dict or error message) for every row in the body. Rows count from 1."""
+    if kind == "json":
+        try:
+            rows = json.loads(body)
+        except json.JSONDecodeError as exc:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid JSON: {exc}")
+        if not isinstance(rows, list):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Expected a JSON array of expenses")
+        yield from enumerate(rows, start=1)
+    elif kind == "ndjson":
+        for number, line in enumerate(body.splitlines(), start=1):
+            if not line.strip():
+                continue
+            try:
+                yield number, json.loads(line)
+            except json.JSONDecodeError as exc:
+                yield number, f"Invalid JSON: {exc}"
+    else:
+        # row numbers are data rows, the header line is not counted
+        for number, row in enumerate(csv.DictReader(StringIO(body)), start=1):
+            # empty CSV cells mean "not given", so an empty note stays null
+            yield number, {key: value for key, value in row.items() if key and value not in ("", None)}
+
+
+def parse_rows(body: bytes, kind: str):
+    """Return (valid rows as BulkExpenseRow with their row numbers, per-row errors)."""
+    try:
+        text = body.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Body must be UTF-8")
+
+    rows, errors = [], []
+    for number, raw in _raw_rows(text, kind):
+        if isinstance(raw, str):
+            errors.append(schemas.BulkRowError(row=number, error=raw))
+            continue
+        try:
+            rows.append((number, schemas.BulkExpenseRow.model_validate(raw)))
+        except ValidationError as exc:
+            errors.append(schemas.BulkRowError(row=number, error=_error_message(exc)))
+    return rows, errors
@@ -0,0 +1,278 @@
+"""Currency conversion from the local `exchange_rates` table.
+
+Rates come from date-stamped CSV snapshots, there is no live rate service. An
+amount is converted with the latest rate on or before its day (snapshots have
+no weekend rates), through settings.exchange_rate_reference, the currency
+every rate is quoted against.
+
+convert_batch converts a whole batch in one pass: rates are looked up per
+(currency, day) in an in-memory cache and whatever is missing is loaded with
+a single query for the batch, never per row.
+
+    python -m app.services.currency load rates.csv
+    python -m app.services.currency reconvert --trip-id 1
+"""
+import argparse
+import bisect
+import csv
+from collections import defaultdict
+from datetime import date, datetime, timezone
+from decimal import ROUND_HALF_EVEN, Decimal, InvalidOperation
+from typing import Optional
+
+from fastapi import HTTPException, status
+from sqlalchemy import and_, delete, func, insert, select, update
+from sqlalchemy.orm import Session, aliased
+
+from app import models
+from app.config import settings
+from app.services import ledger
+from app.services.cache import LRUCache
+from app.services.splits import rescale
+
+BATCH = 10_000
+
+# ISO 4217 minor units where they aren't 2; amounts are always in minor units
+MINOR_UNITS = {
+    "BHD": 3, "BIF": 0, "CLP": 0, "DJF": 0, "GNF": 0, "IQD": 3, "ISK": 0, "JOD": 3, "JPY": 0, "KMF": 0,
+    "KRW": 0, "KWD": 3, "LYD": 3, "OMR": 3, "PYG": 0, "RWF": 0, "TND": 3, "UGX": 0, "UYI": 0, "VND": 0,
+    "VUV": 0, "XAF": 0, "XOF": 0, "XPF": 0,
+}
+
+# (currency, day) -> rate in effect that day
+rate_cache = LRUCache(
+    "exchange_rates", maxsize=settings.exchange_rate_cache_size, ttl=settings.exchange_rate_cache_ttl_seconds
+)
+
+
+def now() -> datetime:
+    """UTC time to the second, what new expenses are stamped with (as CURRENT_TIMESTAMP would).
+
+    Stamping in Python means the day used for the rate and for the daily
+    spending rollup is exactly the day of the stored created_at.
+    """
+    return datetime.now(timezone.utc).replace(microsecond=0)
+
+
+def today() -> date:
+    return now().date()
+
+
+def convert(amount: int, from_currency: str, to_currency: str, from_rate: Decimal, to_rate: Decimal) -> int:
+    """Convert minor units between currencies given both rates against the reference currency."""
+    scale = Decimal(10) ** (MINOR_UNITS.get(to_currency, 2) - MINOR_UNITS.get(from_currency, 2))
+    converted = Decimal(amount) * to_rate * scale / from_rate
+    return int(converted.to_integral_value(rounding=ROUND_HALF_EVEN))
+
+
+def no_rate_error(currency: str, day: date) -> str:
+    return f"No exchange rate for {currency} on or before {day.isoformat()}"
+
+
+def get_rates(db: Session, pairs, strict: bool = True) -> dict:
+    """{(currency, day): rate} for every pair, from the cache or one query for all the misses.
+
+    A pair without a rate on or before its day is a 400, or without strict is
+    left out of the result.
+    """
+    rates, missing = {}, set()
+    for pair in pairs:
+        if pair[0] == settings.exchange_rate_reference:
+            rates[pair] = Decimal(1)
+            continue
+        rate = rate_cache.get(pair)
+        if rate is None:
+            missing.add(pair)
+        else:
+            rates[pair] = rate
+    if missing:
+        rates.update(_load_rates(db, missing))
+        unknown = sorted(missing - rates.keys())
+        if strict and unknown:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=no_rate_error(*unknown[0]))
+    return rates
+
+
+def missing_rates(db: Session, currencies, day: date, to_currency: str) -> dict[str, str]:
+    """{currency: error} for the currencies that can't be converted to to_currency on day.
+
+    The rates of all the others are loaded into the cache with the same single
+    query, ready for convert_batch.
+    """
+    pairs = {(currency, day) for currency in currencies if currency != to_currency}
+    if not pairs:
+        return {}
+    rates = get_rates(db, pairs | {(to_currency, day)}, strict=False)
+    if (to_currency, day) not in rates:
+        return {currency: no_rate_error(to_currency, day) for currency, _ in pairs}
+    return {currency: no_rate_error(currency, day) for currency, _ in pairs if (currency, day) not in rates}
+
+
+def _load_rates(db: Session, pairs: set) -> dict:
+    currencies = {currency for currency, _ in pairs}
+    first_day = min(day for _, day in pairs)
+    last_day = max(day for _, day in pairs)
+    # each currency's rates from its last one on or before first_day up to last_day
+    earlier = aliased(models.ExchangeRate)
+    start = (
+        select(func.max(earlier.date))
+        .filter(earlier.currency == models.ExchangeRate.currency, earlier.date <= first_day)
+        .scalar_subquery()
+    )
+    rows = db.execute(
+        select(models.ExchangeRate.currency, models.ExchangeRate.date, models.ExchangeRate.rate)
+        .filter(
+            models.ExchangeRate.currency.in_(currencies),
+            models.ExchangeRate.date <= last_day,
+            models.ExchangeRate.date >= func.coalesce(start, first_day),
+        )
+        .order_by(models.ExchangeRate.currency, models.ExchangeRate.date)
+    )
+    days, values = defaultdict(list), defaultdict(list)
+    for currency, day, rate in rows:
+        days[currency].append(day)
+        values[currency].append(Decimal(rate))
+
+    # pairs without a rate on or before their day are left out
+    rates = {}
+    for currency, day in pairs:
+        position = bisect.bisect_right(days[currency], day)
+        if not position:
+            continue
+        rates[(currency, day)] = values[currency][position - 1]
+        rate_cache.set((currency, day), rates[(currency, day)])
+    return rates
+
+
+def convert_batch(db: Session, items, to_currency: str, strict: bool = True) -> list[Optional[int]]:
+    """Convert [(amount, currency, day), ...] to to_currency, in order.
+
+    Amounts already in to_currency are passed through without a rate lookup.
+    A missing rate is a 400, or without strict makes that amount None.
+    """
+    pairs = set()
+    for _, currency, day in items:
+        if currency != to_currency:
+            pairs.update(((currency, day), (to_currency, day)))
+    rates = get_rates(db, pairs, strict) if pairs else {}
+    return [
+        amount if currency == to_currency
+        else convert(amount, currency, to_currency, rates[(currency, day)], rates[(to_currency, day)])
+        if (currency, day) in rates and (to_currency, day) in rates
+        else None
+        for amount, currency, day in items
+    ]
+
+
+def reconvert_trip(db: Session, trip_id: int):
+    """Recompute the base amounts of a trip's expenses and splits from the current rates, then rebuild its ledger."""
+    trip = db.get(models.Trip, trip_id)
+    expenses = db.execute(
+        select(models.Expense.id, models.Expense.amount, models.Expense.currency, models.Expense.created_at)
+        .filter(models.Expense.trip_id == trip_id)
+    ).all()
+    base_amounts = convert_batch(
+        db, [(row.amount, row.currency, row.created_at.date()) for row in expenses], trip.currency
+    )
+    base_by_expense = {row.id: base for row, base in zip(expenses, base_amounts)}
+
+    splits = defaultdict(dict)
+    for expense_id, user_id, amount in db.execute(
+        select(models.ExpenseSplit.expense_id, models.ExpenseSplit.user_id, models.ExpenseSplit.amount)
+        .filter(models.ExpenseSplit.trip_id == trip_id)
+    ):
+        splits[expense_id][user_id] = amount
+
+    # bulk UPDATEs by primary key, executemany in batches
+    expense_rows = [{"id": expense_id, "base_amount": base} for expense_id, base in base_by_expense.items()]
+    split_rows = [
+        {"expense_id": expense_id, "user_id": uid, "base_amount": cents}
+        for expense_id, split in splits.items()
+        for uid, cents in rescale(base_by_expense[expense_id], split).items()
+    ]
+    for model, rows in ((models.Expense, expense_rows), (models.ExpenseSplit, split_rows)):
+        for start in range(0, len(rows), BATCH):
+            db.execute(update(model), rows[start:start + BATCH])
+    ledger.rebuild_trip(db, trip_id)
+
+
+def _parse_rate(value: str):
+    try:
+        rate = Decimal(value.strip())
+    except InvalidOperation:
+        return None
+    return rate if rate.is_finite() and rate > 0 else None
+
+
+def read_csv(lines) -> list[dict]:
+    """Rates from a CSV snapshot, in long (date,currency,rate) or wide (Date,USD,JPY,...) layout.
+
+    The wide layout is what the ECB publishes; empty and N/A cells are skipped.
+    """
+    reader = csv.reader(lines)
+    header = [name.strip() for name in next(reader)]
+    rows = []
+    for line_number, record in enumerate(reader, start=2):
+        if not any(cell.strip() for cell in record):
+            continue
+        try:
+            day = date.fromisoformat(record[0].strip())
+        except ValueError:
+            raise ValueError(f"line {line_number}: invalid date {record[0]!r}")
+        if [name.lower() for name in header] == ["date", "currency", "rate"]:
+            cells = [(record[1].strip().upper(), record[2])]
+        else:
+            cells = [(currency.upper(), value) for currency, value in zip(header[1:], record[1:]) if currency]
+        for currency, value in cells:
+            rate = _parse_rate(value)
+            if rate is not None:
+                rows.append({"currency": currency, "date": day, "rate": rate})
+    return rows
+
+
+def load_rates(db: Session, rows: list[dict]):
+    """Store a snapshot: it replaces the stored rates of its currencies between its first and last day."""
+    if not rows:
+        return
+    currencies = {row["currency"] for row in rows}
+    days = [row["date"] for row in rows]
+    db.execute(delete(models.ExchangeRate).filter(and_(
+        models.ExchangeRate.currency.in_(currencies),
+        models.ExchangeRate.date.between(min(days), max(days)),
+    )))
+    for start in range(0, len(rows), BATCH):
+        db.execute(insert(models.ExchangeRate), rows[start:start + BATCH])
+    rate_cache.clear()
+
+
+def main():
+    from app.database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Load exchange rate snapshots and reconvert trips")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    load = subcommands.add_parser("load", help="load a CSV snapshot into exchange_rates")
+    load.add_argument("path")
+    reconvert = subcommands.add_parser("reconvert", help="recompute base amounts from the stored rates")
+    reconvert.add_argument("--trip-id", type=int, help="only this trip (default: all trips)")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        if args.command == "load":
+            with open(args.path, newline="", encoding="utf-8-sig") as snapshot:
+                rows = read_csv(snapshot)
+            load_rates(db, rows)
+            db.commit()
+            print(f"loaded {len(rows)} rates for {len({row['currency'] for row in rows})} currencies")
+        else:
+            trip_ids = [args.trip_id] if args.trip_id else [row.id for row in db.query(models.Trip.id)]
+            for trip_id in trip_ids:
+                reconvert_trip(db, trip_id)
+                db.commit()
+            print(f"reconverted {len(trip_ids)} trips")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
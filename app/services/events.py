@@ -0,0 +1,198 @@
+"""In-process pub/sub of trip changes, behind the SSE and WebSocket feeds.
+
+Routes that change a trip publish after they commit: what changed plus the
+trip's new totals and member balances, so clients update locally instead of
+polling the summary and expense list. Every event carries "type" and
+"trip_id":
+
+    expense.created / expense.updated   {"expense": {...same as the API response}}
+    expense.deleted                     {"expense_id": 1}
+    expenses.imported                   {"inserted": 500}
+    member.added / member.removed       {"user": {"id": 2, "name": "..."}} / {"user_id": 2}
+    trip.settled                        {}
+    resync                              the subscriber fell behind: refetch the trip, then skip
+                                        events whose revision is not newer than the fetched trip's
+    closed                              the feed ends (token expired or removed from the trip)
+
+Events are encoded once per publish, not once per subscriber. An idle
+subscriber is one small queue and one coroutine parked on it, with no timer
+of its own: a single ticker task sends keepalives to idle feeds and closes
+expired ones, so one event loop holds thousands of them. The bus lives in one
+process: with several workers a subscriber only sees changes made through its
+own worker.
+"""
+import asyncio
+import itertools
+import time
+from collections import defaultdict
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.websockets import WebSocketDisconnect
+
+from app import models
+from app.config import settings
+from app.responses import dumps
+from app.services import ledger
+
+# queued by the ticker to an idle feed, sent on as a keepalive
+KEEPALIVE = None
+
+
+class Event:
+    __slots__ = ("id", "type", "data", "sse")
+
+    def __init__(self, event_id: int, payload: dict):
+        self.id = event_id
+        self.type = payload["type"]
+        # JSON text for WebSocket messages, the full SSE frame for event streams
+        self.data = dumps(payload).decode()
+        self.sse = f"id: {event_id}\nevent: {self.type}\ndata: {self.data}\n\n"
+
+
+def _closed(trip_id: int, reason: str) -> Event:
+    return Event(0, {"type": "closed", "trip_id": trip_id, "reason": reason})
+
+
+class Subscription:
+    __slots__ = ("trip_id", "user_id", "expires_at", "queue")
+
+    def __init__(self, trip_id: int, user_id: int, expires_at: float):
+        self.trip_id = trip_id
+        self.user_id = user_id
+        self.expires_at = expires_at
+        self.queue = asyncio.Queue(maxsize=settings.event_queue_size)
+
+    def offer(self, event) -> bool:
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            return False
+        return True
+
+    def reset(self, event: Event):
+        # too far behind: drop the backlog, the client refetches instead
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(event)
+
+
+class EventBus:
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+        self._ids = itertools.count(1)
+        self._ticker = None
+
+    def subscribe(self, trip_id: int, user_id: int, expires_at: float) -> Subscription:
+        """Subscribe to a trip until expires_at. Must be called from the event loop that consumes the feed."""
+        subscription = Subscription(trip_id, user_id, expires_at)
+        self._subscribers[trip_id].add(subscription)
+        loop = asyncio.get_running_loop()
+        if self._ticker is None or self._ticker.done() or self._ticker.get_loop() is not loop:
+            self._ticker = loop.create_task(self._tick())
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscribers = self._subscribers.get(subscription.trip_id)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[subscription.trip_id]
+
+    def has_subscribers(self, trip_id: int) -> bool:
+        return trip_id in self._subscribers
+
+    def subscriber_count(self) -> int:
+        return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def publish(self, trip_id: int, payload: dict, user_id: int = None):
+        """Send payload to the trip's subscribers, or only to user_id's subscriptions when given."""
+        subscribers = [
+            subscription for subscription in self._subscribers.get(trip_id, ())
+            if user_id is None or subscription.user_id == user_id
+        ]
+        if not subscribers:
+            return
+        event, resync = Event(next(self._ids), payload), None
+        for subscription in subscribers:
+            if not subscription.offer(event):
+                if resync is None:
+                    resync = Event(next(self._ids), {"type": "resync", "trip_id": trip_id})
+                subscription.reset(resync)
+
+    async def _tick(self):
+        # one timer for every feed; a feed ends at most one tick after its token expires
+        while self._subscribers:
+            await asyncio.sleep(settings.event_keepalive_seconds)
+            now = time.time()
+            for subscribers in list(self._subscribers.values()):
+                for subscription in list(subscribers):
+                    if subscription.expires_at <= now:
+                        subscription.reset(_closed(subscription.trip_id, "token expired"))
+                    elif subscription.queue.empty():
+                        subscription.offer(KEEPALIVE)
+
+
+bus = EventBus()
+
+
+async def publish_change(db: AsyncSession, trip_id: int, event_type: str, **data):
+    """Publish a change with the trip's new totals and balances. Call after commit.
+
+    Nothing is read from the database when the trip has no subscribers.
+    """
+    if not bus.has_subscribers(trip_id):
+        return
+    trip = (await db.execute(
+        select(models.Trip.revision, models.Trip.total_amount, models.Trip.expense_count)
+        .filter(models.Trip.id == trip_id)
+    )).one()
+    rows = await db.run_sync(ledger.get_trip_balances, trip_id)
+    bus.publish(trip_id, {
+        "type": event_type,
+        "trip_id": trip_id,
+        **data,
+        "revision": trip.revision,
+        "total_amount": trip.total_amount,
+        "expense_count": trip.expense_count,
+        "balances": [
+            {"user_id": row.user_id, "paid": row.paid, "share": row.share, "net": row.net} for row in rows
+        ],
+    })
+
+
+def close_member(trip_id: int, user_id: int):
+    """End the feeds of a user who was removed from the trip."""
+    bus.publish(trip_id, {"type": "closed", "trip_id": trip_id, "reason": "removed from trip"}, user_id=user_id)
+
+
+async def _events(trip_id: int, user_id: int, expires_at: float):
+    """Yield a subscriber's events and keepalives (None) until a closed event, which is yielded last."""
+    subscription = bus.subscribe(trip_id, user_id, expires_at)
+    try:
+        while True:
+            event = await subscription.queue.get()
+            yield event
+            if event is not KEEPALIVE and event.type == "closed":
+                return
+    finally:
+        bus.unsubscribe(subscription)
+
+
+async def sse_stream(trip_id: int, user_id: int, expires_at: float):
+    """text/event-stream body: events, with a comment line as keepalive."""
+    yield f"retry: {settings.event_retry_ms}\n\n"
+    async for event in _events(trip_id, user_id, expires_at):
+        yield event.sse if event is not KEEPALIVE else ": keepalive\n\n"
+
+
+async def websocket_feed(websocket, trip_id: int, user_id: int, expires_at: float):
+    """Send events as JSON text messages; a ping message doubles as the keepalive."""
+    ping = dumps({"type": "ping", "trip_id": trip_id}).decode()
+    try:
+        async for event in _events(trip_id, user_id, expires_at):
+            # a client that has gone away is noticed at the next send, at most one keepalive later
+            await websocket.send_text(event.data if event is not KEEPALIVE else ping)
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
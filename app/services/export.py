@@ -0,0 +1,102 @@
+"""CSV export of a trip's expenses, produced row by row.
+
+Rows are read with a server-side cursor and written out in chunks as they
+arrive, so memory stays flat no matter how many expenses a trip has.
+"""
+import csv
+import zlib
+from io import StringIO
+
+from sqlalchemy import func, select
+
+from app import models
+from app.database import AsyncSessionLocal
+
+# rows fetched from the database per round trip
+YIELD_PER = 1000
+
+# totals are in the trip currency; ledger rows also carry the amount as entered
+BREAKDOWN_HEADER = ['User Name', 'No. of Expenses', 'Total Amount Spent']
+LEDGER_HEADER = ['Expense ID', 'Date', 'Title', 'Paid By', 'Amount', 'Note', 'Currency', 'Amount in Trip Currency']
+
+
+def breakdown_query(trip_id: int):
+    """Number of expenses and total paid per payer, in the trip currency."""
+    return (
+        select(
+            models.User.name.label("user_name"),
+            func.count(models.Expense.id).label("number_of_expenses"),
+            func.sum(models.Expense.base_amount).label("total_amount"),
+        )
+        .join(models.Expense, models.User.id == models.Expense.payer_id)
+        .filter(models.Expense.trip_id == trip_id)
+        .group_by(models.User.id)
+    )
+
+
+def ledger_query(trip_id: int):
+    """Every expense of the trip, oldest first."""
+    return (
+        select(
+            models.Expense.id,
+            models.Expense.created_at,
+            models.Expense.title,
+            models.User.name.label("payer_name"),
+            models.Expense.amount,
+            models.Expense.note,
+            models.Expense.currency,
+            models.Expense.base_amount,
+        )
+        .outerjoin(models.User, models.User.id == models.Expense.payer_id)
+        .filter(models.Expense.trip_id == trip_id)
+        .order_by(models.Expense.created_at, models.Expense.id)
+    )
+
+
+async def iter_csv(query, header: list[str], sessionmaker=AsyncSessionLocal):
+    """Yield the CSV text in chunks of up to YIELD_PER rows."""
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    yield buffer.getvalue()
+
+    # the request's session is closed before the body is sent, so streaming uses its own
+    async with sessionmaker() as session:
+        result = await session.stream(query.execution_options(yield_per=YIELD_PER))
+        async for rows in result.partitions():
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerows(rows)
+            yield buffer.getvalue()
+
+
+async def gzip_chunks(chunks):
+    """gzip an async stream of text chunks on the fly."""
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    async for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def accepts_gzip(accept_encoding: str) -> bool:
+    """Whether an Accept-Encoding header allows gzip: listed (or covered by *) with a q-value above 0."""
+    qualities = {}
+    for item in accept_encoding.split(","):
+        coding, *params = [part.strip() for part in item.split(";")]
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding.lower()] = quality
+    for coding in ("gzip", "x-gzip", "*"):
+        if coding in qualities:
+            return qualities[coding] > 0
+    return False
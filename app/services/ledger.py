@@ -0,0 +1,367 @@
+"""Per-trip balance ledger.
+
+Every expense and membership change goes through the functions below so that
+`trip_balances` always holds paid / share / net for each member, and the trip
+row its expense total, count and last activity. Callers make their changes and
+then commit once, so the ledger is updated in the same transaction as the
+expense or member row.
+
+Concurrent writers can't lose each other's changes: every write first takes
+the trip's lock (lock_trip) and holds it until commit, amounts are added in
+SQL (paid = paid + :x) rather than read, changed and written back, and shares
+are recomputed from the rows as they are under the lock.
+
+All amounts here are in the trip currency: callers pass the expenses'
+base_amount (see app.services.currency), never the amount as entered.
+Given the expenses' UTC day, the daily spending rollup (app.services.analytics)
+is updated along with the balances.
+"""
+import argparse
+from collections import defaultdict
+from datetime import date
+
+from sqlalchemy import case, delete, func, select, update
+from sqlalchemy.orm import Session
+
+from app import models
+from app.database import dialect_insert
+from app.services import analytics
+
+balances = models.TripBalance.__table__
+
+
+def lock_trip(db: Session, trip_id: int):
+    """Make the trip's ledger writers run one at a time, from here until the transaction ends.
+
+    Call it before reading anything a ledger change is computed from. SQLite has
+    a single writer, so there it takes the database write lock now (BEGIN
+    IMMEDIATE) unless this transaction already holds it by having written;
+    elsewhere it locks the trip row.
+    """
+    connection = db.connection()
+    if connection.dialect.name == "sqlite":
+        if not connection.connection.driver_connection.in_transaction:
+            connection.exec_driver_sql("BEGIN IMMEDIATE")
+    else:
+        db.execute(select(models.Trip.id).filter(models.Trip.id == trip_id).with_for_update())
+
+
+def _add_to_rows(db: Session, trip_id: int, paid_by_user: dict[int, int], split_by_user: dict[int, int]):
+    """Add to the members' paid and split_share in one upsert, creating missing rows."""
+    user_ids = paid_by_user.keys() | split_by_user.keys()
+    if not user_ids:
+        return
+    statement = dialect_insert(db, balances)
+    statement = statement.on_conflict_do_update(
+        index_elements=[balances.c.trip_id, balances.c.user_id],
+        set_={
+            "paid": balances.c.paid + statement.excluded.paid,
+            "split_share": balances.c.split_share + statement.excluded.split_share,
+        },
+    )
+    db.execute(statement, [
+        {"trip_id": trip_id, "user_id": uid, "paid": paid_by_user.get(uid, 0),
+         "split_share": split_by_user.get(uid, 0), "share": 0, "net": 0}
+        for uid in sorted(user_ids)
+    ])
+
+
+def touch_trip(db: Session, trip_id: int, amount: int = 0, expenses: int = 0, expense_activity: bool = False):
+    """Bump the trip revision so cached results for the old revision are no longer used.
+
+    amount and expenses adjust the trip's running total and expense count in the
+    same UPDATE; expense_activity also moves last_expense_at to now.
+    """
+    values = {models.Trip.revision: models.Trip.revision + 1}
+    if expense_activity:
+        values.update({
+            models.Trip.total_amount: models.Trip.total_amount + amount,
+            models.Trip.expense_count: models.Trip.expense_count + expenses,
+            models.Trip.last_expense_at: func.now(),
+        })
+    db.query(models.Trip).filter(models.Trip.id == trip_id).update(values)
+
+
+def split_equally(total: int, user_ids: list[int]):
+    """Split total cents between users; the leftover cents go one each to the lowest user ids."""
+    if not user_ids:
+        return {}
+    base, remainder = divmod(total, len(user_ids))
+    return {uid: base + (1 if position < remainder else 0) for position, uid in enumerate(sorted(user_ids))}
+
+
+def refresh_shares(db: Session, trip_id: int):
+    """Recompute every member's share and net: one aggregate query and one UPDATE.
+
+    Itemized expenses are already in split_share; whatever is left of the trip
+    total is split equally between the current members, the same as split_equally.
+    """
+    pooled, members = db.execute(
+        select(func.coalesce(func.sum(balances.c.paid - balances.c.split_share), 0), func.count())
+        .where(balances.c.trip_id == trip_id)
+    ).one()
+    if not members:
+        return
+    base, remainder = divmod(pooled, members)
+    # a member's position by user id; the leftover cents go one each to the lowest ids
+    other = balances.alias("other")
+    position = (
+        select(func.count()).select_from(other)
+        .where(other.c.trip_id == trip_id, other.c.user_id < balances.c.user_id)
+        .scalar_subquery()
+    )
+    share = balances.c.split_share + base + case((position < remainder, 1), else_=0)
+    db.execute(
+        update(balances).where(balances.c.trip_id == trip_id).values(share=share, net=balances.c.paid - share)
+    )
+
+
+def record_expense(
+    db: Session,
+    trip_id: int,
+    payer_id: int,
+    amount: int,
+    splits: dict[int, int] = None,
+    count: int = 1,
+    day: date = None,
+):
+    """Apply an expense to the ledger. To take it back out use a negative amount and splits and count=-1.
+
+    splits maps user_id -> cents for an itemized expense; without it the amount
+    is shared equally by all members. day is the UTC day of its created_at.
+    """
+    paid_by_payer = {payer_id: amount} if payer_id is not None else {}
+    count_by_payer = {payer_id: count} if payer_id is not None else {}
+    record_expenses(
+        db, trip_id, paid_by_payer, splits, count=count, amount=amount, day=day, count_by_payer=count_by_payer
+    )
+
+
+def record_expenses(
+    db: Session,
+    trip_id: int,
+    paid_by_payer: dict[int, int],
+    split_by_user: dict[int, int] = None,
+    count: int = 1,
+    amount: int = None,
+    day: date = None,
+    count_by_payer: dict[int, int] = None,
+):
+    """Apply many expenses at once: one row update per member and a single share refresh.
+
+    count is the number of expenses added (negative when removing) and amount
+    their total, by default the sum of paid_by_payer. When the expenses share a
+    UTC day, pass it along with count_by_payer to update the daily spending rollup.
+    """
+    lock_trip(db, trip_id)
+    _add_to_rows(db, trip_id, paid_by_payer, split_by_user or {})
+    if day is not None:
+        analytics.record_spending(db, trip_id, day, paid_by_payer, count_by_payer or {})
+    refresh_shares(db, trip_id)
+    if amount is None:
+        amount = sum(paid_by_payer.values())
+    touch_trip(db, trip_id, amount=amount, expenses=count, expense_activity=True)
+
+
+def add_member(db: Session, trip_id: int, user_id: int):
+    lock_trip(db, trip_id)
+    _add_to_rows(db, trip_id, {user_id: 0}, {})
+    refresh_shares(db, trip_id)
+    touch_trip(db, trip_id)
+
+
+def remove_member(db: Session, trip_id: int, user_id: int):
+    lock_trip(db, trip_id)
+    db.execute(delete(balances).where(balances.c.trip_id == trip_id, balances.c.user_id == user_id))
+    refresh_shares(db, trip_id)
+    touch_trip(db, trip_id)
+
+
+def get_trip_balances(db: Session, trip_id: int):
+    """Return (user_id, name, paid, share, net) rows for every member of the trip."""
+    return (
+        db.query(
+            models.TripBalance.user_id,
+            models.User.name,
+            models.TripBalance.paid,
+            models.TripBalance.share,
+            models.TripBalance.net,
+        )
+        .join(models.User, models.User.id == models.TripBalance.user_id)
+        .filter(models.TripBalance.trip_id == trip_id)
+        .order_by(models.TripBalance.user_id)
+        .all()
+    )
+
+
+def get_user_balances(db: Session, user_id: int):
+    """Return (trip_id, trip_name, currency, paid, share, net) for every trip the user is in.
+
+    Amounts are in each trip's currency, so they can't simply be added up across trips.
+    """
+    return (
+        db.query(
+            models.TripBalance.trip_id,
+            models.Trip.name.label("trip_name"),
+            models.Trip.currency,
+            models.TripBalance.paid,
+            models.TripBalance.share,
+            models.TripBalance.net,
+        )
+        .join(models.Trip, models.Trip.id == models.TripBalance.trip_id)
+        .filter(models.TripBalance.user_id == user_id)
+        .order_by(models.TripBalance.trip_id)
+        .all()
+    )
+
+
+def get_co_member_balances(db: Session, user_id: int):
+    """Return (trip_id, currency, user_id, name, net) for every member of every trip the user is in."""
+    user_trips = db.query(models.TripBalance.trip_id).filter(models.TripBalance.user_id == user_id)
+    return (
+        db.query(
+            models.TripBalance.trip_id,
+            models.Trip.currency,
+            models.TripBalance.user_id,
+            models.User.name,
+            models.TripBalance.net,
+        )
+        .join(models.User, models.User.id == models.TripBalance.user_id)
+        .join(models.Trip, models.Trip.id == models.TripBalance.trip_id)
+        .filter(models.TripBalance.trip_id.in_(user_trips.scalar_subquery()))
+        .order_by(models.TripBalance.trip_id, models.TripBalance.user_id)
+        .all()
+    )
+
+
+def compute_trip_balances(db: Session, trip_id: int):
+    """Recompute {user_id: (paid, split_share, share, net)} for a trip from `expenses` and `expense_splits`.
+
+    Amounts are summed per user in SQL, there is no Python work per expense.
+    """
+    member_ids = [
+        row.user_id
+        for row in db.query(models.trip_members.c.user_id).filter(models.trip_members.c.trip_id == trip_id)
+    ]
+    paid_by_user = defaultdict(int)
+    paid_rows = (
+        db.query(models.Expense.payer_id, func.sum(models.Expense.base_amount))
+        .filter(models.Expense.trip_id == trip_id)
+        .group_by(models.Expense.payer_id)
+    )
+    for payer_id, paid in paid_rows:
+        paid_by_user[payer_id] = paid or 0
+
+    split_by_user = defaultdict(int)
+    split_rows = (
+        db.query(models.ExpenseSplit.user_id, func.sum(models.ExpenseSplit.base_amount))
+        .filter(models.ExpenseSplit.trip_id == trip_id)
+        .group_by(models.ExpenseSplit.user_id)
+    )
+    for user_id, amount in split_rows:
+        split_by_user[user_id] = amount or 0
+
+    # what isn't itemized is split equally, same as refresh_shares
+    pooled = sum(paid_by_user[uid] - split_by_user[uid] for uid in member_ids)
+    shares = split_equally(pooled, member_ids)
+    balances = {}
+    for uid in member_ids:
+        share = split_by_user[uid] + shares[uid]
+        balances[uid] = (paid_by_user[uid], split_by_user[uid], share, paid_by_user[uid] - share)
+    return balances
+
+
+def compute_trip_totals(db: Session, trip_id: int):
+    """(total amount, number of expenses, newest created_at) of a trip straight from `expenses`."""
+    return (
+        db.query(
+            func.coalesce(func.sum(models.Expense.base_amount), 0),
+            func.count(models.Expense.id),
+            func.max(models.Expense.created_at),
+        )
+        .filter(models.Expense.trip_id == trip_id)
+        .one()
+    )
+
+
+def rebuild_trip(db: Session, trip_id: int):
+    lock_trip(db, trip_id)
+    db.execute(delete(balances).where(balances.c.trip_id == trip_id))
+    rows = [
+        {"trip_id": trip_id, "user_id": uid, "paid": paid, "split_share": split_share, "share": share, "net": net}
+        for uid, (paid, split_share, share, net) in compute_trip_balances(db, trip_id).items()
+    ]
+    if rows:
+        db.execute(balances.insert(), rows)
+    total_amount, expense_count, newest = compute_trip_totals(db, trip_id)
+    db.query(models.Trip).filter(models.Trip.id == trip_id).update({
+        models.Trip.total_amount: total_amount,
+        models.Trip.expense_count: expense_count,
+        models.Trip.last_expense_at: newest,
+    })
+    analytics.backfill(db, trip_id)
+    touch_trip(db, trip_id)
+
+
+def verify_trip(db: Session, trip_id: int):
+    """Compare the ledger with `expenses` and return a list of mismatches."""
+    expected = compute_trip_balances(db, trip_id)
+    stored = {
+        row.user_id: (row.paid, row.split_share, row.share, row.net)
+        for row in db.query(models.TripBalance).filter(models.TripBalance.trip_id == trip_id)
+    }
+    problems = []
+    for uid in sorted(set(expected) | set(stored)):
+        want = expected.get(uid)
+        have = stored.get(uid)
+        if want != have:
+            problems.append({"trip_id": trip_id, "user_id": uid, "expected": want, "stored": have})
+
+    # trip totals; last_expense_at is activity time and can't be recomputed
+    total_amount, expense_count, _ = compute_trip_totals(db, trip_id)
+    trip = db.get(models.Trip, trip_id)
+    if trip is not None and (trip.total_amount, trip.expense_count) != (total_amount, expense_count):
+        problems.append({
+            "trip_id": trip_id, "user_id": None,
+            "expected": (total_amount, expense_count), "stored": (trip.total_amount, trip.expense_count),
+        })
+    return problems
+
+
+def main():
+    from app.database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Rebuild or verify the trip balance ledger")
+    parser.add_argument("command", choices=["rebuild", "verify"])
+    parser.add_argument("--trip-id", type=int, help="only this trip (default: all trips)")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        if args.trip_id is not None:
+            trip_ids = [args.trip_id]
+        else:
+            trip_ids = [row.id for row in db.query(models.Trip.id).order_by(models.Trip.id)]
+
+        if args.command == "rebuild":
+            for trip_id in trip_ids:
+                rebuild_trip(db, trip_id)
+            db.commit()
+            print(f"Rebuilt ledger for {len(trip_ids)} trip(s)")
+            return 0
+
+        problems = []
+        for trip_id in trip_ids:
+            problems.extend(verify_trip(db, trip_id))
+        for problem in problems:
+            subject = "totals" if problem["user_id"] is None else f"user {problem['user_id']}"
+            print(f"trip {problem['trip_id']} {subject}: "
+                  f"expected {problem['expected']}, stored {problem['stored']}")
+        print(f"Checked {len(trip_ids)} trip(s), {len(problems)} mismatch(es)")
+        return 1 if problems else 0
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
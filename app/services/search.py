@@ -0,0 +1,125 @@
+"""Expense search: structured filters plus full-text search over title and note.
+
+Every structured filter is served by a composite index that starts with
+trip_id: (trip_id, created_at, id) for dates, (trip_id, payer_id, created_at,
+id) for a payer and (trip_id, base_amount) for amount ranges. Results come
+newest first, (created_at, id) descending, with keyset cursors.
+
+On SQLite the text goes to the FTS5 table expenses_fts (app.models), kept in
+sync by triggers. Besides title and note it indexes a "t<trip_id>" token, so
+the MATCH only yields the trip's own expenses instead of every match in the
+database. Other databases fall back to case-insensitive LIKE.
+
+    python -m app.services.search rebuild
+"""
+import argparse
+import re
+from datetime import date, datetime, time, timedelta
+from typing import Optional
+
+from sqlalchemy import column, literal, select, table, text, tuple_
+from sqlalchemy.orm import Session
+
+from app import models
+from app.pagination import decode_cursor
+
+WORD = re.compile(r"\w+")
+
+
+def fts_match(trip_id: int, words: list[str]) -> str:
+    """FTS5 query for the trip's expenses whose title or note has every word, as a prefix."""
+    # \w+ words hold no quotes, so quoting them is enough to keep FTS5 syntax out of user input
+    terms = " AND ".join(f'"{word}"*' for word in words)
+    return f"trip : t{trip_id} AND {{title note}} : ({terms})"
+
+
+def _at(day: date):
+    # bound like the column is stored, see models.SQLiteSeconds
+    return literal(datetime.combine(day, time.min), models.Expense.created_at.type)
+
+
+def search_query(
+    trip_id: int,
+    fields: list[str],
+    cursor: Optional[str] = None,
+    q: Optional[str] = None,
+    payer_id: Optional[int] = None,
+    min_amount: Optional[int] = None,
+    max_amount: Optional[int] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    fulltext: bool = True,
+):
+    """Columns of the trip's matching expenses, newest first, starting after the cursor.
+
+    Amounts are base amounts (the trip currency). date_from and date_to are
+    inclusive UTC days. fulltext=False searches the text with LIKE.
+    """
+    expense = models.Expense
+    # created_at and id are always selected, the next cursor is built from them
+    columns = [getattr(expense, name) for name in dict.fromkeys(fields + ["created_at", "id"])]
+    query = (
+        select(*columns)
+        .filter(expense.trip_id == trip_id)
+        .order_by(expense.created_at.desc(), expense.id.desc())
+    )
+    if payer_id is not None:
+        query = query.filter(expense.payer_id == payer_id)
+    if min_amount is not None:
+        query = query.filter(expense.base_amount >= min_amount)
+    if max_amount is not None:
+        query = query.filter(expense.base_amount <= max_amount)
+    if date_from is not None:
+        query = query.filter(expense.created_at >= _at(date_from))
+    if date_to is not None:
+        query = query.filter(expense.created_at < _at(date_to + timedelta(days=1)))
+
+    words = WORD.findall(q or "")
+    if words and fulltext:
+        matches = (
+            select(column("rowid"))
+            .select_from(table("expenses_fts"))
+            .where(text("expenses_fts MATCH :match").bindparams(match=fts_match(trip_id, words)))
+        )
+        query = query.filter(expense.id.in_(matches))
+    elif words:
+        for word in words:
+            query = query.filter(
+                expense.title.icontains(word, autoescape=True) | expense.note.icontains(word, autoescape=True)
+            )
+
+    if cursor:
+        created_at, expense_id = decode_cursor(cursor, datetime, int)
+        query = query.filter(tuple_(expense.created_at, expense.id) < tuple_(
+            literal(created_at, expense.created_at.type), literal(expense_id)
+        ))
+    return query
+
+
+def rebuild_index(db: Session):
+    """Refill expenses_fts from expenses, e.g. after loading rows with the triggers missing."""
+    db.execute(text("INSERT INTO expenses_fts(expenses_fts) VALUES ('delete-all')"))
+    db.execute(text(
+        "INSERT INTO expenses_fts(rowid, title, note, trip) SELECT id, title, note, 't' || trip_id FROM expenses"
+    ))
+    db.execute(text("INSERT INTO expenses_fts(expenses_fts) VALUES ('optimize')"))
+
+
+def main():
+    from app.database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Maintain the expense full-text index (SQLite)")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        rebuild_index(db)
+        db.commit()
+        print(f"Indexed {db.query(models.Expense).count()} expense(s)")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,79 +1,80 @@
+from collections import defaultdict
+from itertools import groupby
+
 from sqlalchemy.orm import Session
 from app import models
-from datetime import datetime
+from app.config import settings
+from app.services import currency as currency_service
+from app.services import ledger
+from app.services.cache import LRUCache
+from app.services.settlement_engine import SettlementStrategy, settle
 from fastapi import HTTPException, status
 
-def calculate_settlement(trip_id: int, db: Session):
-    from collections import defaultdict
+# keyed by (trip_id, trip revision, strategy); any expense or member change bumps
+# the revision, so stale entries are simply never asked for again and age out
+settlement_cache = LRUCache("settlement", maxsize=settings.settlement_cache_size)
 
+def calculate_settlement(trip_id: int, db: Session, strategy: SettlementStrategy = SettlementStrategy.greedy):
+    """Work out who pays whom. Read only, the result is cached per trip revision."""
     trip = db.query(models.Trip).filter(models.Trip.id == trip_id).first()
     if not trip:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Trip not found")
-    
-    # set settled timestamp
-    trip.settled_at = datetime.now()
-    db.commit()
-
-    # Get expenses
-    expenses = db.query(models.Expense).filter(models.Expense.trip_id == trip_id).all()
-
-    # Get users in the trip
-    users = (
-        db.query(models.User)
-        .join(models.trip_members, models.User.id == models.trip_members.c.user_id)
-        .filter(models.trip_members.c.trip_id == trip_id)
-        .all()
-    )
-
-    user_ids = [user.id for user in users]
-    user_map = {user.id: user.name for user in users}
-
-    # Calculate total and per person share
-    total = sum(exp.amount for exp in expenses)
-    share = total / len(users)
-
-    # Calculate net balance for each user
-    balances = defaultdict(float)
-    for exp in expenses:
-        balances[exp.payer_id] += exp.amount
-
-    for uid in user_ids:
-        balances[uid] -= share
 
-    # Split into debtors and creditors
-    debtors = []
-    creditors = []
+    cache_key = (trip.id, trip.revision, strategy)
+    cached = settlement_cache.get(cache_key)
+    if cached is not None:
+        return cached
 
-    for uid, bal in balances.items():
-        if round(bal, 2) < 0:
-            debtors.append((uid, -bal))  # Needs to pay
-        elif round(bal, 2) > 0:
-            creditors.append((uid, bal))  # Needs to receive
-
-    # Sort both lists
-    debtors.sort(key=lambda x: x[1])
-    creditors.sort(key=lambda x: x[1])
+    # Per-member balances are kept up to date by the ledger, so this is O(members)
+    rows = ledger.get_trip_balances(db, trip_id)
+    user_map = {row.user_id: row.name for row in rows}
+    balances = {row.user_id: row.net for row in rows}
 
     settlements = []
-
-    i, j = 0, 0
-    while i < len(debtors) and j < len(creditors):
-        debtor_id, debt = debtors[i]
-        creditor_id, credit = creditors[j]
-
-        amount = min(debt, credit)
+    for debtor_id, creditor_id, amount in settle(balances, strategy):
         settlements.append({
             "from": user_map[debtor_id],
             "to": user_map[creditor_id],
-            "amount": round(amount, 2)
+            "amount": amount
         })
 
-        debtors[i] = (debtor_id, debt - amount)
-        creditors[j] = (creditor_id, credit - amount)
-
-        if debtors[i][1] == 0:
-            i += 1
-        if creditors[j][1] == 0:
-            j += 1
-
+    settlement_cache.set(cache_key, settlements)
     return settlements
+
+def counterparty_balances(user_id: int, db: Session):
+    """Net what the user owes or is owed per person, over all of their trips.
+
+    Each trip is settled greedily from its ledger balances and the transfers
+    involving the user are added up per counterparty, converted to
+    settings.default_currency at the latest rates. Positive means the
+    counterparty owes the user. Transfers in a currency without a rate are
+    left out.
+    """
+    names = {}
+    # (counterparty, signed amount, trip currency) of every transfer involving the user
+    transfers = []
+    for (_, currency), rows in groupby(
+        ledger.get_co_member_balances(db, user_id), key=lambda row: (row.trip_id, row.currency)
+    ):
+        balances = {}
+        for row in rows:
+            names[row.user_id] = row.name
+            balances[row.user_id] = row.net
+        for debtor_id, creditor_id, amount in settle(balances, SettlementStrategy.greedy):
+            if creditor_id == user_id:
+                transfers.append((debtor_id, amount, currency))
+            elif debtor_id == user_id:
+                transfers.append((creditor_id, -amount, currency))
+
+    day = currency_service.today()
+    converted = currency_service.convert_batch(
+        db, [(amount, currency, day) for _, amount, currency in transfers], settings.default_currency, strict=False
+    )
+    owed = defaultdict(int)
+    for (uid, _, _), amount in zip(transfers, converted):
+        if amount is not None:
+            owed[uid] += amount
+    return [
+        {"user_id": uid, "name": names[uid], "net": net}
+        for uid, net in sorted(owed.items()) if net
+    ]
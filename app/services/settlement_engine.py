@@ -0,0 +1,162 @@
+"""Settlement strategies.
+
+Each strategy takes {user_id: balance} in cents (positive means the user should
+receive money, negative means the user owes) and returns a list of
+(from_user_id, to_user_id, amount_in_cents) transfers that clears every balance.
+"""
+import heapq
+import time
+from enum import Enum
+
+# the exact solver is O(2^n * n), above this many non-zero balances it falls back
+MAX_EXACT_MEMBERS = 16
+# seconds the exact solver may spend before falling back
+EXACT_TIME_BUDGET = 0.5
+
+
+class SettlementStrategy(str, Enum):
+    greedy = "greedy"
+    largest_first = "largest_first"
+    min_transfers = "min_transfers"
+
+
+def greedy(balances: dict[int, int]):
+    """Original two-pointer walk over debtors and creditors sorted ascending."""
+    debtors = sorted(((uid, -bal) for uid, bal in balances.items() if bal < 0), key=lambda x: x[1])
+    creditors = sorted(((uid, bal) for uid, bal in balances.items() if bal > 0), key=lambda x: x[1])
+
+    transfers = []
+    i, j = 0, 0
+    while i < len(debtors) and j < len(creditors):
+        debtor_id, debt = debtors[i]
+        creditor_id, credit = creditors[j]
+
+        amount = min(debt, credit)
+        transfers.append((debtor_id, creditor_id, amount))
+
+        debtors[i] = (debtor_id, debt - amount)
+        creditors[j] = (creditor_id, credit - amount)
+
+        if debtors[i][1] == 0:
+            i += 1
+        if creditors[j][1] == 0:
+            j += 1
+    return transfers
+
+
+def largest_first(balances: dict[int, int]):
+    """Always match the biggest debtor with the biggest creditor. O(n log n)."""
+    # heapq is a min-heap, so amounts are stored negated; uid breaks ties deterministically
+    debtors = [(bal, uid) for uid, bal in balances.items() if bal < 0]
+    creditors = [(-bal, uid) for uid, bal in balances.items() if bal > 0]
+    heapq.heapify(debtors)
+    heapq.heapify(creditors)
+
+    transfers = []
+    while debtors and creditors:
+        debt, debtor_id = heapq.heappop(debtors)
+        credit, creditor_id = heapq.heappop(creditors)
+        amount = min(-debt, -credit)
+        transfers.append((debtor_id, creditor_id, amount))
+
+        if -debt > amount:
+            heapq.heappush(debtors, (debt + amount, debtor_id))
+        if -credit > amount:
+            heapq.heappush(creditors, (credit + amount, creditor_id))
+    return transfers
+
+
+def _zero_sum_groups(uids: list[int], amounts: list[int], deadline: float):
+    """Split the members into the largest number of groups that each sum to zero.
+
+    A group of k members can always be settled with k - 1 transfers, so more
+    groups means fewer transfers overall. Returns None if the deadline passes.
+    """
+    n = len(amounts)
+    full = (1 << n) - 1
+    sums = [0] * (full + 1)
+    best = [0] * (full + 1)
+    for mask in range(1, full + 1):
+        if mask & 1023 == 0 and time.perf_counter() > deadline:
+            return None
+        low = mask & -mask
+        sums[mask] = sums[mask ^ low] + amounts[low.bit_length() - 1]
+        most = 0
+        rest = mask
+        while rest:
+            bit = rest & -rest
+            if best[mask ^ bit] > most:
+                most = best[mask ^ bit]
+            rest ^= bit
+        best[mask] = most + (1 if sums[mask] == 0 else 0)
+
+    # walk back from the full set, every zero-sum mask on the way closes a group
+    groups = []
+    mask = full
+    boundary = full
+    while mask:
+        rest = mask
+        step = None
+        while rest:
+            bit = rest & -rest
+            if step is None or best[mask ^ bit] > best[mask ^ step]:
+                step = bit
+            rest ^= bit
+        mask ^= step
+        if sums[mask] == 0:
+            group = boundary ^ mask
+            groups.append([uids[i] for i in range(n) if group >> i & 1])
+            boundary = mask
+    return groups
+
+
+def _pair_off(balances: dict[int, int]):
+    """Settle members whose balances cancel exactly; that pair is always part of an optimal answer."""
+    transfers = []
+    waiting = {}
+    rest = {}
+    for uid in sorted(balances):
+        bal = balances[uid]
+        partners = waiting.get(-bal)
+        if partners:
+            other = partners.pop()
+            rest.pop(other)
+            if bal < 0:
+                transfers.append((uid, other, -bal))
+            else:
+                transfers.append((other, uid, bal))
+        else:
+            waiting.setdefault(bal, []).append(uid)
+            rest[uid] = bal
+    return transfers, rest
+
+
+def min_transfers(balances: dict[int, int]):
+    """Fewest possible transfers for small groups, largest_first for whatever is left over."""
+    nonzero = {uid: bal for uid, bal in balances.items() if bal != 0}
+    if sum(nonzero.values()) != 0:
+        return largest_first(nonzero)
+
+    transfers, rest = _pair_off(nonzero)
+    if len(rest) > MAX_EXACT_MEMBERS:
+        return transfers + largest_first(rest)
+
+    uids = sorted(rest)
+    groups = _zero_sum_groups(uids, [rest[uid] for uid in uids], time.perf_counter() + EXACT_TIME_BUDGET)
+    if groups is None:
+        return transfers + largest_first(rest)
+
+    for group in groups:
+        transfers.extend(largest_first({uid: rest[uid] for uid in group}))
+    return transfers
+
+
+STRATEGIES = {
+    SettlementStrategy.greedy: greedy,
+    SettlementStrategy.largest_first: largest_first,
+    SettlementStrategy.min_transfers: min_transfers,
+}
+
+
+def settle(balances: dict[int, int], strategy: SettlementStrategy = SettlementStrategy.greedy):
+    return STRATEGIES[strategy](balances)
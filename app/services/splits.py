@@ -0,0 +1,74 @@
+"""Turn a split request (exact amounts, percentages, weights or an equal subset)
+into whole cents per member.
+
+Rounding follows ledger.split_equally: every member gets the floor of their
+part and the leftover cents go one each to the lowest user ids, among the
+members with a part at all (a zero share or 0% never pays a cent).
+"""
+from decimal import ROUND_FLOOR, Decimal
+from typing import Optional
+
+from fastapi import HTTPException, status
+
+from app import schemas
+from app.services.ledger import split_equally
+
+
+def _invalid(detail: str):
+    return HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=detail)
+
+
+def allocate(amount: int, weights: dict[int, Decimal]) -> dict[int, int]:
+    """Split amount cents in proportion to weights."""
+    total = sum(weights.values())
+    if not total:
+        return split_equally(amount, list(weights))
+    cents = {
+        uid: int((amount * weight / total).to_integral_value(rounding=ROUND_FLOOR))
+        for uid, weight in weights.items()
+    }
+    leftover = amount - sum(cents.values())
+    for uid in sorted(uid for uid, weight in weights.items() if weight)[:leftover]:
+        cents[uid] += 1
+    return cents
+
+
+def resolve_split(
+    amount: int,
+    split_type: schemas.SplitType,
+    entries: Optional[list[schemas.SplitEntry]],
+) -> Optional[dict[int, int]]:
+    """Return {user_id: cents} for an itemized expense, or None for an equal split between all members."""
+    if not entries:
+        if split_type != schemas.SplitType.equal:
+            raise _invalid(f"A {split_type.value} split needs splits")
+        return None
+
+    user_ids = [entry.user_id for entry in entries]
+    if len(set(user_ids)) != len(user_ids):
+        raise _invalid("A user appears more than once in splits")
+    if split_type == schemas.SplitType.equal:
+        return split_equally(amount, user_ids)
+
+    values = {}
+    for entry in entries:
+        if entry.value is None or entry.value < 0:
+            raise _invalid(f"Split value for user {entry.user_id} must be zero or more")
+        values[entry.user_id] = entry.value
+
+    if split_type == schemas.SplitType.exact:
+        if any(value != value.to_integral_value() for value in values.values()):
+            raise _invalid("Exact splits are whole minor units (cents)")
+        if sum(values.values()) != amount:
+            raise _invalid(f"Exact splits add up to {sum(values.values())}, expected {amount}")
+        return {uid: int(value) for uid, value in values.items()}
+    if split_type == schemas.SplitType.percent and sum(values.values()) != 100:
+        raise _invalid(f"Percentages add up to {sum(values.values())}, expected 100")
+    if split_type == schemas.SplitType.shares and not sum(values.values()):
+        raise _invalid("At least one share must be more than zero")
+    return allocate(amount, values)
+
+
+def rescale(amount: int, splits: dict[int, int]) -> dict[int, int]:
+    """Keep an itemized split's proportions when the expense amount changes."""
+    return allocate(amount, {uid: Decimal(cents) for uid, cents in splits.items()})
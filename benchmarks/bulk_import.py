@@ -0,0 +1,81 @@
+"""Rows per second through POST /trips/{trip_id}/expenses/bulk.
+
+Creates a trip with a few members in a throwaway database, then imports
+--rows expenses as one JSON array, NDJSON and CSV request each.
+
+    python -m benchmarks.bulk_import --rows 20000
+"""
+import argparse
+import asyncio
+import csv
+import json
+import os
+import time
+from io import StringIO
+
+import httpx
+
+args = None
+
+MEMBERS = 5
+
+
+def payloads():
+    rows = [
+        {"title": f"expense {i}", "amount": 1000 + i % 5000, "payer_id": i % MEMBERS + 1, "note": "imported"}
+        for i in range(args.rows)
+    ]
+    output = StringIO()
+    writer = csv.DictWriter(output, fieldnames=list(rows[0]))
+    writer.writeheader()
+    writer.writerows(rows)
+    return [
+        ("json", "application/json", json.dumps(rows)),
+        ("ndjson", "application/x-ndjson", "\n".join(json.dumps(row) for row in rows)),
+        ("csv", "text/csv", output.getvalue()),
+    ]
+
+
+async def main():
+    from app.main import app
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        headers = []
+        for i in range(MEMBERS):
+            email = f"member{i}@example.com"
+            await client.post("/users/signup", json={"name": f"member{i}", "email": email, "password": "secret"})
+            response = await client.post("/users/login", data={"username": email, "password": "secret"})
+            headers.append({"Authorization": f"Bearer {response.json()['access_token']}"})
+        trip = (await client.post("/trips/", json={"name": "benchmark"}, headers=headers[0])).json()
+        for i in range(MEMBERS):
+            await client.post(f"/trips/{trip['id']}/add-member/{i + 1}", headers=headers[0])
+
+        print(f"{'format':<8} {'rows':>8} {'time':>9} {'rows/sec':>10}")
+        for name, content_type, body in payloads():
+            start = time.perf_counter()
+            response = await client.post(
+                f"/trips/{trip['id']}/expenses/bulk",
+                content=body,
+                headers={**headers[0], "Content-Type": content_type},
+            )
+            elapsed = time.perf_counter() - start
+            assert response.status_code == 201, response.text
+            assert response.json()["inserted"] == args.rows, response.json()["errors"][:5]
+            print(f"{name:<8} {args.rows:>8} {elapsed:>8.2f}s {args.rows / elapsed:>10.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk expense import throughput")
+    parser.add_argument("--database-url", default="sqlite:///./bench_bulk.db")
+    parser.add_argument("--rows", type=int, default=20000)
+    args = parser.parse_args()
+
+    # point the app at the benchmark database before it is imported
+    os.environ["DATABASE_URL"] = args.database_url
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+    os.environ.setdefault("ALGORITHM", "HS256")
+    if args.database_url.startswith("sqlite:///./") and os.path.exists(args.database_url[len("sqlite:///"):]):
+        os.remove(args.database_url[len("sqlite:///"):])
+
+    asyncio.run(main())
@@ -0,0 +1,84 @@
+"""Synthetic users, trips, members and expenses for benchmarks.
+
+Rows are written with executemany straight into the tables and the ledger is
+rebuilt afterwards, so even large datasets load in seconds. The same seed
+always produces the same data.
+"""
+import random
+from dataclasses import dataclass
+
+BATCH = 50_000
+PASSWORD = "secret"
+
+
+@dataclass
+class Scale:
+    users: int
+    trips: int
+    members_per_trip: int
+    expenses_per_trip: int
+
+
+SCALES = {
+    "small": Scale(users=50, trips=20, members_per_trip=5, expenses_per_trip=100),
+    "medium": Scale(users=500, trips=200, members_per_trip=8, expenses_per_trip=500),
+    "large": Scale(users=5000, trips=1000, members_per_trip=12, expenses_per_trip=2000),
+}
+
+
+def _insert(conn, table, rows):
+    for start in range(0, len(rows), BATCH):
+        conn.execute(table.insert(), rows[start:start + BATCH])
+
+
+def generate(scale: Scale, seed: int = 1, bcrypt_rounds: int = 4):
+    """Fill the configured database and return {trip_id: [member ids]}.
+
+    Every user is member<id>@example.com with password PASSWORD. Members are
+    drawn at random per trip and the trip creator is always one of them.
+    """
+    from app import models
+    from app.database import Base, SessionLocal, engine
+    from app.passwords import get_context
+    from app.services import ledger
+
+    rng = random.Random(seed)
+    Base.metadata.create_all(bind=engine)
+    # one hash for everybody, hashing each user would dominate the setup time
+    hashed_password = get_context(bcrypt_rounds).hash(PASSWORD)
+    user_ids = list(range(1, scale.users + 1))
+
+    trips = {}
+    expenses = []
+    for trip_id in range(1, scale.trips + 1):
+        members = rng.sample(user_ids, min(scale.members_per_trip, len(user_ids)))
+        trips[trip_id] = members
+        for i in range(scale.expenses_per_trip):
+            amount = rng.randint(100, 50_000)
+            # every trip and expense is in the default currency
+            expenses.append({
+                "trip_id": trip_id,
+                "title": f"expense {i}",
+                "amount": amount,
+                "base_amount": amount,
+                "payer_id": rng.choice(members),
+            })
+
+    with engine.begin() as conn:
+        _insert(conn, models.User.__table__, [
+            {"id": uid, "name": f"member{uid}", "email": f"member{uid}@example.com", "hashed_password": hashed_password}
+            for uid in user_ids
+        ])
+        _insert(conn, models.Trip.__table__, [
+            {"id": trip_id, "name": f"trip {trip_id}", "creator_id": members[0]} for trip_id, members in trips.items()
+        ])
+        _insert(conn, models.trip_members, [
+            {"trip_id": trip_id, "user_id": uid} for trip_id, members in trips.items() for uid in members
+        ])
+        _insert(conn, models.Expense.__table__, expenses)
+
+    with SessionLocal() as db:
+        for trip_id in trips:
+            ledger.rebuild_trip(db, trip_id)
+        db.commit()
+    return trips
@@ -0,0 +1,131 @@
+"""Fan-out of trip change events to many idle subscribers on one event loop.
+
+Opens --subscribers SSE feeds (app.services.events.sse_stream, what
+GET /trips/{trip_id}/events streams) on one trip and reports:
+
+- memory per idle subscriber (queue, parked coroutine and stream generator)
+- the cost of publish() itself, which encodes an event once for everyone
+- fan-out latency: from publish() until every subscriber has the event
+
+It also times encoding the same payload once per subscriber, the cost the
+bus avoids. No database is involved, the payload has the shape publish_change
+sends.
+
+    python -m benchmarks.event_fanout --subscribers 5000 --events 100
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+import tracemalloc
+
+args = None
+
+
+def payload(number: int, members: int) -> dict:
+    return {
+        "type": "expense.created",
+        "trip_id": 1,
+        "expense": {
+            "id": number, "trip_id": 1, "title": f"expense {number}", "amount": 1250, "currency": "EUR",
+            "base_amount": 1250, "payer_id": 1, "created_at": "2026-01-01T12:00:00", "note": None, "splits": [],
+        },
+        "revision": number + 1,
+        "total_amount": 1250 * number,
+        "expense_count": number,
+        "balances": [{"user_id": uid, "paid": 0, "share": 0, "net": 0} for uid in range(1, members + 1)],
+    }
+
+
+class Arrivals:
+    """Counts subscribers that received the current event, wakes the publisher when all have."""
+
+    def __init__(self, expected: int):
+        self.expected = expected
+        self.count = 0
+        self.done = asyncio.Event()
+
+    def reset(self):
+        self.count = 0
+        self.done.clear()
+
+    def hit(self):
+        self.count += 1
+        if self.count == self.expected:
+            self.done.set()
+
+
+async def subscriber(user_id: int, arrivals: Arrivals, expires_at: float):
+    from app.services import events
+
+    async for chunk in events.sse_stream(1, user_id, expires_at):
+        if chunk.startswith("id:"):
+            arrivals.hit()
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+async def main():
+    from app.responses import dumps
+    from app.services import events
+
+    arrivals = Arrivals(args.subscribers)
+    expires_at = time.time() + 3600
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    tasks = [asyncio.ensure_future(subscriber(uid, arrivals, expires_at)) for uid in range(args.subscribers)]
+    # let every feed send its retry line and park on its queue
+    while events.bus.subscriber_count() < args.subscribers:
+        await asyncio.sleep(0.01)
+    await asyncio.sleep(0.1)
+    per_subscriber = (tracemalloc.get_traced_memory()[0] - before) / args.subscribers
+    tracemalloc.stop()
+    print(f"{args.subscribers} idle subscribers, {per_subscriber / 1024:.1f} KiB each")
+
+    publish_times, fanout_times = [], []
+    for number in range(args.events):
+        arrivals.reset()
+        data = payload(number, args.members)
+        start = time.perf_counter()
+        events.bus.publish(1, data)
+        publish_times.append(time.perf_counter() - start)
+        await arrivals.done.wait()
+        fanout_times.append(time.perf_counter() - start)
+
+    data = payload(0, args.members)
+    start = time.perf_counter()
+    for _ in range(args.subscribers):
+        dumps(data)
+    encode_each = time.perf_counter() - start
+
+    print(f"{'':<34} {'p50 ms':>9} {'p95 ms':>9}")
+    for label, timings in (("publish() (encode once + enqueue)", publish_times),
+                           ("fan-out to every subscriber", fanout_times)):
+        print(f"{label:<34} {statistics.median(timings) * 1000:>9.2f} {percentile(timings, 0.95) * 1000:>9.2f}")
+    print(f"{'encoding once per subscriber':<34} {encode_each * 1000:>9.2f}")
+    deliveries = args.subscribers * args.events / sum(fanout_times)
+    print(f"{deliveries:,.0f} deliveries/s over {args.events} events")
+
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    assert events.bus.subscriber_count() == 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Trip event fan-out to idle SSE subscribers")
+    parser.add_argument("--subscribers", type=int, default=5000)
+    parser.add_argument("--events", type=int, default=100)
+    parser.add_argument("--members", type=int, default=10, help="balances per event")
+    args = parser.parse_args()
+
+    os.environ.setdefault("DATABASE_URL", "sqlite:///./bench_events.db")
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+    os.environ.setdefault("ALGORITHM", "HS256")
+
+    asyncio.run(main())
@@ -0,0 +1,180 @@
+"""Latency of GET /trips/{trip_id}/expenses/search filters on a large database.
+
+Fills a throwaway SQLite database with --expenses expenses spread over
+--trips trips, one of which holds --big-share of them. Titles and notes are
+random words from a small vocabulary, so common words match thousands of
+rows. Then times app.services.search.search_query for a first page of 100,
+in both a typical trip and the big one:
+
+- no filter, payer, amount range, date range
+- text search through the FTS5 index, a common and a rare word
+- text search with LIKE (what runs without FTS5)
+- text combined with payer and amount
+
+and prints each query's plan, to show which index serves it.
+
+    python -m benchmarks.expense_search --expenses 500000
+"""
+import argparse
+import os
+import random
+import statistics
+import time
+from datetime import date, datetime, timedelta
+
+args = None
+
+WORDS = [
+    "taxi", "dinner", "lunch", "breakfast", "hotel", "museum", "tickets", "groceries", "fuel", "parking",
+    "train", "bus", "ferry", "flight", "airport", "coffee", "snacks", "wine", "beer", "market", "souvenirs",
+    "pharmacy", "laundry", "tips", "tour", "guide", "boat", "bike", "rental", "cinema", "concert", "pizza",
+    "sushi", "tapas", "bakery", "icecream", "water", "sunscreen", "towels", "hostel", "camping", "firewood",
+]
+# rare words appear in one expense in a thousand
+RARE = ["helicopter", "opera", "yacht", "balloon", "casino"]
+START = date(2025, 1, 1)
+
+
+def populate(rng: random.Random):
+    from app import models
+    from app.database import Base, engine
+
+    Base.metadata.create_all(bind=engine)
+    members = 8
+    users = args.trips * members
+    with engine.begin() as conn:
+        conn.execute(models.User.__table__.insert(), [
+            {"id": uid, "name": f"member{uid}", "email": f"member{uid}@example.com", "hashed_password": "x"}
+            for uid in range(1, users + 1)
+        ])
+        conn.execute(models.Trip.__table__.insert(), [
+            {"id": trip_id, "name": f"trip {trip_id}", "creator_id": (trip_id - 1) * members + 1}
+            for trip_id in range(1, args.trips + 1)
+        ])
+        big = int(args.expenses * args.big_share)
+        rows = []
+        for i in range(args.expenses):
+            trip_id = 1 if i < big else 2 + i % (args.trips - 1)
+            words = rng.sample(WORDS, rng.randint(1, 3)) + ([rng.choice(RARE)] if rng.random() < 0.001 else [])
+            amount = rng.randint(100, 50_000)
+            rows.append({
+                "trip_id": trip_id, "title": " ".join(words).capitalize(), "amount": amount, "base_amount": amount,
+                "payer_id": (trip_id - 1) * members + 1 + rng.randrange(members),
+                "note": " ".join(rng.sample(WORDS, 3)) if rng.random() < 0.3 else None,
+                "created_at": datetime.combine(START, datetime.min.time()) + timedelta(seconds=rng.randrange(365 * 86400)),
+            })
+            if len(rows) == 50_000:
+                conn.execute(models.Expense.__table__.insert(), rows)
+                rows = []
+        if rows:
+            conn.execute(models.Expense.__table__.insert(), rows)
+        conn.exec_driver_sql("ANALYZE")
+
+
+def cases(trip_id: int, payer_id: int):
+    return [
+        ("no filter", {}),
+        ("payer", {"payer_id": payer_id}),
+        ("amount 100.00-120.00", {"min_amount": 10_000, "max_amount": 12_000}),
+        ("one week", {"date_from": date(2025, 6, 1), "date_to": date(2025, 6, 7)}),
+        ("text, common word", {"q": "dinner"}),
+        ("text, two words", {"q": "taxi airp"}),
+        ("text, rare word", {"q": "helicopter"}),
+        ("LIKE, common word", {"q": "dinner", "fulltext": False}),
+        ("LIKE, rare word", {"q": "helicopter", "fulltext": False}),
+        ("text + payer + amount", {"q": "dinner", "payer_id": payer_id, "min_amount": 5_000}),
+    ]
+
+
+def measure(db, query):
+    timings = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        rows = db.execute(query).all()
+        timings.append(time.perf_counter() - start)
+    return len(rows), statistics.median(timings), max(timings)
+
+
+def main():
+    from app.database import SessionLocal
+    from app.routers.trips import SEARCH_FIELDS
+    from app.services.search import search_query
+
+    start = time.perf_counter()
+    populate(random.Random(args.seed))
+    print(f"{args.expenses} expenses in {args.trips} trips, loaded in {time.perf_counter() - start:.1f}s")
+
+    slow = []
+    with SessionLocal() as db:
+        for label, trip_id in (("typical trip", 2), ("big trip", 1)):
+            payer_id = db.execute(_first_payer(trip_id)).scalar()
+            size = db.execute(_count(trip_id)).scalar()
+            print(f"\n{label} ({size} expenses)  {'rows':>5} {'p50 ms':>8} {'max ms':>8}  plan")
+            for name, filters in cases(trip_id, payer_id):
+                query = search_query(trip_id, SEARCH_FIELDS, **filters).limit(100)
+                count, median, worst = measure(db, query)
+                plan = "; ".join(row[-1] for row in explain(db, query))
+                print(f"  {name:<24} {count:>5} {median * 1000:>8.2f} {worst * 1000:>8.2f}  {plan}")
+                if median * 1000 > args.budget_ms and filters.get("fulltext", True):
+                    slow.append(f"{label}: {name}")
+    if slow:
+        print(f"\nover {args.budget_ms}ms: {', '.join(slow)}")
+
+
+def explain(db, query):
+    """EXPLAIN QUERY PLAN rows of query, run with the same SQL and bound values as the query itself."""
+    from sqlalchemy import event
+
+    captured = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        captured.append((statement, parameters))
+
+    connection = db.connection()
+    event.listen(connection, "before_cursor_execute", capture)
+    try:
+        db.execute(query).all()
+    finally:
+        event.remove(connection, "before_cursor_execute", capture)
+    statement, parameters = captured[-1]
+    return connection.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).all()
+
+
+def _first_payer(trip_id: int):
+    from sqlalchemy import select
+
+    from app import models
+
+    return select(models.Expense.payer_id).filter(models.Expense.trip_id == trip_id).limit(1)
+
+
+def _count(trip_id: int):
+    from sqlalchemy import func, select
+
+    from app import models
+
+    return select(func.count()).select_from(models.Expense).filter(models.Expense.trip_id == trip_id)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Expense search latency per filter")
+    parser.add_argument("--database-url", default="sqlite:///./bench_search.db")
+    parser.add_argument("--expenses", type=int, default=500_000)
+    parser.add_argument("--trips", type=int, default=1000)
+    parser.add_argument("--big-share", type=float, default=0.1, help="share of all expenses in trip 1")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--budget-ms", type=float, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    # point the app at the benchmark database before it is imported
+    os.environ["DATABASE_URL"] = args.database_url
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+    os.environ.setdefault("ALGORITHM", "HS256")
+    if args.database_url.startswith("sqlite:///./"):
+        for suffix in ("", "-wal", "-shm"):
+            path = args.database_url[len("sqlite:///"):] + suffix
+            if os.path.exists(path):
+                os.remove(path)
+
+    main()
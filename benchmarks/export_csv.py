@@ -0,0 +1,101 @@
+"""Memory and time of the CSV export on a large trip.
+
+Fills a throwaway database with one trip of --expenses expenses, then runs the
+streaming exporter and a build-everything-in-memory export over the same rows
+and reports peak Python memory (tracemalloc) and elapsed time for each.
+
+    python -m benchmarks.export_csv --expenses 1000000
+"""
+import argparse
+import asyncio
+import csv
+import os
+import time
+import tracemalloc
+from io import StringIO
+
+args = None
+
+MEMBERS = 10
+BATCH = 50_000
+
+
+def populate():
+    from app import models
+    from app.database import Base, engine
+
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(models.User.__table__.insert(), [
+            {"id": i + 1, "name": f"member{i}", "email": f"member{i}@example.com", "hashed_password": "x"}
+            for i in range(MEMBERS)
+        ])
+        conn.execute(models.Trip.__table__.insert(), [{"id": 1, "name": "benchmark", "creator_id": 1}])
+        for start in range(0, args.expenses, BATCH):
+            conn.execute(models.Expense.__table__.insert(), [
+                {"trip_id": 1, "title": f"expense {i}", "amount": 1000 + i % 5000, "base_amount": 1000 + i % 5000,
+                 "payer_id": i % MEMBERS + 1, "note": "dinner" if i % 3 == 0 else None}
+                for i in range(start, min(start + BATCH, args.expenses))
+            ])
+
+
+async def streaming(query, header, gzip):
+    from app.services import export
+
+    body = export.iter_csv(query, header)
+    if gzip:
+        body = export.gzip_chunks(body)
+    size = 0
+    async for chunk in body:
+        size += len(chunk)
+    return size
+
+
+async def in_memory(query, header):
+    """The old approach: every row fetched and written to one StringIO first."""
+    from app.database import AsyncSessionLocal
+
+    output = StringIO()
+    writer = csv.writer(output)
+    writer.writerow(header)
+    async with AsyncSessionLocal() as session:
+        writer.writerows((await session.execute(query)).all())
+    return len(output.getvalue())
+
+
+def measure(label, coro):
+    tracemalloc.start()
+    start = time.perf_counter()
+    size = asyncio.run(coro)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<22} {elapsed:>8.2f}s {peak / 2**20:>10.1f} MiB {size / 2**20:>10.1f} MiB")
+
+
+def main():
+    from app.services import export
+
+    populate()
+    query, header = export.ledger_query(1), export.LEDGER_HEADER
+    print(f"ledger export of {args.expenses} expenses")
+    print(f"{'mode':<22} {'time':>9} {'peak memory':>14} {'output':>14}")
+    measure("in memory", in_memory(query, header))
+    measure("streaming", streaming(query, header, gzip=False))
+    measure("streaming + gzip", streaming(query, header, gzip=True))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="CSV export memory and time")
+    parser.add_argument("--database-url", default="sqlite:///./bench_export.db")
+    parser.add_argument("--expenses", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    # point the app at the benchmark database before it is imported
+    os.environ["DATABASE_URL"] = args.database_url
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+    os.environ.setdefault("ALGORITHM", "HS256")
+    if args.database_url.startswith("sqlite:///./") and os.path.exists(args.database_url[len("sqlite:///"):]):
+        os.remove(args.database_url[len("sqlite:///"):])
+
+    main()
@@ -0,0 +1,156 @@
+"""Serializing a list of expenses to JSON, three ways.
+
+Fills a throwaway database with one trip of --rows expenses and times, query
+included:
+
+- ORM objects validated into ExpenseResponse models, dumped with json.dumps
+- selected rows turned into dicts, validated into ExpenseResponse models, dumped
+  with json.dumps (what FastAPI does for a response_model)
+- selected rows zipped with their field names and dumped with orjson
+  (app.responses.rows_response, used by the list endpoints)
+
+It then fetches the same rows through the app as ?format=ndjson and as JSON
+pages of 1000.
+
+    python -m benchmarks.list_serialization --rows 10000
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+
+args = None
+
+
+def populate(rng: random.Random):
+    from app import models
+    from app.database import Base, engine
+
+    Base.metadata.create_all(bind=engine)
+    amounts = [rng.randint(100, 50_000) for _ in range(args.rows)]
+    with engine.begin() as conn:
+        conn.execute(models.User.__table__.insert(), [
+            {"id": 1, "name": "member1", "email": "member1@example.com", "hashed_password": "x"}
+        ])
+        conn.execute(models.Trip.__table__.insert(), [{"id": 1, "name": "benchmark", "creator_id": 1}])
+        conn.execute(models.trip_members.insert(), [{"trip_id": 1, "user_id": 1}])
+        conn.execute(models.Expense.__table__.insert(), [
+            {"trip_id": 1, "title": f"expense {i}", "amount": amount, "base_amount": amount, "payer_id": 1,
+             "note": rng.choice([None, "shared taxi", "groceries"])}
+            for i, amount in enumerate(amounts)
+        ])
+
+
+def orm_and_models(db):
+    from pydantic import TypeAdapter
+    from sqlalchemy import select
+
+    from app import models, schemas
+
+    adapter = TypeAdapter(list[schemas.ExpenseResponse])
+    expenses = db.execute(select(models.Expense).filter(models.Expense.trip_id == 1)).scalars().all()
+    return json.dumps(adapter.dump_python(adapter.validate_python(expenses, from_attributes=True), mode="json"))
+
+
+def rows_and_models(db):
+    from pydantic import TypeAdapter
+
+    from app import schemas
+    from app.routers.expenses import EXPENSE_FIELDS, _expense_query
+
+    adapter = TypeAdapter(list[schemas.ExpenseResponse])
+    rows = db.execute(_expense_query(1, EXPENSE_FIELDS, None)).all()
+    data = [{name: row._mapping[name] for name in EXPENSE_FIELDS} for row in rows]
+    return json.dumps(adapter.dump_python(adapter.validate_python(data), mode="json"))
+
+
+def rows_and_orjson(db):
+    from app.responses import rows_response
+    from app.routers.expenses import EXPENSE_FIELDS, _expense_query
+
+    rows = db.execute(_expense_query(1, EXPENSE_FIELDS, None)).all()
+    return rows_response(rows, EXPENSE_FIELDS).body
+
+
+def measure(label, fn, *fn_args):
+    timings = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        result = fn(*fn_args)
+        timings.append(time.perf_counter() - start)
+    print(f"{label:<40} {min(timings) * 1000:>9.1f}ms")
+    return result
+
+
+async def through_the_app():
+    import httpx
+
+    from app.auth import create_access_token
+    from app.main import app
+
+    headers = {"Authorization": f"Bearer {create_access_token(data={'sub': 'member1@example.com', 'uid': 1})}"}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", headers=headers) as client:
+        for label, fetch in (("GET ?format=ndjson", _ndjson), ("GET JSON pages of 1000", _pages)):
+            timings = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                count = await fetch(client)
+                timings.append(time.perf_counter() - start)
+            assert count == args.rows, count
+            print(f"{label:<40} {min(timings) * 1000:>9.1f}ms")
+
+
+async def _ndjson(client):
+    response = await client.get("/expenses/trip/1?format=ndjson")
+    return response.text.count("\n")
+
+
+async def _pages(client):
+    count, cursor = 0, None
+    while True:
+        params = {"limit": 1000, **({"cursor": cursor} if cursor else {})}
+        response = await client.get("/expenses/trip/1", params=params)
+        count += len(response.json())
+        cursor = response.headers.get("x-next-cursor")
+        if not cursor:
+            return count
+
+
+def main():
+    from app.database import SessionLocal
+
+    populate(random.Random(args.seed))
+    print(f"{args.rows} expenses, best of {args.repeat}")
+    with SessionLocal() as db:
+        outputs = [
+            measure("ORM objects + pydantic + json", orm_and_models, db),
+            measure("rows + pydantic + json", rows_and_models, db),
+            measure("rows + orjson (rows_response)", rows_and_orjson, db),
+        ]
+    assert len({json.dumps(json.loads(output)) for output in outputs}) == 1
+    print("all three produce the same JSON")
+    asyncio.run(through_the_app())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="JSON serialization of expense lists")
+    parser.add_argument("--database-url", default="sqlite:///./bench_lists.db")
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    # point the app at the benchmark database before it is imported
+    os.environ["DATABASE_URL"] = args.database_url
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+    os.environ.setdefault("ALGORITHM", "HS256")
+    if args.database_url.startswith("sqlite:///./"):
+        for suffix in ("", "-wal", "-shm"):
+            path = args.database_url[len("sqlite:///"):] + suffix
+            if os.path.exists(path):
+                os.remove(path)
+
+    main()
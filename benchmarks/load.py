@@ -0,0 +1,100 @@
+"""Concurrent load against the FastAPI app, in process over ASGI.
+
+Creates a trip with some members and expenses in a throwaway database, then
+runs many clients at once against the read endpoints (optionally mixed with
+expense writes) and reports requests/sec.
+
+    python -m benchmarks.load --clients 100 --requests 20
+    python -m benchmarks.load --clients 100 --requests 20 --write-every 4
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+import httpx
+
+args = None
+
+
+async def setup(client: httpx.AsyncClient):
+    headers = []
+    for i in range(args.members):
+        email = f"member{i}@example.com"
+        await client.post("/users/signup", json={"name": f"member{i}", "email": email, "password": "secret"})
+        response = await client.post("/users/login", data={"username": email, "password": "secret"})
+        headers.append({"Authorization": f"Bearer {response.json()['access_token']}"})
+
+    trip = (await client.post("/trips/", json={"name": "benchmark"}, headers=headers[0])).json()
+    for i in range(args.members):
+        await client.post(f"/trips/{trip['id']}/add-member/{i + 1}", headers=headers[0])
+    for i in range(args.expenses):
+        payer = i % args.members
+        await client.post("/expenses/", json={
+            "trip_id": trip["id"], "title": f"expense {i}", "amount": 1000 + i, "payer_id": payer + 1
+        }, headers=headers[payer])
+    return trip["id"], headers
+
+
+async def run_client(client, trip_id, payer_id, headers, latencies, errors):
+    paths = [f"/trips/{trip_id}/summary", f"/trips/{trip_id}/settlement", f"/expenses/trip/{trip_id}", "/users/me"]
+    for i in range(args.requests):
+        start = time.perf_counter()
+        try:
+            if args.write_every and i % args.write_every == args.write_every - 1:
+                response = await client.post("/expenses/", json={
+                    "trip_id": trip_id, "title": f"load {i}", "amount": 500 + i, "payer_id": payer_id
+                }, headers=headers)
+            else:
+                response = await client.get(paths[i % len(paths)], headers=headers)
+            response.raise_for_status()
+        except Exception as exc:
+            # e.g. "database is locked" under concurrent writes
+            errors.append(exc)
+        latencies.append(time.perf_counter() - start)
+
+
+async def main():
+    from app.main import app
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        trip_id, headers = await setup(client)
+
+        latencies, errors = [], []
+        start = time.perf_counter()
+        await asyncio.gather(*[
+            run_client(client, trip_id, i % len(headers) + 1, headers[i % len(headers)], latencies, errors)
+            for i in range(args.clients)
+        ])
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    print(f"clients={args.clients} requests={len(latencies)} errors={len(errors)} elapsed={elapsed:.2f}s")
+    for exc in errors[:3]:
+        print(f"  {type(exc).__name__}: {str(exc).splitlines()[0]}")
+    print(f"requests/sec={len(latencies) / elapsed:.1f}")
+    print(f"p50={statistics.median(latencies) * 1000:.1f}ms p95={latencies[int(len(latencies) * 0.95)] * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    # the app's password pool spawns worker processes that re-import this module,
+    # so nothing above may touch the database or the arguments at import time
+    parser = argparse.ArgumentParser(description="Concurrent load against the app")
+    parser.add_argument("--database-url", default="sqlite:///./bench_load.db")
+    parser.add_argument("--clients", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=20, help="requests per client")
+    parser.add_argument("--members", type=int, default=10)
+    parser.add_argument("--expenses", type=int, default=200)
+    parser.add_argument("--write-every", type=int, default=0, help="every Nth request of a client creates an expense")
+    args = parser.parse_args()
+
+    # point the app at the benchmark database before it is imported
+    os.environ["DATABASE_URL"] = args.database_url
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+    os.environ.setdefault("ALGORITHM", "HS256")
+    if args.database_url.startswith("sqlite:///./") and os.path.exists(args.database_url[len("sqlite:///"):]):
+        os.remove(args.database_url[len("sqlite:///"):])
+
+    asyncio.run(main())
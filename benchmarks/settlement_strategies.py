@@ -0,0 +1,70 @@
+"""Compare settlement strategies by number of transfers and runtime.
+
+Run from the repository root:
+
+    python -m benchmarks.settlement_strategies
+"""
+import argparse
+import random
+import time
+
+from app.services.settlement_engine import STRATEGIES
+
+MEMBER_COUNTS = [5, 10, 15, 20, 30, 50, 100, 200, 500]
+
+
+def random_balances(members: int, rng: random.Random):
+    """Balances that sum to zero, built from expenses shared inside small sub-groups.
+
+    Real trips split into people who eat, ride or room together, which is where
+    the exact solver finds groups it can settle separately.
+    """
+    uids = list(range(members))
+    rng.shuffle(uids)
+    clusters = []
+    while uids:
+        size = rng.randint(2, 5)
+        clusters.append(uids[:size])
+        uids = uids[size:]
+
+    balances = {uid: 0 for uid in range(members)}
+    for _ in range(members * 2):
+        cluster = rng.choice(clusters)
+        payer = rng.choice(cluster)
+        share = rng.choice([1200, 2500, 4000, 6000, 9000])
+        balances[payer] += share * len(cluster)
+        for uid in cluster:
+            balances[uid] -= share
+    return balances
+
+
+def check(balances, transfers):
+    left = dict(balances)
+    for debtor_id, creditor_id, amount in transfers:
+        left[debtor_id] += amount
+        left[creditor_id] -= amount
+    assert not any(left.values()), "transfers do not clear the balances"
+
+
+def run(rounds: int, seed: int):
+    rng = random.Random(seed)
+    print(f"{'members':>8} {'strategy':>14} {'transfers':>10} {'ms':>10}")
+    for members in MEMBER_COUNTS:
+        cases = [random_balances(members, rng) for _ in range(rounds)]
+        for strategy, solve in STRATEGIES.items():
+            transfers = 0
+            start = time.perf_counter()
+            for balances in cases:
+                transfers += len(solve(balances))
+            elapsed = (time.perf_counter() - start) * 1000 / rounds
+            for balances in cases:
+                check(balances, solve(balances))
+            print(f"{members:>8} {strategy.value:>14} {transfers / rounds:>10.1f} {elapsed:>10.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    run(args.rounds, args.seed)
@@ -0,0 +1,195 @@
+"""Spending over time from the daily_spending rollup vs. grouping expenses.
+
+Fills a throwaway SQLite database with --expenses expenses spread over a year
+in --trips trips of 8 members, one of which holds --big-share of them, and
+builds the rollup with app.services.analytics.backfill. Then times each
+series at daily, weekly and monthly granularity, for a typical trip and the
+big one (in total and by payer), and for what one member of the big trip
+paid (GET /users/me/spending):
+
+- rollup: the rollup rows (app.services.analytics) added up per period in Python
+- GROUP BY: one aggregate query over expenses, grouped by period in SQL
+
+and checks that both give the same points. Finally it times the ledger
+write of an expense with and without the rollup update, the cost every
+create, update and delete now pays.
+
+    python -m benchmarks.spending_rollup --expenses 500000
+"""
+import argparse
+import os
+import random
+import statistics
+import time
+from datetime import date, datetime, timedelta
+
+args = None
+
+START = date(2025, 1, 1)
+MEMBERS = 8
+
+
+def populate(rng: random.Random):
+    from app import models
+    from app.database import Base, engine
+
+    Base.metadata.create_all(bind=engine)
+    users = args.trips * MEMBERS
+    with engine.begin() as conn:
+        conn.execute(models.User.__table__.insert(), [
+            {"id": uid, "name": f"member{uid}", "email": f"member{uid}@example.com", "hashed_password": "x"}
+            for uid in range(1, users + 1)
+        ])
+        conn.execute(models.Trip.__table__.insert(), [
+            {"id": trip_id, "name": f"trip {trip_id}", "creator_id": (trip_id - 1) * MEMBERS + 1}
+            for trip_id in range(1, args.trips + 1)
+        ])
+        big = int(args.expenses * args.big_share)
+        rows = []
+        for i in range(args.expenses):
+            trip_id = 1 if i < big else 2 + i % (args.trips - 1)
+            payer_id = (trip_id - 1) * MEMBERS + 1 + rng.randrange(MEMBERS)
+            amount = rng.randint(100, 50_000)
+            rows.append({
+                "trip_id": trip_id, "title": "expense", "amount": amount, "base_amount": amount, "payer_id": payer_id,
+                "created_at": datetime.combine(START, datetime.min.time()) + timedelta(seconds=rng.randrange(365 * 86400)),
+            })
+            if len(rows) == 50_000:
+                conn.execute(models.Expense.__table__.insert(), rows)
+                rows = []
+        if rows:
+            conn.execute(models.Expense.__table__.insert(), rows)
+
+
+def naive_query(granularity, trip_id=None, payer_id=None, by_group=True):
+    """The series straight from expenses: (period, group, amount, expense_count) grouped in SQL."""
+    from sqlalchemy import Date, func, literal, select
+
+    from app import models, schemas
+
+    expense = models.Expense
+    if granularity == schemas.Granularity.week:
+        # the Monday on or before the day
+        period = func.date(expense.created_at, "weekday 0", "-6 days", type_=Date)
+    elif granularity == schemas.Granularity.month:
+        period = func.date(expense.created_at, "start of month", type_=Date)
+    else:
+        period = func.date(expense.created_at, type_=Date)
+    group = (expense.payer_id if trip_id is not None else expense.trip_id) if by_group else literal(None)
+    query = select(period, group, func.sum(expense.base_amount), func.count()).group_by(period, group)
+    if trip_id is not None:
+        query = query.filter(expense.trip_id == trip_id)
+    if payer_id is not None:
+        query = query.filter(expense.payer_id == payer_id)
+    return query.order_by(period, group)
+
+
+def rollup_points(db, granularity, trip_id=None, payer_id=None, by_group=True):
+    from app.services import analytics
+
+    group_by = "group" if by_group else None
+    if trip_id is not None:
+        rows = analytics.get_trip_spending(db, trip_id)
+        return analytics.bucket(
+            ((row.day, row.payer_id, row.amount, row.expense_count) for row in rows), granularity, group_by
+        )
+    rows = analytics.get_user_spending(db, payer_id)
+    return analytics.bucket(
+        ((row.day, row.trip_id, row.amount, row.expense_count) for row in rows), granularity, group_by
+    )
+
+
+def naive_points(db, granularity, trip_id=None, payer_id=None, by_group=True):
+    return [
+        {"period": period, "group": group, "amount": amount, "expense_count": count} if by_group
+        else {"period": period, "amount": amount, "expense_count": count}
+        for period, group, amount, count in db.execute(naive_query(granularity, trip_id, payer_id, by_group))
+    ]
+
+
+def measure(run):
+    timings = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        result = run()
+        timings.append(time.perf_counter() - start)
+    return result, statistics.median(timings)
+
+
+def write_cost(db):
+    """Median seconds of ledger.record_expense without and with the rollup update."""
+    from app.services import ledger
+
+    results = []
+    for day in (None, START + timedelta(days=100)):
+        timings = []
+        for number in range(args.writes):
+            start = time.perf_counter()
+            ledger.record_expense(db, 2, MEMBERS + 1 + number % MEMBERS, 1000, day=day)
+            db.flush()
+            timings.append(time.perf_counter() - start)
+        db.rollback()
+        results.append(statistics.median(timings))
+    return results
+
+
+def main():
+    from sqlalchemy import func, select
+
+    from app import models, schemas
+    from app.database import SessionLocal
+    from app.services import analytics
+
+    start = time.perf_counter()
+    populate(random.Random(args.seed))
+    print(f"{args.expenses} expenses in {args.trips} trips, loaded in {time.perf_counter() - start:.1f}s")
+
+    with SessionLocal() as db:
+        start = time.perf_counter()
+        analytics.backfill(db)
+        db.commit()
+        db.connection().exec_driver_sql("ANALYZE")
+        rollup_rows = db.execute(select(func.count()).select_from(models.DailySpending)).scalar()
+        print(f"backfill: {rollup_rows} daily rows in {time.perf_counter() - start:.1f}s")
+
+        subjects = [
+            ("typical trip", {"trip_id": 2, "by_group": False}),
+            ("big trip", {"trip_id": 1, "by_group": False}),
+            ("big trip by payer", {"trip_id": 1}),
+            ("user", {"payer_id": 1, "by_group": False}),
+        ]
+        print(f"\n{'':<28} {'points':>7} {'rollup ms':>10} {'GROUP BY ms':>12} {'speedup':>8}")
+        for label, subject in subjects:
+            for granularity in schemas.Granularity:
+                rollup, rollup_time = measure(lambda: rollup_points(db, granularity, **subject))
+                naive, naive_time = measure(lambda: naive_points(db, granularity, **subject))
+                assert rollup == naive, f"{label} by {granularity.value}: the rollup and GROUP BY differ"
+                print(f"{label + ', ' + granularity.value:<28} {len(rollup):>7} {rollup_time * 1000:>10.2f} "
+                      f"{naive_time * 1000:>12.2f} {naive_time / rollup_time:>7.1f}x")
+
+        plain, with_rollup = write_cost(db)
+        print(f"\nledger write per expense: {plain * 1000:.3f} ms, with the rollup {with_rollup * 1000:.3f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Spending series from the daily rollup vs. GROUP BY over expenses")
+    parser.add_argument("--database-url", default="sqlite:///./bench_spending.db")
+    parser.add_argument("--expenses", type=int, default=500_000)
+    parser.add_argument("--trips", type=int, default=1000)
+    parser.add_argument("--big-share", type=float, default=0.2, help="share of all expenses in trip 1")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--writes", type=int, default=500, help="ledger writes timed with and without the rollup")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    # point the app at the benchmark database before it is imported
+    os.environ["DATABASE_URL"] = args.database_url
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+    os.environ.setdefault("ALGORITHM", "HS256")
+    if args.database_url.startswith("sqlite:///./"):
+        for suffix in ("", "-wal", "-shm"):
+            path = args.database_url[len("sqlite:///"):] + suffix
+            if os.path.exists(path):
+                os.remove(path)
+
+    main()
@@ -0,0 +1,133 @@
+"""Balance calculation for a trip with itemized splits.
+
+Fills a throwaway database with one trip of --members members and --expenses
+expenses, a mix of equal, exact, percentage and weighted splits, then times:
+
+- a per-expense Python loop over every expense and split row
+- ledger.compute_trip_balances, which sums per user in SQL (rebuild / verify)
+- ledger.get_trip_balances, the precomputed rows settlement and summary read
+
+    python -m benchmarks.split_balances --expenses 100000 --members 50
+"""
+import argparse
+import os
+import random
+import time
+from collections import defaultdict
+from decimal import Decimal
+
+args = None
+
+BATCH = 50_000
+
+
+def populate(rng: random.Random):
+    from app import models, schemas
+    from app.database import Base, SessionLocal, engine
+    from app.services import ledger
+    from app.services.splits import resolve_split
+
+    Base.metadata.create_all(bind=engine)
+    members = list(range(1, args.members + 1))
+    expenses, splits = [], []
+    for expense_id in range(1, args.expenses + 1):
+        amount = rng.randint(100, 100_000)
+        expenses.append({"id": expense_id, "trip_id": 1, "title": f"expense {expense_id}",
+                         "amount": amount, "base_amount": amount, "payer_id": rng.choice(members)})
+        # about half the expenses are shared by everyone, the rest by a few members
+        kind = rng.choice([None, None, "equal", "exact", "percent", "shares"])
+        if kind is None:
+            continue
+        users = rng.sample(members, rng.randint(2, 8))
+        if kind == "exact":
+            cuts = sorted(rng.sample(range(1, amount), len(users) - 1))
+            values = [b - a for a, b in zip([0] + cuts, cuts + [amount])]
+        elif kind == "percent":
+            values = [Decimal(100) / len(users)] * len(users)
+            values[-1] = 100 - sum(values[:-1])
+        else:
+            values = [rng.randint(1, 5) for _ in users]
+        entries = [schemas.SplitEntry(user_id=uid, value=value) for uid, value in zip(users, values)]
+        for uid, cents in resolve_split(amount, schemas.SplitType(kind), entries).items():
+            splits.append({"expense_id": expense_id, "user_id": uid, "trip_id": 1, "amount": cents, "base_amount": cents})
+
+    with engine.begin() as conn:
+        conn.execute(models.User.__table__.insert(), [
+            {"id": uid, "name": f"member{uid}", "email": f"member{uid}@example.com", "hashed_password": "x"}
+            for uid in members
+        ])
+        conn.execute(models.Trip.__table__.insert(), [{"id": 1, "name": "benchmark", "creator_id": 1}])
+        conn.execute(models.trip_members.insert(), [{"trip_id": 1, "user_id": uid} for uid in members])
+        for rows, table in ((expenses, models.Expense.__table__), (splits, models.ExpenseSplit.__table__)):
+            for start in range(0, len(rows), BATCH):
+                conn.execute(table.insert(), rows[start:start + BATCH])
+
+    with SessionLocal() as db:
+        ledger.rebuild_trip(db, 1)
+        db.commit()
+    return len(splits)
+
+
+def per_expense_loop(db):
+    """Walk every expense and its split rows in Python."""
+    from app import models
+    from app.services.ledger import split_equally
+
+    member_ids = [row.user_id for row in db.query(models.trip_members.c.user_id).filter(models.trip_members.c.trip_id == 1)]
+    splits_by_expense = defaultdict(dict)
+    for split in db.query(models.ExpenseSplit).filter(models.ExpenseSplit.trip_id == 1):
+        splits_by_expense[split.expense_id][split.user_id] = split.amount
+
+    paid, owed = defaultdict(int), defaultdict(int)
+    pooled = 0
+    for expense in db.query(models.Expense).filter(models.Expense.trip_id == 1):
+        paid[expense.payer_id] += expense.amount
+        if expense.id in splits_by_expense:
+            for uid, amount in splits_by_expense[expense.id].items():
+                owed[uid] += amount
+        else:
+            pooled += expense.amount
+    shares = split_equally(pooled, member_ids)
+    return {uid: paid[uid] - owed[uid] - shares[uid] for uid in member_ids}
+
+
+def measure(label, fn, db):
+    db.expunge_all()
+    start = time.perf_counter()
+    result = fn(db)
+    print(f"{label:<38} {(time.perf_counter() - start) * 1000:>10.1f}ms")
+    return result
+
+
+def main():
+    from app.database import SessionLocal
+    from app.services import ledger
+
+    split_rows = populate(random.Random(args.seed))
+    print(f"{args.expenses} expenses, {split_rows} split rows, {args.members} members")
+    with SessionLocal() as db:
+        naive = measure("per-expense python loop", per_expense_loop, db)
+        computed = measure("SQL aggregate (compute_trip_balances)", lambda db: ledger.compute_trip_balances(db, 1), db)
+        stored = measure("ledger read (get_trip_balances)", lambda db: ledger.get_trip_balances(db, 1), db)
+
+    assert naive == {uid: net for uid, (_, _, _, net) in computed.items()}
+    assert naive == {row.user_id: row.net for row in stored}
+    print("all three agree")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Balance calculation with itemized splits")
+    parser.add_argument("--database-url", default="sqlite:///./bench_splits.db")
+    parser.add_argument("--expenses", type=int, default=100_000)
+    parser.add_argument("--members", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    # point the app at the benchmark database before it is imported
+    os.environ["DATABASE_URL"] = args.database_url
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+    os.environ.setdefault("ALGORITHM", "HS256")
+    if args.database_url.startswith("sqlite:///./") and os.path.exists(args.database_url[len("sqlite:///"):]):
+        os.remove(args.database_url[len("sqlite:///"):])
+
+    main()
@@ -0,0 +1,253 @@
+"""Reproducible benchmark suite with JSON output and regression checks.
+
+Generates a synthetic dataset (benchmarks/data.py) in a throwaway database,
+then runs:
+
+- micro-benchmarks of the settlement and trip summary code, called directly
+- an in-process ASGI load driver (httpx against the app) over login, create
+  expense, list expenses, summary and settlement
+
+Every result reports ops/sec, p50 and p95. Save a run and compare later runs
+against it; the exit status is 1 when anything got slower than the threshold
+or any request failed.
+
+    python -m benchmarks.suite --scale small --output baseline.json
+    python -m benchmarks.suite --scale small --compare baseline.json --threshold 0.2
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+
+import httpx
+
+args = None
+
+
+def summarize(latencies: list[float], elapsed: float = None):
+    """ops/sec over elapsed (wall time for concurrent runs, summed latencies otherwise)."""
+    ordered = sorted(latencies)
+    elapsed = elapsed if elapsed is not None else sum(latencies)
+    return {
+        "ops": len(ordered),
+        "ops_per_sec": round(len(ordered) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(statistics.median(ordered) * 1000, 3),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 3),
+    }
+
+
+def timed(fn, iterations: int):
+    latencies = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        fn(i)
+        latencies.append(time.perf_counter() - start)
+    return summarize(latencies)
+
+
+async def atimed(fn, iterations: int):
+    latencies = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        await fn(i)
+        latencies.append(time.perf_counter() - start)
+    return summarize(latencies)
+
+
+async def micro_benchmarks(trips: dict[int, list[int]]):
+    from starlette.requests import Request
+
+    from app import models
+    from app.database import AsyncSessionLocal, SessionLocal
+    from app.routers.trips import trip_summary
+    from app.services import ledger
+    from app.services.settlement import calculate_settlement, settlement_cache
+    from app.services.settlement_engine import SettlementStrategy
+
+    trip_ids = list(trips)
+    pick = lambda i: trip_ids[i % len(trip_ids)]
+    results = {}
+
+    with SessionLocal() as db:
+        def settle_uncached(strategy):
+            def run(i):
+                settlement_cache.clear()
+                calculate_settlement(pick(i), db, strategy)
+            return run
+
+        for strategy in SettlementStrategy:
+            results[f"micro.settlement.{strategy.value}"] = timed(settle_uncached(strategy), args.iterations)
+
+        settlement_cache.clear()
+        for trip_id in trip_ids:
+            calculate_settlement(trip_id, db)
+        results["micro.settlement.cached"] = timed(lambda i: calculate_settlement(pick(i), db), args.iterations)
+        results["micro.ledger.recompute"] = timed(lambda i: ledger.compute_trip_balances(db, pick(i)), args.iterations)
+
+    async with AsyncSessionLocal() as db:
+        async def summary(i):
+            trip_id = pick(i)
+            user = models.User(id=trips[trip_id][0])
+            # the route only reads the path and headers of the request, for its ETag
+            request = Request({
+                "type": "http", "method": "GET", "scheme": "http", "server": ("benchmark", 80),
+                "path": f"/trips/{trip_id}/summary", "query_string": b"", "headers": [],
+            })
+            await trip_summary(trip_id, request, db=db, current_user=user)
+
+        results["micro.trip_summary"] = await atimed(summary, args.iterations)
+    return results
+
+
+async def load_scenario(client, clients: list, request_fn):
+    """Run every client's requests concurrently, return summary over wall time."""
+    latencies, failures = [], []
+
+    async def run_client(state):
+        for i in range(args.requests):
+            start = time.perf_counter()
+            response = await request_fn(client, state, i)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                failures.append(response.status_code)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[run_client(state) for state in clients])
+    result = summarize(latencies, time.perf_counter() - start)
+    result["errors"] = len(failures)
+    return result
+
+
+async def load_benchmarks(trips: dict[int, list[int]]):
+    from app.auth import create_access_token
+    from app.main import app
+    from benchmarks.data import PASSWORD
+
+    # client i acts as one member of one trip
+    clients = []
+    for i in range(args.clients):
+        trip_id = list(trips)[i % len(trips)]
+        uid = trips[trip_id][i % len(trips[trip_id])]
+        token = create_access_token(data={"sub": f"member{uid}@example.com", "uid": uid})
+        clients.append({"trip_id": trip_id, "uid": uid, "headers": {"Authorization": f"Bearer {token}"}})
+
+    scenarios = {
+        "load.login": lambda client, s, i: client.post(
+            "/users/login", data={"username": f"member{s['uid']}@example.com", "password": PASSWORD}),
+        "load.create_expense": lambda client, s, i: client.post("/expenses/", json={
+            "trip_id": s["trip_id"], "title": f"load {i}", "amount": 1000 + i, "payer_id": s["uid"]
+        }, headers=s["headers"]),
+        "load.list_expenses": lambda client, s, i: client.get(
+            f"/expenses/trip/{s['trip_id']}?limit=100", headers=s["headers"]),
+        "load.summary": lambda client, s, i: client.get(f"/trips/{s['trip_id']}/summary", headers=s["headers"]),
+        "load.settlement": lambda client, s, i: client.get(f"/trips/{s['trip_id']}/settlement", headers=s["headers"]),
+    }
+
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for name, request_fn in scenarios.items():
+            results[name] = await load_scenario(client, clients, request_fn)
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    """Print current vs baseline ops/sec and return the names that regressed beyond threshold."""
+    regressions = []
+    print(f"\n{'benchmark':<32} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name, current in results.items():
+        before = baseline["results"].get(name)
+        if not before or not before["ops_per_sec"]:
+            continue
+        change = current["ops_per_sec"] / before["ops_per_sec"] - 1
+        flag = ""
+        if change < -threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<32} {before['ops_per_sec']:>10.1f} {current['ops_per_sec']:>10.1f} {change:>+8.1%}{flag}")
+    return regressions
+
+
+async def main():
+    from benchmarks.data import SCALES, generate
+
+    scale = SCALES[args.scale]
+    trips = generate(scale, seed=args.seed, bcrypt_rounds=args.bcrypt_rounds)
+
+    results = await micro_benchmarks(trips)
+    results.update(await load_benchmarks(trips))
+
+    print(f"{'benchmark':<32} {'ops/sec':>10} {'p50 ms':>9} {'p95 ms':>9}")
+    for name, result in results.items():
+        print(f"{name:<32} {result['ops_per_sec']:>10.1f} {result['p50_ms']:>9.2f} {result['p95_ms']:>9.2f}")
+
+    run = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "scale": args.scale,
+            "dataset": vars(scale),
+            "seed": args.seed,
+            "iterations": args.iterations,
+            "clients": args.clients,
+            "requests": args.requests,
+            "bcrypt_rounds": args.bcrypt_rounds,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(run, output, indent=2)
+
+    failed = [name for name, result in results.items() if result.get("errors")]
+    if failed:
+        print(f"\nrequests failed in: {', '.join(failed)}")
+        return 1
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        if baseline["meta"].get("scale") != args.scale:
+            print(f"warning: baseline was run at scale {baseline['meta'].get('scale')}")
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} benchmark(s) slower than the baseline by more than {args.threshold:.0%}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    from benchmarks.data import SCALES
+
+    parser = argparse.ArgumentParser(description="Benchmark suite")
+    parser.add_argument("--database-url", default="sqlite:///./bench_suite.db")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--iterations", type=int, default=200, help="calls per micro-benchmark")
+    parser.add_argument("--clients", type=int, default=50, help="concurrent clients per load scenario")
+    parser.add_argument("--requests", type=int, default=10, help="requests per client per load scenario")
+    parser.add_argument("--bcrypt-rounds", type=int, default=4, help="work factor of the generated users")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="baseline JSON from an earlier run")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown, 0.2 = 20%%")
+    args = parser.parse_args()
+
+    # point the app at the benchmark database before it is imported
+    os.environ["DATABASE_URL"] = args.database_url
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+    os.environ.setdefault("ALGORITHM", "HS256")
+    # hashes match the configured work factor, so logins don't rehash and write
+    os.environ["BCRYPT_ROUNDS"] = str(args.bcrypt_rounds)
+    if args.database_url.startswith("sqlite:///./"):
+        for suffix in ("", "-wal", "-shm"):
+            path = args.database_url[len("sqlite:///"):] + suffix
+            if os.path.exists(path):
+                os.remove(path)
+
+    sys.exit(asyncio.run(main()))
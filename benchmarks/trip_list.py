@@ -0,0 +1,116 @@
+"""Query count and time of listing a user's trips with their members.
+
+Fills a throwaway database with one user in --trips trips of --members members
+each, then for growing page sizes compares:
+
+- lazy loading, reading User.joined_trips and then each trip's members
+- crud.list_user_trips(with members), which loads a page's members with selectinload
+
+The lazy version runs one extra query per trip. The listing runs one query for
+the trips plus one for the members of every 500 trips (selectinload's batch
+size), so two for any page up to 500; tests/test_query_counts.py checks that
+the count stays the same as the number of trips grows.
+
+    python -m benchmarks.trip_list --trips 1000 --members 10
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from sqlalchemy import event
+
+args = None
+
+
+def populate():
+    from app import models
+    from app.database import Base, engine
+
+    Base.metadata.create_all(bind=engine)
+    users = args.trips * (args.members - 1) + 1
+    with engine.begin() as conn:
+        conn.execute(models.User.__table__.insert(), [
+            {"id": uid, "name": f"member{uid}", "email": f"member{uid}@example.com", "hashed_password": "x"}
+            for uid in range(1, users + 1)
+        ])
+        conn.execute(models.Trip.__table__.insert(), [
+            {"id": trip_id, "name": f"trip {trip_id}", "creator_id": 1} for trip_id in range(1, args.trips + 1)
+        ])
+        # user 1 is in every trip, the other members are different per trip
+        conn.execute(models.trip_members.insert(), [
+            {"trip_id": trip_id, "user_id": uid}
+            for trip_id in range(1, args.trips + 1)
+            for uid in [1] + list(range(2 + (trip_id - 1) * (args.members - 1), 1 + trip_id * (args.members - 1)))
+        ])
+
+
+class QueryCounter:
+    def __init__(self, *engines):
+        self.count = 0
+        for engine in engines:
+            event.listen(getattr(engine, "sync_engine", engine), "before_cursor_execute", self._count)
+
+    def _count(self, *_):
+        self.count += 1
+
+
+def lazy_loading(db, page_size: int):
+    from app import models
+
+    user = db.get(models.User, 1)
+    # newest first, the order list_user_trips uses for trips without expenses
+    trips = sorted(user.joined_trips, key=lambda trip: trip.id, reverse=True)[:page_size]
+    return {trip.id: [member.id for member in trip.members] for trip in trips}
+
+
+async def with_selectinload(db, page_size: int):
+    from app import crud
+
+    trips, _ = await crud.list_user_trips(db, 1, limit=page_size, embed_members=True)
+    return {trip.id: [member.id for member in trip.members] for trip in trips}
+
+
+async def main():
+    from app.database import AsyncSessionLocal, SessionLocal, async_engine, engine
+
+    populate()
+    counter = QueryCounter(engine, async_engine)
+    print(f"{'page size':>9} {'lazy queries':>13} {'lazy ms':>9} {'selectin queries':>17} {'selectin ms':>12}")
+    for page_size in (10, 100, args.trips):
+        with SessionLocal() as db:
+            counter.count = 0
+            start = time.perf_counter()
+            lazy = lazy_loading(db, page_size)
+            lazy_ms, lazy_queries = (time.perf_counter() - start) * 1000, counter.count
+
+        async with AsyncSessionLocal() as db:
+            counter.count = 0
+            start = time.perf_counter()
+            loaded = await with_selectinload(db, page_size)
+            loaded_ms, loaded_queries = (time.perf_counter() - start) * 1000, counter.count
+
+        assert {trip_id: sorted(ids) for trip_id, ids in lazy.items()} == {
+            trip_id: sorted(ids) for trip_id, ids in loaded.items()
+        }
+        print(f"{page_size:>9} {lazy_queries:>13} {lazy_ms:>9.1f} {loaded_queries:>17} {loaded_ms:>12.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Trip listing with members: lazy loading vs selectinload")
+    parser.add_argument("--database-url", default="sqlite:///./bench_trip_list.db")
+    parser.add_argument("--trips", type=int, default=1000)
+    parser.add_argument("--members", type=int, default=10)
+    args = parser.parse_args()
+
+    # point the app at the benchmark database before it is imported
+    os.environ["DATABASE_URL"] = args.database_url
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+    os.environ.setdefault("ALGORITHM", "HS256")
+    if args.database_url.startswith("sqlite:///./"):
+        for suffix in ("", "-wal", "-shm"):
+            path = args.database_url[len("sqlite:///"):] + suffix
+            if os.path.exists(path):
+                os.remove(path)
+
+    asyncio.run(main())
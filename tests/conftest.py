@@ -0,0 +1,59 @@
+"""The app runs against a throwaway SQLite file, emptied before every test."""
+import os
+import tempfile
+
+# settings are read when app.config is first imported, so the environment comes first
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{tempfile.mkdtemp(prefix='splitwise-tests-')}/test.db",
+    "SECRET_KEY": "test",
+    "ALGORITHM": "HS256",
+    "BCRYPT_ROUNDS": "4",
+})
+os.environ.pop("REPLICA_DATABASE_URL", None)
+
+import pytest  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+from app.database import Base, SessionLocal, engine  # noqa: E402
+from app.main import app  # noqa: E402
+from app.services.cache import caches  # noqa: E402
+
+
+def reset_database():
+    """Delete every row and forget cached users and settlements, which are keyed by ids that now repeat."""
+    with engine.begin() as conn:
+        for table in reversed(Base.metadata.sorted_tables):
+            conn.execute(table.delete())
+    for cache in caches.values():
+        cache.clear()
+
+
+@pytest.fixture
+def db():
+    reset_database()
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def client():
+    reset_database()
+    # not entered as a context manager: its shutdown would stop the password hashing pool after every test
+    return TestClient(app)
+
+
+@pytest.fixture
+def signup(client):
+    """signup(name) registers and logs in a user, returning their id and Authorization header."""
+
+    def register(name: str):
+        response = client.post("/users/signup", json={"name": name, "email": f"{name}@example.com", "password": "pw"})
+        assert response.status_code == 200, response.text
+        token = client.post("/users/login", data={"username": f"{name}@example.com", "password": "pw"})
+        assert token.status_code == 200, token.text
+        return response.json()["id"], {"Authorization": f"Bearer {token.json()['access_token']}"}
+
+    return register
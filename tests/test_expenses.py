@@ -0,0 +1,60 @@
+"""Updating and bulk importing expenses."""
+from datetime import date
+from decimal import Decimal
+
+from app import models
+
+
+def test_update_amount_only_rescales_an_itemized_split(client, signup):
+    owner_id, headers = signup("owner")
+    member_id, _ = signup("member")
+    trip_id = client.post("/trips/", json={"name": "trip"}, headers=headers).json()["id"]
+    for user_id in (owner_id, member_id):
+        client.post(f"/trips/{trip_id}/add-member/{user_id}", headers=headers)
+    expense = client.post("/expenses/", json={
+        "trip_id": trip_id, "title": "dinner", "amount": 3000, "payer_id": owner_id, "split_type": "shares",
+        "splits": [{"user_id": owner_id, "value": 1}, {"user_id": member_id, "value": 2}],
+    }, headers=headers).json()
+
+    response = client.put(f"/expenses/{expense['id']}", json={"amount": 6000}, headers=headers)
+
+    assert response.status_code == 200, response.text
+    updated = response.json()
+    assert (updated["title"], updated["amount"], updated["payer_id"]) == ("dinner", 6000, owner_id)
+    assert {split["user_id"]: split["amount"] for split in updated["splits"]} == {owner_id: 2000, member_id: 4000}
+
+
+def test_update_with_null_title_keeps_it(client, signup):
+    owner_id, headers = signup("owner")
+    trip_id = client.post("/trips/", json={"name": "trip"}, headers=headers).json()["id"]
+    client.post(f"/trips/{trip_id}/add-member/{owner_id}", headers=headers)
+    expense = client.post("/expenses/", json={
+        "trip_id": trip_id, "title": "taxi", "amount": 1200, "payer_id": owner_id
+    }, headers=headers).json()
+
+    response = client.put(f"/expenses/{expense['id']}", json={"title": None, "note": "airport"}, headers=headers)
+
+    assert response.status_code == 200, response.text
+    assert (response.json()["title"], response.json()["amount"]) == ("taxi", 1200)
+
+
+def test_bulk_import_reports_rows_without_an_exchange_rate(client, signup, db):
+    owner_id, headers = signup("owner")
+    trip_id = client.post("/trips/", json={"name": "trip"}, headers=headers).json()["id"]
+    client.post(f"/trips/{trip_id}/add-member/{owner_id}", headers=headers)
+    # USD against the EUR reference, nothing for GBP
+    db.add(models.ExchangeRate(currency="USD", date=date(2000, 1, 1), rate=Decimal("1.25")))
+    db.commit()
+
+    response = client.post(f"/trips/{trip_id}/expenses/bulk", json=[
+        {"title": "hotel", "amount": 10000, "payer_id": owner_id},
+        {"title": "train", "amount": 2000, "payer_id": owner_id, "currency": "EUR"},
+        {"title": "pub", "amount": 3000, "payer_id": owner_id, "currency": "GBP"},
+    ], headers=headers)
+
+    assert response.status_code == 201, response.text
+    result = response.json()
+    assert result["inserted"] == 2
+    assert [error["row"] for error in result["errors"]] == [3]
+    assert "No exchange rate for GBP" in result["errors"][0]["error"]
+    assert client.get(f"/trips/{trip_id}/summary", headers=headers).json()["total_expenses"] == 12500
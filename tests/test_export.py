@@ -0,0 +1,44 @@
+"""The CSV export is gzip-compressed only when Accept-Encoding allows it."""
+import gzip
+
+import pytest
+
+from app.services.export import accepts_gzip
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("gzip", True),
+    ("gzip, deflate, br", True),
+    ("br;q=1.0, gzip;q=0.5", True),
+    ("GZIP", True),
+    ("*", True),
+    ("", False),
+    ("identity", False),
+    ("deflate, br", False),
+    ("gzip;q=0", False),
+    ("gzip; q=0.000", False),
+    ("gzip;q=0, *", False),
+    ("*;q=0", False),
+    ("gzip;q=nonsense", False),
+    ("x-gzip", True),
+])
+def test_accepts_gzip(header, expected):
+    assert accepts_gzip(header) is expected
+
+
+def test_export_honours_gzip_q_zero(client, signup):
+    owner_id, headers = signup("owner")
+    trip_id = client.post("/trips/", json={"name": "trip"}, headers=headers).json()["id"]
+    client.post(f"/trips/{trip_id}/add-member/{owner_id}", headers=headers)
+    client.post("/expenses/", json={"trip_id": trip_id, "title": "taxi", "amount": 1200, "payer_id": owner_id},
+                headers=headers)
+    url = f"/expenses/trips/{trip_id}/expenses/breakdown/export?mode=ledger"
+
+    refused = client.get(url, headers={**headers, "Accept-Encoding": "gzip;q=0, identity"})
+    with client.stream("GET", url, headers={**headers, "Accept-Encoding": "gzip"}) as accepted:
+        compressed = b"".join(accepted.iter_raw())
+
+    assert "content-encoding" not in refused.headers
+    assert "taxi" in refused.text
+    assert accepted.headers["content-encoding"] == "gzip"
+    assert gzip.decompress(compressed) == refused.content
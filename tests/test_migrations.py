@@ -0,0 +1,50 @@
+"""Migrations upgrade a database the baseline app wrote to."""
+import os
+import tempfile
+
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+
+from app.services import analytics, currency, ledger
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def alembic_config(url: str) -> Config:
+    # no ini file, so logging is left alone
+    config = Config()
+    config.set_main_option("script_location", os.path.join(ROOT, "alembic"))
+    config.set_main_option("sqlalchemy.url", url)
+    return config
+
+
+def test_upgrade_fills_in_missing_created_at():
+    url = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'legacy.db')}"
+    config = alembic_config(url)
+    command.upgrade(config, "1d510252c84a")
+    engine = create_engine(url)
+    with engine.begin() as conn:
+        # the baseline app left created_at NULL: its tables had no server default
+        conn.execute(text("INSERT INTO users (id, name) VALUES (1, 'a'), (2, 'b')"))
+        conn.execute(text("INSERT INTO trips (id, name, creator_id) VALUES (1, 'trip', 1)"))
+        conn.execute(text("INSERT INTO trip_members (trip_id, user_id) VALUES (1, 1), (1, 2)"))
+        conn.execute(text(
+            "INSERT INTO expenses (trip_id, title, amount, payer_id, created_at) VALUES "
+            "(1, 'dated', 10.01, 1, '2025-01-01 10:00:00'), (1, 'legacy', 3.3, 2, NULL)"
+        ))
+
+    command.upgrade(config, "head")
+
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT COUNT(*) FROM trips WHERE created_at IS NULL")).scalar() == 0
+        assert conn.execute(text("SELECT COUNT(*) FROM expenses WHERE created_at IS NULL")).scalar() == 0
+        assert conn.execute(text("SELECT SUM(expense_count) FROM daily_spending")).scalar() == 2
+    with Session(engine) as db:
+        # reads created_at.date() of every expense
+        currency.reconvert_trip(db, 1)
+        db.commit()
+        assert ledger.verify_trip(db, 1) == []
+        assert analytics.verify(db) == []
+    engine.dispose()
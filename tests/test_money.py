@@ -0,0 +1,162 @@
+"""Money is whole minor units: splits never lose or invent a cent, and trip balances always net to zero."""
+from decimal import Decimal
+
+from hypothesis import given, settings
+from hypothesis import strategies as st
+
+from app import models, schemas
+from app.database import SessionLocal
+from app.services import ledger, splits
+from tests.conftest import reset_database
+
+amounts = st.integers(min_value=0, max_value=10**9)
+user_ids = st.lists(st.integers(min_value=1, max_value=10_000), min_size=1, max_size=30, unique=True)
+
+
+@given(st.integers(min_value=-10**9, max_value=10**9), user_ids)
+def test_split_equally_gives_leftover_cents_to_lowest_ids(total, ids):
+    shares = ledger.split_equally(total, ids)
+
+    assert sum(shares.values()) == total
+    base, remainder = divmod(total, len(ids))
+    assert [shares[uid] for uid in sorted(ids)] == [base + 1] * remainder + [base] * (len(ids) - remainder)
+
+
+@given(amounts, st.dictionaries(
+    st.integers(min_value=1, max_value=1000),
+    st.decimals(min_value=0, max_value=1000, places=2),
+    min_size=1, max_size=20,
+))
+def test_allocate_adds_up_and_stays_within_a_cent(amount, weights):
+    cents = splits.allocate(amount, weights)
+
+    assert sum(cents.values()) == amount
+    assert set(cents) == set(weights)
+    total = sum(weights.values())
+    if total:
+        for uid, weight in weights.items():
+            exact = Decimal(amount) * weight / total
+            assert exact - 1 < cents[uid] < exact + 1
+
+
+@given(amounts, st.lists(st.integers(min_value=0, max_value=100), min_size=1, max_size=10))
+def test_percent_split_adds_up(amount, cuts):
+    # cut 0..100 into consecutive parts, so the percentages add up to exactly 100
+    bounds = [0] + sorted(cuts) + [100]
+    entries = [
+        schemas.SplitEntry(user_id=uid, value=high - low)
+        for uid, (low, high) in enumerate(zip(bounds, bounds[1:]), start=1)
+    ]
+
+    cents = splits.resolve_split(amount, schemas.SplitType.percent, entries)
+
+    assert sum(cents.values()) == amount
+
+
+@given(amounts, st.lists(st.integers(min_value=1, max_value=50), min_size=1, max_size=10))
+def test_shares_split_adds_up(amount, weights):
+    entries = [schemas.SplitEntry(user_id=uid, value=weight) for uid, weight in enumerate(weights, start=1)]
+
+    cents = splits.resolve_split(amount, schemas.SplitType.shares, entries)
+
+    assert sum(cents.values()) == amount
+
+
+@given(amounts, st.dictionaries(st.integers(min_value=1, max_value=50), amounts, min_size=1, max_size=10))
+def test_rescale_adds_up(amount, split):
+    assert sum(splits.rescale(amount, split).values()) == amount
+
+
+MEMBERS = 3
+USERS = 8
+
+# an itemized split is weights per member position; None shares the expense equally between all members
+split_weights = st.one_of(st.none(), st.lists(st.integers(min_value=0, max_value=5), min_size=USERS, max_size=USERS))
+operations = st.lists(st.one_of(
+    st.tuples(st.just("add"), st.integers(min_value=0, max_value=USERS - 1), amounts, split_weights),
+    st.tuples(st.just("update"), st.integers(min_value=0), amounts),
+    st.tuples(st.just("delete"), st.integers(min_value=0)),
+    st.tuples(st.just("join")),
+), max_size=25)
+
+
+def _itemize(amount: int, weights, member_ids: list[int]):
+    if weights is None:
+        return None
+    chosen = {uid: Decimal(weight) for uid, weight in zip(member_ids, weights) if weight}
+    return splits.allocate(amount, chosen) if chosen else None
+
+
+def _store_split(db, expense: models.Expense, split):
+    db.query(models.ExpenseSplit).filter(models.ExpenseSplit.expense_id == expense.id).delete()
+    for uid, cents in (split or {}).items():
+        db.add(models.ExpenseSplit(
+            expense_id=expense.id, user_id=uid, trip_id=expense.trip_id, amount=cents, base_amount=cents
+        ))
+
+
+def _negated(split):
+    return {uid: -cents for uid, cents in split.items()} if split else split
+
+
+def _new_trip(db) -> int:
+    db.add_all(models.User(id=uid, name=f"user{uid}", email=f"user{uid}@example.com", hashed_password="x")
+               for uid in range(1, USERS + 1))
+    trip = models.Trip(id=1, name="trip", creator_id=1, currency="USD")
+    db.add(trip)
+    db.flush()
+    for uid in range(1, MEMBERS + 1):
+        db.execute(models.trip_members.insert().values(trip_id=trip.id, user_id=uid))
+        ledger.add_member(db, trip.id, uid)
+    db.commit()
+    return trip.id
+
+
+@settings(max_examples=60, deadline=None)
+@given(operations)
+def test_trip_balances_always_net_to_zero(steps):
+    """Random adds, updates, deletes and new members, each its own transaction like the API's."""
+    reset_database()
+    db = SessionLocal()
+    try:
+        trip_id = _new_trip(db)
+        member_ids = list(range(1, MEMBERS + 1))
+        expenses = []  # (expense, split)
+        for step in steps:
+            if step[0] == "add":
+                _, position, amount, weights = step
+                payer_id = member_ids[position % len(member_ids)]
+                split = _itemize(amount, weights, member_ids)
+                expense = models.Expense(
+                    trip_id=trip_id, title="expense", amount=amount, base_amount=amount, payer_id=payer_id
+                )
+                db.add(expense)
+                db.flush()
+                _store_split(db, expense, split)
+                ledger.record_expense(db, trip_id, payer_id, amount, split)
+                expenses.append((expense, split))
+            elif step[0] == "update" and expenses:
+                _, index, amount = step
+                expense, split = expenses[index % len(expenses)]
+                ledger.record_expense(db, trip_id, expense.payer_id, -expense.base_amount, _negated(split), -1)
+                new_split = splits.rescale(amount, split) if split else split
+                expense.amount = expense.base_amount = amount
+                _store_split(db, expense, new_split)
+                ledger.record_expense(db, trip_id, expense.payer_id, amount, new_split)
+                expenses[index % len(expenses)] = (expense, new_split)
+            elif step[0] == "delete" and expenses:
+                expense, split = expenses.pop(step[1] % len(expenses))
+                ledger.record_expense(db, trip_id, expense.payer_id, -expense.base_amount, _negated(split), -1)
+                db.delete(expense)
+            elif step[0] == "join" and len(member_ids) < USERS:
+                member_ids.append(len(member_ids) + 1)
+                db.execute(models.trip_members.insert().values(trip_id=trip_id, user_id=member_ids[-1]))
+                ledger.add_member(db, trip_id, member_ids[-1])
+            db.commit()
+
+            nets = [row.net for row in ledger.get_trip_balances(db, trip_id)]
+            assert len(nets) == len(member_ids)
+            assert sum(nets) == 0
+        assert ledger.verify_trip(db, trip_id) == []
+    finally:
+        db.close()
@@ -0,0 +1,147 @@
+"""SQL statements per request must not grow with the size of a trip."""
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+from app.database import async_engine, engine
+
+
+@contextmanager
+def count_checkouts():
+    """Count connections taken from the API's pool."""
+    checkouts = []
+
+    def record(dbapi_connection, connection_record, connection_proxy):
+        checkouts.append(connection_record)
+
+    event.listen(async_engine.sync_engine.pool, "checkout", record)
+    try:
+        yield checkouts
+    finally:
+        event.remove(async_engine.sync_engine.pool, "checkout", record)
+
+
+@contextmanager
+def count_statements():
+    """Collect every statement sent to the database, by the API (async engine) or anything else."""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    targets = (engine, async_engine.sync_engine)
+    for target in targets:
+        event.listen(target, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        for target in targets:
+            event.remove(target, "before_cursor_execute", record)
+
+
+def make_trip(client, owner, members, expenses: int) -> int:
+    """A trip of owner and members with `expenses` expenses, a few of them itemized."""
+    owner_id, headers = owner
+    trip_id = client.post("/trips/", json={"name": f"trip of {len(members) + 1}"}, headers=headers).json()["id"]
+    for user_id in [owner_id] + [member_id for member_id, _ in members]:
+        assert client.post(f"/trips/{trip_id}/add-member/{user_id}", headers=headers).status_code == 200
+    payers = [owner_id] + [member_id for member_id, _ in members]
+    rows = [{"title": f"expense {n}", "amount": 1000 + n, "payer_id": payers[n % len(payers)]} for n in range(expenses)]
+    assert client.post(f"/trips/{trip_id}/expenses/bulk", json=rows, headers=headers).status_code == 201
+    for n in range(3):
+        response = client.post("/expenses/", json={
+            "trip_id": trip_id, "title": f"itemized {n}", "amount": 999, "payer_id": owner_id, "split_type": "shares",
+            "splits": [{"user_id": user_id, "value": 1 + position} for position, user_id in enumerate(payers)],
+        }, headers=headers)
+        assert response.status_code == 201, response.text
+    return trip_id
+
+
+@pytest.fixture
+def trips(client, signup):
+    """(owner, a trip of 2 with 2 expenses, a trip of 12 with 300 expenses)."""
+    owner = signup("owner")
+    members = [signup(f"member{n}") for n in range(11)]
+    small = make_trip(client, owner, members[:1], 2)
+    big = make_trip(client, owner, members, 300)
+    return owner, small, big
+
+
+ENDPOINTS = [
+    ("settlement", "GET", "/trips/{trip_id}/settlement"),
+    ("summary", "GET", "/trips/{trip_id}/summary"),
+    ("export breakdown", "GET", "/expenses/trips/{trip_id}/expenses/breakdown/export"),
+    ("export ledger", "GET", "/expenses/trips/{trip_id}/expenses/breakdown/export?mode=ledger"),
+]
+
+
+def request_statements(client, method: str, url: str, headers: dict, **kwargs) -> list[str]:
+    with count_statements() as statements:
+        response = client.request(method, url, headers=headers, **kwargs)
+    assert response.status_code < 300, response.text
+    return statements
+
+
+@pytest.mark.parametrize("name, method, path", ENDPOINTS, ids=[name for name, _, _ in ENDPOINTS])
+def test_read_query_count_is_constant(client, trips, name, method, path):
+    (_, headers), small, big = trips
+
+    small_statements = request_statements(client, method, path.format(trip_id=small), headers)
+    big_statements = request_statements(client, method, path.format(trip_id=big), headers)
+
+    assert len(big_statements) == len(small_statements), big_statements
+
+
+@pytest.mark.parametrize("split", [None, "shares"])
+def test_create_expense_query_count_is_constant(client, trips, split):
+    (owner_id, headers), small, big = trips
+
+    def create(trip_id):
+        body = {"trip_id": trip_id, "title": "dinner", "amount": 5000, "payer_id": owner_id}
+        if split:
+            body.update(split_type=split, splits=[{"user_id": owner_id, "value": 1}])
+        return request_statements(client, "POST", "/expenses/", headers, json=body)
+
+    small_statements, big_statements = create(small), create(big)
+
+    assert len(big_statements) == len(small_statements), big_statements
+
+
+def test_trip_list_with_members_query_count_is_constant(client, signup):
+    """Members of a whole page come from one selectinload query, not one per trip."""
+    members = [signup(f"member{n}") for n in range(4)]
+
+    def list_statements(trip_count):
+        _, headers = signup(f"owner{trip_count}")
+        for n in range(trip_count):
+            trip_id = client.post("/trips/", json={"name": f"trip {n}"}, headers=headers).json()["id"]
+            for member_id, _ in members:
+                assert client.post(f"/trips/{trip_id}/add-member/{member_id}", headers=headers).status_code == 200
+        client.get("/trips/", headers=headers)  # the current user is cached from here on
+        statements = request_statements(client, "GET", "/trips/?with_members=true", headers)
+        assert len(client.get("/trips/?with_members=true", headers=headers).json()) == trip_count
+        return statements
+
+    few, many = list_statements(2), list_statements(40)
+
+    assert len(many) == len(few), many
+
+
+READ_ROUTES = [
+    ("search", "/trips/{trip_id}/expenses/search?q=expense"),
+    ("spending", "/trips/{trip_id}/spending?granularity=week"),
+]
+
+
+@pytest.mark.parametrize("name, path", READ_ROUTES, ids=[name for name, _ in READ_ROUTES])
+def test_read_route_uses_one_connection(client, trips, name, path):
+    """Membership is checked on the route's read session, not on a second one from get_db."""
+    (_, headers), _, big = trips
+    client.get(path.format(trip_id=big), headers=headers)  # the current user is cached from here on
+
+    with count_checkouts() as checkouts:
+        response = client.get(path.format(trip_id=big), headers=headers)
+
+    assert response.status_code == 200, response.text
+    assert len(checkouts) == 1
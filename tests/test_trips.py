@@ -0,0 +1,60 @@
+"""Listing trips and adding members."""
+from app.pagination import encode_cursor
+from app.services import events
+
+
+
+def test_name_cursor_keeps_timestamp_like_names_as_text(client, signup):
+    _, headers = signup("owner")
+    for name in ("2024-01-01", "2024-01-01", "b"):
+        client.post("/trips/", json={"name": name}, headers=headers)
+
+    names, url = [], "/trips/?sort=name&limit=1"
+    while url:
+        response = client.get(url, headers=headers)
+        assert response.status_code == 200, response.text
+        names += [trip["name"] for trip in response.json()]
+        cursor = response.headers.get("x-next-cursor")
+        url = cursor and f"/trips/?sort=name&limit=1&cursor={cursor}"
+
+    assert names == ["2024-01-01", "2024-01-01", "b"]
+
+
+def test_cursor_of_another_sort_is_rejected(client, signup):
+    _, headers = signup("owner")
+
+    # a name where sort=created expects a timestamp
+    response = client.get(f"/trips/?sort=created&cursor={encode_cursor('trip', 1)}", headers=headers)
+
+    assert response.status_code == 400
+
+
+def test_my_trips_is_the_trip_list(client, signup):
+    _, headers = signup("owner")
+    for name in ("a", "b", "c"):
+        client.post("/trips/", json={"name": name}, headers=headers)
+
+    for query in ("?sort=name&limit=2", "?sort=name&limit=2&with_members=true"):
+        trips = client.get(f"/trips/{query}", headers=headers)
+        mine = client.get(f"/users/me/trips{query}", headers=headers)
+
+        assert mine.status_code == 200, mine.text
+        assert mine.json() == trips.json()
+        assert mine.headers["x-next-cursor"] == trips.headers["x-next-cursor"]
+        assert mine.headers["link"] == trips.headers["link"]
+
+
+def test_member_added_is_published_once(client, signup, monkeypatch):
+    owner_id, headers = signup("owner")
+    member_id, _ = signup("member")
+    trip_id = client.post("/trips/", json={"name": "trip"}, headers=headers).json()["id"]
+    published = []
+
+    async def publish_change(db, trip_id, event_type, **data):
+        published.append(event_type)
+
+    monkeypatch.setattr(events, "publish_change", publish_change)
+    for _ in range(2):
+        assert client.post(f"/trips/{trip_id}/add-member/{member_id}", headers=headers).status_code == 200
+
+    assert published == ["member.added"]
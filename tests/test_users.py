@@ -0,0 +1,37 @@
+"""The /users/me dashboard works without exchange rates for every trip currency."""
+from datetime import date
+from decimal import Decimal
+
+from app import models
+
+
+def test_balances_and_spending_leave_out_trips_without_a_rate(client, signup, db):
+    owner_id, headers = signup("owner")
+    member_id, _ = signup("member")
+    trips = {}
+    for currency in ("USD", "EUR", "GBP"):
+        trip_id = client.post("/trips/", json={"name": currency, "currency": currency}, headers=headers).json()["id"]
+        for user_id in (owner_id, member_id):
+            client.post(f"/trips/{trip_id}/add-member/{user_id}", headers=headers)
+        response = client.post("/expenses/", json={
+            "trip_id": trip_id, "title": "dinner", "amount": 1000, "payer_id": owner_id
+        }, headers=headers)
+        assert response.status_code == 201, response.text
+        trips[currency] = trip_id
+    # USD against the EUR reference, nothing for GBP
+    db.add(models.ExchangeRate(currency="USD", date=date(2000, 1, 1), rate=Decimal("2")))
+    db.commit()
+
+    balances = client.get("/users/me/balances?by_counterparty=true", headers=headers)
+    spending = client.get("/users/me/spending", headers=headers)
+
+    assert balances.status_code == 200, balances.text
+    result = balances.json()
+    assert len(result["trips"]) == 3
+    # 500 owed in the USD trip, and 500 EUR at 2 USD per EUR
+    assert result["net"] == 1500
+    assert result["unconverted_trip_ids"] == [trips["GBP"]]
+    assert result["counterparties"] == [{"user_id": member_id, "name": "member", "net": 1500}]
+    assert spending.status_code == 200, spending.text
+    assert sum(point["amount"] for point in spending.json()["points"]) == 3000
+    assert spending.json()["unconverted_trip_ids"] == [trips["GBP"]]